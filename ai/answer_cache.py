@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+💬 Answer Cache
+Cache câu trả lời của chat bot theo nội dung tài liệu (scope = hash nội dung PDF):
+- Exact match: LRU theo câu hỏi đã chuẩn hóa (không cần encode)
+- Semantic match: cosine giữa embedding câu hỏi mới và các câu hỏi đã cache (>= ngưỡng)
+- Hết hạn theo TTL, giới hạn số entries (bỏ entry dùng ít gần đây nhất)
+"""
+
+import os
+import re
+import time
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from embedding_store import normalize_rows
+
+ANSWER_CACHE_FILE = os.getenv('ANSWER_CACHE_FILE', 'answer_cache.pkl')
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', '2000'))
+ANSWER_CACHE_TTL = int(os.getenv('ANSWER_CACHE_TTL', str(7 * 24 * 3600)))
+# Cosine tối thiểu để coi 2 câu hỏi là một (MiniLM: ~0.9 là paraphrase gần như chắc chắn)
+ANSWER_CACHE_SIMILARITY = float(os.getenv('ANSWER_CACHE_SIMILARITY', '0.92'))
+
+QUESTION_STRIP_PATTERN = re.compile(r'[^\w\s]')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalize_question(question):
+    """Chuẩn hóa câu hỏi cho exact match: bỏ dấu câu, gộp khoảng trắng, casefold"""
+    text = QUESTION_STRIP_PATTERN.sub(' ', question)
+    return WHITESPACE_PATTERN.sub(' ', text).strip().casefold()
+
+
+def content_scope(content):
+    """Scope cache theo nội dung tài liệu (đổi PDF -> cache cũ không còn dùng)"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class AnswerCache:
+    """LRU exact + semantic lookup cho câu trả lời, tách theo scope"""
+
+    def __init__(self, max_entries=None, ttl_seconds=None, similarity_threshold=None):
+        self.max_entries = max_entries or ANSWER_CACHE_MAX_ENTRIES
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else ANSWER_CACHE_TTL
+        self.similarity_threshold = similarity_threshold or ANSWER_CACHE_SIMILARITY
+        self.lock = threading.Lock()
+        # (scope, câu hỏi chuẩn hóa) -> entry, thứ tự = LRU
+        self.entries = OrderedDict()
+        # scope -> (keys, ma trận embeddings) dựng lại khi scope thay đổi
+        self._scope_matrices = {}
+        self.hits = {'exact': 0, 'semantic': 0}
+        self.misses = 0
+
+    def _expired(self, entry, now):
+        return self.ttl_seconds > 0 and now - entry['created'] > self.ttl_seconds
+
+    def _remove(self, key):
+        self.entries.pop(key, None)
+        self._scope_matrices.pop(key[0], None)
+
+    def _scope_matrix(self, scope):
+        cached = self._scope_matrices.get(scope)
+        if cached is None:
+            keys = [key for key, entry in self.entries.items()
+                    if key[0] == scope and entry['embedding'] is not None]
+            matrix = (np.vstack([self.entries[key]['embedding'] for key in keys])
+                      if keys else np.zeros((0, 0), dtype=np.float32))
+            cached = (keys, matrix)
+            self._scope_matrices[scope] = cached
+        return cached
+
+    def _get(self, key, now):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if self._expired(entry, now):
+            self._remove(key)
+            return None
+        return entry
+
+    def peek(self, scope, question):
+        """Exact match không tính vào thống kê/LRU (vd: lấy phần kiến thức mở rộng của entry)"""
+        with self.lock:
+            return self._get((scope, normalize_question(question)), time.time())
+
+    def get(self, scope, question):
+        """Exact match theo câu hỏi chuẩn hóa (không cần embedding), None nếu miss"""
+        key = (scope, normalize_question(question))
+        with self.lock:
+            entry = self._get(key, time.time())
+            if entry is not None:
+                self.entries.move_to_end(key)
+                entry['hits'] += 1
+                self.hits['exact'] += 1
+            return entry
+
+    def find_similar(self, scope, question, query_embedding):
+        """Semantic match: câu hỏi đã cache có cosine >= ngưỡng, None nếu miss"""
+        key = (scope, normalize_question(question))
+        now = time.time()
+        with self.lock:
+            keys, matrix = self._scope_matrix(scope)
+            if len(keys):
+                query = normalize_rows(query_embedding)[0]
+                scores = matrix @ query
+                for best in np.argsort(-scores):
+                    if scores[best] < self.similarity_threshold:
+                        break
+                    entry = self._get(keys[best], now)
+                    if entry is None:
+                        continue
+                    self.entries.move_to_end(keys[best])
+                    # Alias câu hỏi mới -> entry cũ: lần sau exact match luôn
+                    self.entries[key] = entry
+                    self._evict()
+                    entry['hits'] += 1
+                    self.hits['semantic'] += 1
+                    return entry
+
+            self.misses += 1
+            return None
+
+    def lookup(self, scope, question, query_embedding=None):
+        """Exact match rồi semantic match (nếu có embedding câu hỏi)
+
+        Returns:
+            entry dict (answer, chunks, extended, ...) hoặc None
+        """
+        entry = self.get(scope, question)
+        if entry is not None:
+            return entry
+        if query_embedding is None:
+            with self.lock:
+                self.misses += 1
+            return None
+        return self.find_similar(scope, question, query_embedding)
+
+    def store(self, scope, question, answer, chunks=None, query_embedding=None, extended=None):
+        """Lưu câu trả lời mới, trả về entry"""
+        key = (scope, normalize_question(question))
+        entry = {
+            'question': question,
+            'answer': answer,
+            'chunks': chunks or [],
+            'extended': extended,
+            'embedding': (normalize_rows(query_embedding)[0]
+                          if query_embedding is not None else None),
+            'created': time.time(),
+            'hits': 0
+        }
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            self._scope_matrices.pop(scope, None)
+            self._evict()
+        return entry
+
+    def _evict(self):
+        now = time.time()
+        for key in [key for key, entry in self.entries.items() if self._expired(entry, now)]:
+            self._remove(key)
+        while len(self.entries) > self.max_entries:
+            oldest_key = next(iter(self.entries))
+            self._remove(oldest_key)
+
+    def clear(self, scope=None):
+        with self.lock:
+            if scope is None:
+                self.entries.clear()
+                self._scope_matrices.clear()
+            else:
+                for key in [key for key in self.entries if key[0] == scope]:
+                    self._remove(key)
+
+    def stats(self):
+        with self.lock:
+            total_hits = self.hits['exact'] + self.hits['semantic']
+            lookups = total_hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'scopes': len({key[0] for key in self.entries}),
+                'exact_hits': self.hits['exact'],
+                'semantic_hits': self.hits['semantic'],
+                'misses': self.misses,
+                'hit_rate': round(total_hits / lookups, 3) if lookups else 0.0
+            }
+
+    def save(self, path=None):
+        """Ghi cache xuống disk (atomic replace), bỏ entries đã hết hạn"""
+        path = path or ANSWER_CACHE_FILE
+        with self.lock:
+            self._evict()
+            data = {
+                'entries': list(self.entries.items()),
+                'saved': time.time()
+            }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def load(self, path=None):
+        """Đọc cache từ disk, False nếu chưa có file hoặc file hỏng"""
+        path = path or ANSWER_CACHE_FILE
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path, 'rb') as f:
+                data = pickle.load(f)
+        except Exception as e:
+            print(f"⚠️ Lỗi đọc answer cache: {e}")
+            return False
+        with self.lock:
+            # Alias dùng chung object entry: pickle giữ nguyên việc dùng chung
+            self.entries = OrderedDict(data.get('entries', []))
+            self._scope_matrices.clear()
+            self._evict()
+        return True
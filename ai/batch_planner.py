@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+🗺️ Batch Planner
+Lên kế hoạch nội dung cho các batch tạo câu hỏi dựa trên embeddings:
+- Gom chunks thành các cụm chủ đề (spherical k-means)
+- Chia số batch cho các cụm theo kích thước cụm (largest remainder)
+- Trong 1 cụm, mỗi batch nhận 1 nhóm chunks khác nhau -> mỗi lần gọi LLM là nội dung mới
+- Thứ tự batch xen kẽ giữa các cụm để các batch chạy song song không trùng chủ đề
+"""
+
+import os
+
+import numpy as np
+
+from text_chunker import count_tokens, pack_count, pack_texts, chunk_page_numbers
+from vector_index import spherical_kmeans, assign_clusters, as_float32
+
+# Số vectors mẫu cho mỗi cụm khi train k-means (như IVFIndex)
+PLANNER_SAMPLE_PER_CLUSTER = int(os.getenv('PLANNER_SAMPLE_PER_CLUSTER', '64'))
+
+
+def allocate_batches(cluster_sizes, num_batches):
+    """Chia num_batches cho các cụm tỉ lệ với kích thước, mỗi cụm ít nhất 1 batch (nếu đủ batch)
+
+    Returns:
+        np.ndarray int: số batch của từng cụm, tổng = num_batches
+    """
+    sizes = np.asarray(cluster_sizes, dtype=np.float64)
+    num_clusters = len(sizes)
+    if num_clusters == 0 or num_batches <= 0:
+        return np.zeros(num_clusters, dtype=np.int64)
+
+    if num_batches < num_clusters:
+        # Ít batch hơn số cụm: các cụm lớn nhất được 1 batch
+        allocation = np.zeros(num_clusters, dtype=np.int64)
+        allocation[np.argsort(-sizes, kind='stable')[:num_batches]] = 1
+        return allocation
+
+    # Mỗi cụm 1 batch, phần còn lại chia theo tỉ lệ (largest remainder)
+    remaining = num_batches - num_clusters
+    quotas = sizes / sizes.sum() * remaining
+    allocation = np.floor(quotas).astype(np.int64)
+    leftover = remaining - allocation.sum()
+    allocation[np.argsort(-(quotas - allocation), kind='stable')[:leftover]] += 1
+    return allocation + 1
+
+
+def plan_batch_contents(chunks, embeddings, num_batches, max_tokens, seed=0):
+    """Nội dung cho từng batch, mỗi batch gắn với 1 cụm chủ đề
+
+    Args:
+        chunks: texts (cùng thứ tự với embeddings)
+        embeddings: (n, dim) float32/float16/QuantizedMatrix
+        max_tokens: token budget nội dung của mỗi batch
+
+    Returns:
+        (contents, clusters, pages): nội dung (len = num_batches), id cụm và các trang nguồn
+        của từng batch, hoặc None nếu không đủ dữ liệu để lập kế hoạch
+    """
+    num_chunks = len(chunks)
+    if num_batches <= 0 or num_chunks < 2 or len(embeddings) != num_chunks:
+        return None
+
+    vectors = as_float32(embeddings)
+    avg_tokens = max(1, int(np.mean([count_tokens(chunks[i]) for i in range(0, num_chunks, max(1, num_chunks // 200))])))
+    chunks_per_batch = max(1, max_tokens // avg_tokens)
+
+    # Số cụm: tối đa 1 cụm / batch và mỗi cụm đủ chunks để lấp 1 batch
+    num_clusters = max(1, min(num_batches, num_chunks // chunks_per_batch, num_chunks))
+    rng = np.random.default_rng(seed)
+    sample_size = min(num_chunks, num_clusters * PLANNER_SAMPLE_PER_CLUSTER)
+    sample_ids = np.sort(rng.choice(num_chunks, size=sample_size, replace=False))
+    centroids = spherical_kmeans(vectors[sample_ids], num_clusters, rng)
+    labels = assign_clusters(vectors, centroids)
+
+    # Bỏ cụm rỗng
+    cluster_ids = [cluster for cluster in range(len(centroids)) if np.any(labels == cluster)]
+    members = []
+    for cluster in cluster_ids:
+        ids = np.flatnonzero(labels == cluster)
+        # Chunk gần tâm cụm nhất đứng trước (đại diện cho chủ đề)
+        closeness = vectors[ids] @ centroids[cluster]
+        members.append(ids[np.argsort(-closeness, kind='stable')])
+
+    allocation = allocate_batches([len(ids) for ids in members], num_batches)
+
+    # Các batch của 1 cụm nhận các nhóm chunks rời nhau (round-robin theo độ gần tâm)
+    cluster_batches = []
+    for ids, count in zip(members, allocation):
+        batches = []
+        for batch_index in range(count):
+            # Cụm nhỏ hơn số batch của nó: các batch dư dùng lại 1 chunk của cụm
+            group = ids[batch_index::count] if batch_index < len(ids) else ids[[batch_index % len(ids)]]
+            # Ghép theo thứ tự tài liệu để đọc liền mạch
+            texts = [chunks[i] for i in np.sort(group[:chunks_per_batch * 2])]
+            used = texts[:pack_count(texts, max_tokens)]
+            batches.append((pack_texts(texts, max_tokens), chunk_page_numbers(used)))
+        cluster_batches.append(batches)
+
+    # Xen kẽ các cụm: batch 1 cụm A, batch 1 cụm B, ..., batch 2 cụm A, ...
+    contents, clusters, pages = [], [], []
+    for round_index in range(int(allocation.max(initial=0))):
+        for cluster, batches in zip(cluster_ids, cluster_batches):
+            if round_index < len(batches):
+                content, batch_pages = batches[round_index]
+                contents.append(content)
+                clusters.append(cluster)
+                pages.append(batch_pages)
+    return contents, clusters, pages
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+📏 Benchmark lượng tử hóa embeddings
+So sánh float16 / int8 với baseline float32: recall@k của top-k retrieval,
+dung lượng store trên disk và thời gian score.
+
+Chạy:
+    python benchmark_embeddings.py                 # dữ liệu giả lập (clustered)
+    python benchmark_embeddings.py --real          # embed cache/content/*.txt (cần sentence-transformers)
+    python benchmark_embeddings.py --rows 50000 --queries 200 --top-k 10
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from embedding_store import EmbeddingStore, QUANTIZATION_MODES, normalize_rows, similarity_scores
+
+
+def synthetic_embeddings(rows, dim, num_queries, seed=0):
+    """Embeddings giả lập có cụm (gần phân bố câu thật hơn nhiễu đều)"""
+    rng = np.random.default_rng(seed)
+    num_clusters = max(rows // 50, 1)
+    centers = normalize_rows(rng.standard_normal((num_clusters, dim)))
+    labels = rng.integers(0, num_clusters, size=rows)
+    embeddings = normalize_rows(centers[labels] + 0.15 * rng.standard_normal((rows, dim)))
+    query_rows = rng.integers(0, rows, size=num_queries)
+    queries = normalize_rows(embeddings[query_rows] + 0.2 * rng.standard_normal((num_queries, dim)))
+    return embeddings, queries
+
+
+def real_embeddings(num_queries, seed=0):
+    """Embed các chunk trong cache/content bằng model thật"""
+    from genQ_simple_fix import split_text_into_chunks
+    from model_registry import encode_texts
+
+    chunks = []
+    for content_file in sorted(Path("cache/content").glob("*.txt")):
+        chunks.extend(split_text_into_chunks(content_file.read_text(encoding='utf-8'), max_tokens=80))
+    if not chunks:
+        raise RuntimeError("Không có file nào trong cache/content")
+
+    rng = np.random.default_rng(seed)
+    embeddings = encode_texts(chunks)
+    # Query = 1 câu ngắn lấy từ giữa chunk ngẫu nhiên
+    queries = encode_texts([chunks[i][100:220] for i in rng.integers(0, len(chunks), size=num_queries)])
+    return embeddings, queries
+
+
+def top_k_indices(scores, k):
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return top
+
+
+def run_benchmark(embeddings, queries, top_k):
+    baseline_top = None
+    baseline_size = None
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        chunks = [f"chunk {i}" for i in range(len(embeddings))]
+        for mode in QUANTIZATION_MODES:
+            store = EmbeddingStore(Path(tmp_dir) / f"bench_{mode}")
+            store.save(embeddings, chunks, quantization=mode)
+            size = store.size_bytes()
+
+            stored, _ = store.load()
+            start = time.perf_counter()
+            scores = similarity_scores(stored, queries)
+            elapsed = time.perf_counter() - start
+            top = top_k_indices(scores, top_k)
+
+            if baseline_top is None:
+                baseline_top, baseline_size = top, size
+                recall = 1.0
+            else:
+                recall = np.mean([
+                    len(set(top[i]) & set(baseline_top[i])) / top.shape[1]
+                    for i in range(len(top))
+                ])
+
+            results.append({
+                'mode': mode,
+                'size_bytes': size,
+                'compression': baseline_size / size,
+                'recall': recall,
+                'score_ms': elapsed * 1000
+            })
+            del stored, scores
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark recall vs dung lượng cho embedding store")
+    parser.add_argument("--real", action="store_true", help="Dùng embeddings thật từ cache/content")
+    parser.add_argument("--rows", type=int, default=20000, help="Số embeddings giả lập")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.real:
+        embeddings, queries = real_embeddings(args.queries)
+        source = "cache/content"
+    else:
+        embeddings, queries = synthetic_embeddings(args.rows, args.dim, args.queries)
+        source = "synthetic"
+
+    print(f"📊 {len(embeddings):,} embeddings x {embeddings.shape[1]} dim ({source}), "
+          f"{len(queries)} queries, recall@{args.top_k} so với float32")
+    print(f"{'mode':<8} {'size':>12} {'x nhỏ hơn':>10} {'recall':>8} {'score ms':>10}")
+    for row in run_benchmark(embeddings, queries, args.top_k):
+        print(f"{row['mode']:<8} {row['size_bytes'] / 1024:>10.1f}KB {row['compression']:>10.2f} "
+              f"{row['recall']:>8.3f} {row['score_ms']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,5 @@
 import os
 import json
-import requests
 from pathlib import Path
 from dotenv import load_dotenv
 import subprocess
@@ -12,16 +11,22 @@ from datetime import datetime
 try:
     from sentence_transformers import SentenceTransformer
     import numpy as np
-    from sklearn.metrics.pairwise import cosine_similarity
     import pickle
 except ImportError:
     print("❌ Thiếu một số thư viện cần thiết. Đang cài đặt...")
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "sentence-transformers", "scikit-learn", "numpy"])
+    subprocess.check_call([sys.executable, "-m", "pip", "install", "sentence-transformers", "numpy"])
     from sentence_transformers import SentenceTransformer
     import numpy as np
-    from sklearn.metrics.pairwise import cosine_similarity
     import pickle
 
+from llm_client import get_llm_client, LLMError
+from embedding_store import EmbeddingStore, get_chunk_embedding_cache
+from model_registry import get_model, encode_texts
+from vector_index import create_index, save_index, load_index
+from text_chunker import iter_chunks, chunk_text, clean_page_text, is_error_text
+from project_corpus import ProjectCorpusRegistry
+from answer_cache import AnswerCache, content_scope
+
 # Load environment variables
 load_dotenv()
 
@@ -34,13 +39,21 @@ class PDFChatRAG:
             sys.exit(1)
         
         # Khởi tạo model embedding
-        print("🔄 Đang tải mô hình embedding...")
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        # Model dùng chung cả process (load 1 lần qua model_registry)
+        self.embedding_model = get_model()
         
         # Biến lưu trữ
         self.chunks = []
         self.embeddings = []
+        self.vector_index = None
         self.pdf_content = ""
+        # Corpus của cả project (server tạo khi xử lý files), None = chỉ chat trên 1 PDF
+        self.project_corpus = None
+        
+        # Cache câu trả lời theo nội dung tài liệu (exact + semantic), lưu qua các phiên chat
+        self.answer_cache = AnswerCache()
+        self.answer_cache.load()
+        self._answer_scope = (None, None)
         
         # THÊM: Quản lý cache và lịch sử
         self.current_pdf_path = None
@@ -60,18 +73,12 @@ class PDFChatRAG:
             pdf_module = importlib.util.module_from_spec(spec)
             spec.loader.exec_module(pdf_module)
             
-            # Chuyển đổi PDF với error handling nâng cao
-            temp_output = f"temp_pdf_content_{hashlib.md5(pdf_path.encode()).hexdigest()[:8]}.txt"
-            
+            # Chuyển đổi PDF với error handling nâng cao (trả về text, không ghi file tạm)
             print("🔧 Sử dụng PDF converter cải tiến...")
-            success = pdf_module.pdf_to_text(pdf_path, temp_output)
+            text_content = pdf_module.pdf_to_text(pdf_path)
             
-            if success and os.path.exists(temp_output):
-                with open(temp_output, 'r', encoding='utf-8') as f:
-                    self.pdf_content = f.read()
-                
-                # Xóa file tạm
-                os.remove(temp_output)
+            if text_content is not None:
+                self.pdf_content = text_content
                 
                 # Kiểm tra chất lượng nội dung
                 if len(self.pdf_content.strip()) == 0:
@@ -101,48 +108,75 @@ class PDFChatRAG:
             print(f"❌ Lỗi: {str(e)}")
             return False
     
-    def create_chunks(self, text, chunk_size=500, overlap=50):
-        """Chia text thành các chunks nhỏ với overlap và làm sạch dữ liệu"""
-        # Làm sạch text trước khi chia chunks
-        cleaned_text = self.clean_text(text)
-        
-        words = cleaned_text.split()
-        chunks = []
+    def ingest_pdf(self, pdf_path, batch_size=32):
+        """Streaming PDF: trang -> làm sạch -> chunks -> embeddings theo batch
         
-        for i in range(0, len(words), chunk_size - overlap):
-            chunk = ' '.join(words[i:i + chunk_size])
+        Chunks được embed ngay khi các trang chứa nó vừa trích xuất xong,
+        không chờ parse hết PDF và không giữ toàn bộ chunks chưa embed trong bộ nhớ
+        """
+        try:
+            print(f"📄 Đang xử lý PDF (streaming): {pdf_path}")
+            
+            # Import và sử dụng pipeline từ pdfToText.py
+            import importlib.util
+            spec = importlib.util.spec_from_file_location("pdfToText", "pdfToText.py")
+            pdf_module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(pdf_module)
+            
+            # Segment từng trang ghi ra file tạm, content chỉ đọc lại 1 lần ở cuối
+            with pdf_module.PageSpool() as spool:
+                texts = pdf_module.iter_clean_pages(spool.track(pdf_module.iter_pdf_pages(pdf_path)))
+                # Chunks theo token, trọn câu, kèm số trang (bỏ chunks lỗi/trang trống)
+                chunk_stream = iter_chunks(texts)
+                
+                chunks = []
+                embedding_batches = []
+                for batch in pdf_module.iter_batches(chunk_stream, batch_size):
+                    chunks.extend(batch)
+                    # Chỉ encode chunks chưa gặp ở tài liệu nào trước đó
+                    embedding_batches.append(get_chunk_embedding_cache().encode(batch, encode_texts))
+                
+                self.pdf_content = spool.content()
+                page_stats = spool.status_counts()
+            
+            if page_stats["failed"] > 0:
+                print(f"⚠️ Có {page_stats['failed']} trang bị lỗi khi trích xuất")
+            if page_stats["empty"] > 0:
+                print(f"ℹ️ Có {page_stats['empty']} trang trống")
+            
+            if not chunks:
+                print("⚠️ Cảnh báo: PDF không chứa text có thể đọc được")
+                return False
             
-            # Chỉ thêm chunk nếu có nội dung hữu ích
-            if len(chunk.strip()) > 50 and not self.is_error_chunk(chunk):
-                chunks.append(chunk.strip())
+            self.chunks = chunks
+            self.embeddings = np.vstack(embedding_batches)
+            self.vector_index = None
+            print(f"✅ Đã tạo embeddings cho {len(self.chunks)} chunks")
+            
+            # Lưu cache với tên file riêng
+            if self.current_pdf_path:
+                self.save_cache()
+            
+            return True
+            
+        except Exception as e:
+            print(f"❌ Lỗi: {str(e)}")
+            return False
+    
+    def create_chunks(self, text, max_tokens=None, overlap_tokens=None):
+        """Chia text thành các chunks theo token (trọn câu, kèm số trang), bỏ chunks lỗi"""
+        chunks = chunk_text(text, max_tokens=max_tokens, overlap_tokens=overlap_tokens)
         
         print(f"📚 Đã tạo {len(chunks)} chunks hữu ích từ tài liệu")
         return chunks
     
     def clean_text(self, text):
         """Làm sạch text và loại bỏ các phần không cần thiết"""
-        import re
-        
-        # Loại bỏ header trang
-        text = re.sub(r'={50}\nTRANG \d+\n={50}', '', text)
-        
-        # Loại bỏ các dòng trống liên tiếp
-        text = re.sub(r'\n\s*\n\s*\n', '\n\n', text)
-        
-        # Loại bỏ khoảng trắng thừa
-        text = re.sub(r' +', ' ', text)
-        
-        return text.strip()
+        return clean_page_text(text)
     
     def is_error_chunk(self, chunk):
         """Kiểm tra xem chunk có phải là lỗi không"""
-        error_indicators = [
-            "[LỖI TRÍCH XUẤT:",
-            "[TRANG TRỐNG HOẶC KHÔNG CÓ TEXT]",
-            "[TRANG", ": KHÔNG THỂ TRÍCH XUẤT TEXT]"
-        ]
-        
-        return any(indicator in chunk for indicator in error_indicators)
+        return is_error_text(chunk)
     
     def create_embeddings(self):
         """Tạo embeddings cho các chunks"""
@@ -156,7 +190,8 @@ class PDFChatRAG:
         self.chunks = self.create_chunks(self.pdf_content)
         
         # Tạo embeddings
-        self.embeddings = self.embedding_model.encode(self.chunks)
+        self.embeddings = get_chunk_embedding_cache().encode(self.chunks, encode_texts)
+        self.vector_index = None
         
         print(f"✅ Đã tạo embeddings cho {len(self.chunks)} chunks")
         
@@ -171,11 +206,13 @@ class PDFChatRAG:
         try:
             cache_filename = self.get_cache_filename(self.current_pdf_path)
             
+            # Embeddings + chunks: file nhị phân cạnh file cache (mmap khi load)
+            self.get_embedding_store(cache_filename).save(self.embeddings, self.chunks)
+            save_index(self.get_vector_index(), self.get_index_prefix(cache_filename))
+            
             cache_data = {
                 'pdf_path': self.current_pdf_path,
                 'pdf_modified_time': os.path.getmtime(self.current_pdf_path),
-                'chunks': self.chunks,
-                'embeddings': self.embeddings.tolist(),
                 'pdf_content': self.pdf_content
             }
             
@@ -211,8 +248,13 @@ class PDFChatRAG:
                     return False
             
             # Tải dữ liệu từ cache
-            self.chunks = cache_data['chunks']
-            self.embeddings = np.array(cache_data['embeddings'])
+            if 'embeddings' in cache_data:
+                # Cache định dạng cũ (embeddings nằm trong pickle)
+                self.chunks = cache_data['chunks']
+                self.embeddings = np.array(cache_data['embeddings'], dtype=np.float32)
+            else:
+                self.embeddings, self.chunks = self.get_embedding_store(cache_filename).load()
+            self.vector_index = load_index(self.get_index_prefix(cache_filename), self.embeddings)
             self.pdf_content = cache_data['pdf_content']
             self.current_pdf_path = pdf_path
             
@@ -223,67 +265,115 @@ class PDFChatRAG:
             print(f"⚠️ Không thể tải cache: {str(e)}")
             return False
     
-    def retrieve_relevant_chunks(self, query, top_k=3):
-        """Tìm kiếm chunks liên quan nhất với câu hỏi"""
-        if not self.chunks:
-            return []
+    def get_vector_index(self):
+        """Vector index trên embeddings hiện tại (dựng lại khi embeddings đổi)"""
+        if self.vector_index is None or len(self.vector_index) != len(self.embeddings):
+            self.vector_index = create_index(self.embeddings)
+        return self.vector_index
+    
+    def use_project(self, project_id, projects_dir="cache/projects"):
+        """Chat trên toàn bộ file của 1 project thay vì 1 PDF"""
+        corpus = ProjectCorpusRegistry(projects_dir).get(project_id)
+        if not corpus.files:
+            print(f"❌ Project {project_id} chưa có file nào trong corpus")
+            return False
+        self.project_corpus = corpus
+        print(f"📚 Chat trên project {project_id} ({len(corpus.files)} files)")
+        return True
+    
+    def retrieve_relevant_chunks_batch(self, queries, top_k=3, query_embeddings=None):
+        """Tìm chunks liên quan cho nhiều câu hỏi cùng lúc
         
-        # Tạo embedding cho query
-        query_embedding = self.embedding_model.encode([query])
+        Args:
+            query_embeddings: embeddings đã tính sẵn của queries (None = tự encode)
         
-        # Tính cosine similarity
-        similarities = cosine_similarity(query_embedding, self.embeddings)[0]
+        Returns:
+            list[list[dict]] cùng thứ tự với queries
+        """
+        queries = list(queries)
+        if not queries:
+            return []
         
-        # Lấy top_k chunks có similarity cao nhất
-        top_indices = np.argsort(similarities)[::-1][:top_k]
+        # Tạo embedding cho tất cả queries trong 1 lần forward (batch)
+        if query_embeddings is None and (self.project_corpus is not None or self.chunks):
+            query_embeddings = encode_texts(queries)
         
-        relevant_chunks = []
-        for idx in top_indices:
-            relevant_chunks.append({
-                'text': self.chunks[idx],
-                'similarity': similarities[idx]
-            })
+        if self.project_corpus is not None:
+            return [
+                [{'text': hit['text'], 'similarity': hit['similarity'], 'pages': hit['pages']} for hit in hits]
+                for hits in self.project_corpus.search(query_embeddings, top_k)
+            ]
         
-        return relevant_chunks
+        if not self.chunks:
+            return [[] for _ in queries]
+        
+        # 1 phép nhân ma trận cho cả batch, top-k từng query qua vector index
+        results = []
+        for top_indices, similarities in self.get_vector_index().search(query_embeddings, top_k):
+            results.append([
+                {
+                    'text': self.chunks[idx],
+                    'similarity': float(similarity),
+                    'pages': getattr(self.chunks[idx], 'pages', None)
+                }
+                for idx, similarity in zip(top_indices, similarities)
+            ])
+        
+        return results
+    
+    def retrieve_relevant_chunks(self, query, top_k=3):
+        """Tìm kiếm chunks liên quan nhất với câu hỏi"""
+        return self.retrieve_relevant_chunks_batch([query], top_k)[0]
     
     def call_openai_api(self, prompt):
-        """Gọi OpenAI API"""
+        """Gọi OpenAI API qua LLM client dùng chung (connection pool + retry)"""
         try:
-            url = "https://api.openai.com/v1/chat/completions"
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.openai_api_key}"
-            }
-            
-            data = {
-                "model": "gpt-3.5-turbo",
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                "max_tokens": 1000,
-                "temperature": 0.7
-            }
-            
-            response = requests.post(url, headers=headers, json=data)
-            result = response.json()
-            
-            if 'choices' in result and len(result['choices']) > 0:
-                return result['choices'][0]['message']['content']
-            else:
-                return "❌ Lỗi: Không nhận được phản hồi từ OpenAI"
-                
+            return get_llm_client().chat(prompt, max_tokens=1000, temperature=0.7)
+        except LLMError as e:
+            return f"❌ Lỗi: {str(e)}"
         except Exception as e:
             return f"❌ Lỗi gọi API: {str(e)}"
     
+    def get_answer_scope(self):
+        """Scope của answer cache: hash nội dung PDF, hoặc project + danh sách file"""
+        if self.project_corpus is not None:
+            file_keys = ",".join(sorted(self.project_corpus.files))
+            return f"project:{self.project_corpus.project_id}:{content_scope(file_keys)}"
+        
+        source, scope = self._answer_scope
+        if source is not self.pdf_content:
+            scope = content_scope(self.pdf_content)
+            self._answer_scope = (self.pdf_content, scope)
+        return scope
+    
     def generate_answer(self, question):
-        """Tạo câu trả lời dựa trên RAG với context từ lịch sử"""
+        """Tạo câu trả lời dựa trên RAG với context từ lịch sử
+        
+        Câu hỏi đã gặp (trùng hoặc gần nghĩa) trên cùng tài liệu được trả lời từ answer cache,
+        không retrieve và không gọi LLM. Key cache không chứa lịch sử trò chuyện nên cache chỉ
+        dùng khi prompt không có lịch sử: câu hỏi nối tiếp (vd: "còn ý thứ hai thì sao?") phụ thuộc
+        các lượt trước, không được trả lại cho cuộc trò chuyện khác.
+        """
+        scope = self.get_answer_scope()
+        use_cache = not self.conversation_history
+        cached = self.answer_cache.get(scope, question) if use_cache else None
+        if cached is not None:
+            print("⚡ Trả lời từ cache (câu hỏi trùng)")
+            return cached['answer'], cached['chunks']
+        
         print(f"🔍 Đang tìm kiếm thông tin liên quan...")
         
+        # 1 lần encode câu hỏi: dùng cho cả semantic cache lookup và retrieval
+        query_embedding = None
+        if self.project_corpus is not None or self.chunks:
+            query_embedding = encode_texts([question])
+            cached = self.answer_cache.find_similar(scope, question, query_embedding) if use_cache else None
+            if cached is not None:
+                print(f"⚡ Trả lời từ cache (gần nghĩa với: \"{cached['question']}\")")
+                return cached['answer'], cached['chunks']
+        
         # Retrieve relevant chunks
-        relevant_chunks = self.retrieve_relevant_chunks(question, top_k=3)
+        relevant_chunks = self.retrieve_relevant_chunks_batch([question], 3, query_embedding)[0]
         
         if not relevant_chunks:
             return "❌ Không tìm thấy thông tin liên quan trong tài liệu", []
@@ -313,10 +403,18 @@ TRẢ LỜI:
         print("🤖 Đang tạo câu trả lời...")
         answer = self.call_openai_api(prompt)
         
+        # Không cache lỗi API và câu trả lời có dùng lịch sử trò chuyện
+        if use_cache and answer and not answer.startswith("❌"):
+            self.answer_cache.store(scope, question, answer, relevant_chunks, query_embedding)
+        
         return answer, relevant_chunks
     
     def generate_extended_knowledge(self, question, answer):
         """Tạo kiến thức mở rộng từ nguồn bên ngoài"""
+        cached = self.answer_cache.peek(self.get_answer_scope(), question)
+        if cached is not None and cached['answer'] == answer and cached.get('extended'):
+            return cached['extended']
+        
         prompt = f"""
 Câu hỏi gốc: {question}
 Câu trả lời từ tài liệu: {answer}
@@ -329,6 +427,9 @@ KIẾN THỨC MỞ RỘNG:
         print("🌐 Đang tạo kiến thức mở rộng...")
         extended_knowledge = self.call_openai_api(prompt)
         
+        if cached is not None and cached['answer'] == answer and not extended_knowledge.startswith("❌"):
+            cached['extended'] = extended_knowledge
+        
         return extended_knowledge
     
     def get_cache_filename(self, pdf_path):
@@ -341,6 +442,14 @@ KIẾN THỨC MỞ RỘNG:
         
         return f"cache_{pdf_name}_{path_hash}.pkl"
     
+    def get_embedding_store(self, cache_filename):
+        """Embedding store đi kèm file cache (cache_x.pkl -> cache_x.npy, ...)"""
+        return EmbeddingStore(Path(cache_filename).with_suffix(""))
+    
+    def get_index_prefix(self, cache_filename):
+        """Prefix file vector index đi kèm file cache"""
+        return str(Path(cache_filename).with_suffix("")) + "_index"
+    
     def add_to_history(self, question, answer, extended_knowledge=None):
         """Thêm câu hỏi và trả lời vào lịch sử"""
         conversation_item = {
@@ -395,6 +504,13 @@ KIẾN THỨC MỞ RỘNG:
             print(f"⚠️ Lỗi tải lịch sử: {str(e)}")
         return False
     
+    def save_answer_cache(self):
+        """Lưu answer cache ra file"""
+        try:
+            self.answer_cache.save()
+        except Exception as e:
+            print(f"⚠️ Lỗi lưu answer cache: {str(e)}")
+    
     def show_conversation_history(self):
         """Hiển thị lịch sử trò chuyện"""
         if not self.conversation_history:
@@ -470,6 +586,7 @@ KIẾN THỨC MỞ RỘNG:
                 if question.lower() in ['quit', 'exit', 'q']:
                     # Lưu lịch sử trước khi thoát
                     self.save_conversation_history()
+                    self.save_answer_cache()
                     print("👋 Tạm biệt!")
                     break
                 
@@ -478,6 +595,8 @@ KIẾN THỨC MỞ RỘNG:
                     print(f"   - Số chunks: {len(self.chunks)}")
                     print(f"   - Độ dài nội dung: {len(self.pdf_content):,} ký tự")
                     print(f"   - Số cuộc trò chuyện: {len(self.conversation_history)}")
+                    cache_stats = self.answer_cache.stats()
+                    print(f"   - Answer cache: {cache_stats['entries']} câu, hit rate {cache_stats['hit_rate']:.0%}")
                     if self.current_pdf_path:
                         print(f"   - File PDF: {Path(self.current_pdf_path).name}")
                         
@@ -519,7 +638,8 @@ KIẾN THỨC MỞ RỘNG:
                 # Hiển thị thông tin chunks được sử dụng
                 print(f"\n📚 Đã sử dụng {len(relevant_chunks)} phần thông tin liên quan")
                 for i, chunk in enumerate(relevant_chunks, 1):
-                    print(f"   {i}. Độ liên quan: {chunk['similarity']:.2f}")
+                    page_info = f" (trang {chunk['pages']})" if chunk.get('pages') else ""
+                    print(f"   {i}. Độ liên quan: {chunk['similarity']:.2f}{page_info}")
                 
                 # Tạo kiến thức mở rộng
                 extended = self.generate_extended_knowledge(question, answer)
@@ -535,9 +655,11 @@ KIẾN THỨC MỞ RỘNG:
                 # Auto-save sau mỗi 3 câu hỏi
                 if len(self.conversation_history) % 3 == 0:
                     self.save_conversation_history()
+                    self.save_answer_cache()
                 
             except KeyboardInterrupt:
                 self.save_conversation_history()
+                self.save_answer_cache()
                 print("\n👋 Tạm biệt!")
                 break
             except Exception as e:
@@ -547,6 +669,12 @@ def main():
     """Hàm chính với cache management cải tiến"""
     rag_system = PDFChatRAG()
     
+    # CHAT_PROJECT_ID: chat trên corpus của project (các file đã qua server)
+    project_id = os.getenv('CHAT_PROJECT_ID')
+    if project_id and rag_system.use_project(project_id):
+        rag_system.chat()
+        return
+    
     # Hiển thị cache có sẵn
     available_caches = rag_system.list_cache_files()
     
@@ -592,12 +720,9 @@ def main():
     
     # Nếu không có cache, xử lý PDF mới
     print("🔄 Đang xử lý PDF mới...")
-    if rag_system.convert_pdf_to_text(pdf_path):
-        if rag_system.create_embeddings():
-            print("🎉 Hệ thống đã sẵn sàng!")
-            rag_system.chat()
-        else:
-            print("❌ Lỗi tạo embeddings")
+    if rag_system.ingest_pdf(pdf_path):
+        print("🎉 Hệ thống đã sẵn sàng!")
+        rag_system.chat()
     else:
         print("❌ Lỗi xử lý PDF")
 
@@ -1,6 +1,5 @@
 import os
 import json
-import requests
 from pathlib import Path
 from dotenv import load_dotenv
 import subprocess
@@ -10,16 +9,21 @@ import sys
 try:
     from sentence_transformers import SentenceTransformer
     import numpy as np
-    from sklearn.metrics.pairwise import cosine_similarity
     import pickle
 except ImportError:
     print("❌ Thiếu một số thư viện cần thiết. Đang cài đặt...")
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "sentence-transformers", "scikit-learn", "numpy"])
+    subprocess.check_call([sys.executable, "-m", "pip", "install", "sentence-transformers", "numpy"])
     from sentence_transformers import SentenceTransformer
     import numpy as np
-    from sklearn.metrics.pairwise import cosine_similarity
     import pickle
 
+from llm_client import get_llm_client, LLMError
+from embedding_store import EmbeddingStore, get_chunk_embedding_cache
+from model_registry import get_model, encode_texts
+from vector_index import create_index, save_index, load_index
+from text_chunker import iter_chunks, chunk_text
+from answer_cache import AnswerCache, content_scope
+
 # Load environment variables
 load_dotenv()
 
@@ -32,14 +36,19 @@ class PDFChatRAG:
             sys.exit(1)
         
         # Khởi tạo model embedding
-        print("🔄 Đang tải mô hình embedding...")
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        # Model dùng chung cả process (load 1 lần qua model_registry)
+        self.embedding_model = get_model()
         
         # Biến lưu trữ
         self.chunks = []
         self.embeddings = []
+        self.vector_index = None
         self.pdf_content = ""
         
+        # Cache câu trả lời theo nội dung tài liệu (exact + semantic)
+        self.answer_cache = AnswerCache()
+        self.answer_cache.load()
+        
         print("✅ Hệ thống RAG đã sẵn sàng!")
     
     def convert_pdf_to_text(self, pdf_path):
@@ -53,15 +62,11 @@ class PDFChatRAG:
             pdf_module = importlib.util.module_from_spec(spec)
             spec.loader.exec_module(pdf_module)
             
-            # Chuyển đổi PDF
-            success = pdf_module.pdf_to_text(pdf_path, "temp_pdf_content.txt")
+            # Chuyển đổi PDF (trả về text, không ghi file tạm)
+            text_content = pdf_module.pdf_to_text(pdf_path)
             
-            if success and os.path.exists("temp_pdf_content.txt"):
-                with open("temp_pdf_content.txt", 'r', encoding='utf-8') as f:
-                    self.pdf_content = f.read()
-                
-                # Xóa file tạm
-                os.remove("temp_pdf_content.txt")
+            if text_content is not None:
+                self.pdf_content = text_content
                 print("✅ Chuyển đổi PDF thành công!")
                 return True
             else:
@@ -72,15 +77,48 @@ class PDFChatRAG:
             print(f"❌ Lỗi: {str(e)}")
             return False
     
-    def create_chunks(self, text, chunk_size=500, overlap=50):
-        """Chia text thành các chunks nhỏ với overlap"""
-        words = text.split()
-        chunks = []
-        
-        for i in range(0, len(words), chunk_size - overlap):
-            chunk = ' '.join(words[i:i + chunk_size])
-            if len(chunk.strip()) > 0:
-                chunks.append(chunk.strip())
+    def ingest_pdf(self, pdf_path, batch_size=32):
+        """Streaming PDF: trang -> chunks -> embeddings theo batch (không chờ parse hết PDF)"""
+        try:
+            print(f"📄 Đang xử lý PDF (streaming): {pdf_path}")
+            
+            # Import và sử dụng pipeline từ pdfToText.py
+            import importlib.util
+            spec = importlib.util.spec_from_file_location("pdfToText", "pdfToText.py")
+            pdf_module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(pdf_module)
+            
+            # Segment từng trang ghi ra file tạm, content chỉ đọc lại 1 lần ở cuối
+            with pdf_module.PageSpool() as spool:
+                texts = pdf_module.iter_clean_pages(spool.track(pdf_module.iter_pdf_pages(pdf_path)))
+                chunks = []
+                embedding_batches = []
+                for batch in pdf_module.iter_batches(iter_chunks(texts), batch_size):
+                    chunks.extend(batch)
+                    # Chỉ encode chunks chưa gặp ở tài liệu nào trước đó
+                    embedding_batches.append(get_chunk_embedding_cache().encode(batch, encode_texts))
+                
+                self.pdf_content = spool.content()
+            if not chunks:
+                print("❌ PDF không có nội dung để xử lý")
+                return False
+            
+            self.chunks = chunks
+            self.embeddings = np.vstack(embedding_batches)
+            self.vector_index = None
+            print(f"📚 Đã tạo {len(chunks)} chunks từ tài liệu")
+            print(f"✅ Đã tạo embeddings cho {len(self.chunks)} chunks")
+            
+            self.save_cache()
+            return True
+            
+        except Exception as e:
+            print(f"❌ Lỗi: {str(e)}")
+            return False
+    
+    def create_chunks(self, text, max_tokens=None, overlap_tokens=None):
+        """Chia text thành các chunks theo token (trọn câu, kèm số trang)"""
+        chunks = chunk_text(text, max_tokens=max_tokens, overlap_tokens=overlap_tokens)
         
         print(f"📚 Đã tạo {len(chunks)} chunks từ tài liệu")
         return chunks
@@ -97,21 +135,24 @@ class PDFChatRAG:
         self.chunks = self.create_chunks(self.pdf_content)
         
         # Tạo embeddings
-        self.embeddings = self.embedding_model.encode(self.chunks)
+        self.embeddings = get_chunk_embedding_cache().encode(self.chunks, encode_texts)
+        self.vector_index = None
         
         print(f"✅ Đã tạo embeddings cho {len(self.chunks)} chunks")
         
-        # Lưu cache
+        self.save_cache()
+        return True
+    
+    def save_cache(self):
+        """Lưu embeddings + chunks (rag_cache.npy, mmap khi load) và nội dung vào rag_cache.pkl"""
+        EmbeddingStore('rag_cache').save(self.embeddings, self.chunks)
+        save_index(self.get_vector_index(), 'rag_cache_index')
         cache_data = {
-            'chunks': self.chunks,
-            'embeddings': self.embeddings.tolist(),
             'pdf_content': self.pdf_content
         }
         
         with open('rag_cache.pkl', 'wb') as f:
             pickle.dump(cache_data, f)
-        
-        return True
     
     def load_cache(self):
         """Tải cache nếu có"""
@@ -120,8 +161,13 @@ class PDFChatRAG:
                 with open('rag_cache.pkl', 'rb') as f:
                     cache_data = pickle.load(f)
                 
-                self.chunks = cache_data['chunks']
-                self.embeddings = np.array(cache_data['embeddings'])
+                if 'embeddings' in cache_data:
+                    # Cache định dạng cũ (embeddings nằm trong pickle)
+                    self.chunks = cache_data['chunks']
+                    self.embeddings = np.array(cache_data['embeddings'], dtype=np.float32)
+                else:
+                    self.embeddings, self.chunks = EmbeddingStore('rag_cache').load()
+                self.vector_index = load_index('rag_cache_index', self.embeddings)
                 self.pdf_content = cache_data['pdf_content']
                 
                 print("✅ Đã tải cache thành công!")
@@ -131,70 +177,71 @@ class PDFChatRAG:
         
         return False
     
-    def retrieve_relevant_chunks(self, query, top_k=3):
-        """Tìm kiếm chunks liên quan nhất với câu hỏi"""
-        if not self.chunks:
-            return []
+    def get_vector_index(self):
+        """Vector index trên embeddings hiện tại (dựng lại khi embeddings đổi)"""
+        if self.vector_index is None or len(self.vector_index) != len(self.embeddings):
+            self.vector_index = create_index(self.embeddings)
+        return self.vector_index
+    
+    def retrieve_relevant_chunks_batch(self, queries, top_k=3, query_embeddings=None):
+        """Tìm chunks liên quan cho nhiều câu hỏi cùng lúc
         
-        # Tạo embedding cho query
-        query_embedding = self.embedding_model.encode([query])
+        Args:
+            query_embeddings: embeddings đã tính sẵn của queries (None = tự encode)
         
-        # Tính cosine similarity
-        similarities = cosine_similarity(query_embedding, self.embeddings)[0]
+        Returns:
+            list[list[dict]] cùng thứ tự với queries
+        """
+        queries = list(queries)
+        if not self.chunks or not queries:
+            return [[] for _ in queries]
         
-        # Lấy top_k chunks có similarity cao nhất
-        top_indices = np.argsort(similarities)[::-1][:top_k]
+        # Tạo embedding cho tất cả queries trong 1 lần forward (batch)
+        if query_embeddings is None:
+            query_embeddings = encode_texts(queries)
         
-        relevant_chunks = []
-        for idx in top_indices:
-            relevant_chunks.append({
-                'text': self.chunks[idx],
-                'similarity': similarities[idx]
-            })
+        # 1 phép nhân ma trận cho cả batch, top-k từng query qua vector index
+        results = []
+        for top_indices, similarities in self.get_vector_index().search(query_embeddings, top_k):
+            results.append([
+                {'text': self.chunks[idx], 'similarity': float(similarity)}
+                for idx, similarity in zip(top_indices, similarities)
+            ])
         
-        return relevant_chunks
+        return results
+    
+    def retrieve_relevant_chunks(self, query, top_k=3):
+        """Tìm kiếm chunks liên quan nhất với câu hỏi"""
+        return self.retrieve_relevant_chunks_batch([query], top_k)[0]
     
     def call_openai_api(self, prompt):
-        """Gọi OpenAI API"""
+        """Gọi OpenAI API qua LLM client dùng chung (connection pool + retry)"""
         try:
-            url = "https://api.openai.com/v1/chat/completions"
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.openai_api_key}"
-            }
-            
-            data = {
-                "model": "gpt-3.5-turbo",
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                "max_tokens": 1000,
-                "temperature": 0.7
-            }
-            
-            response = requests.post(url, headers=headers, json=data)
-            result = response.json()
-            
-            if 'choices' in result and len(result['choices']) > 0:
-                return result['choices'][0]['message']['content']
-            else:
-                return "❌ Lỗi: Không nhận được phản hồi từ OpenAI"
-                
+            return get_llm_client().chat(prompt, max_tokens=1000, temperature=0.7)
+        except LLMError as e:
+            return f"❌ Lỗi: {str(e)}"
         except Exception as e:
             return f"❌ Lỗi gọi API: {str(e)}"
     
     def generate_answer(self, question):
-        """Tạo câu trả lời dựa trên RAG"""
+        """Tạo câu trả lời dựa trên RAG (câu hỏi trùng/gần nghĩa lấy từ answer cache)"""
+        scope = content_scope(self.pdf_content)
+        cached = self.answer_cache.get(scope, question)
+        query_embedding = None
+        if cached is None and self.chunks:
+            query_embedding = encode_texts([question])
+            cached = self.answer_cache.find_similar(scope, question, query_embedding)
+        if cached is not None:
+            print("⚡ Trả lời từ cache")
+            return cached['answer'], cached['chunks']
+        
         print(f"🔍 Đang tìm kiếm thông tin liên quan...")
         
         # Retrieve relevant chunks
-        relevant_chunks = self.retrieve_relevant_chunks(question, top_k=3)
+        relevant_chunks = self.retrieve_relevant_chunks_batch([question], 3, query_embedding)[0]
         
         if not relevant_chunks:
-            return "❌ Không tìm thấy thông tin liên quan trong tài liệu"
+            return "❌ Không tìm thấy thông tin liên quan trong tài liệu", []
         
         # Tạo context từ relevant chunks
         context = "\n\n".join([chunk['text'] for chunk in relevant_chunks])
@@ -216,10 +263,18 @@ TRẢ LỜI:
         print("🤖 Đang tạo câu trả lời...")
         answer = self.call_openai_api(prompt)
         
+        # Không cache lỗi API
+        if answer and not answer.startswith("❌"):
+            self.answer_cache.store(scope, question, answer, relevant_chunks, query_embedding)
+        
         return answer, relevant_chunks
     
     def generate_extended_knowledge(self, question, answer):
         """Tạo kiến thức mở rộng từ nguồn bên ngoài"""
+        cached = self.answer_cache.peek(content_scope(self.pdf_content), question)
+        if cached is not None and cached['answer'] == answer and cached.get('extended'):
+            return cached['extended']
+        
         prompt = f"""
 Câu hỏi gốc: {question}
 Câu trả lời từ tài liệu: {answer}
@@ -232,6 +287,9 @@ KIẾN THỨC MỞ RỘNG:
         print("🌐 Đang tạo kiến thức mở rộng...")
         extended_knowledge = self.call_openai_api(prompt)
         
+        if cached is not None and cached['answer'] == answer and not extended_knowledge.startswith("❌"):
+            cached['extended'] = extended_knowledge
+        
         return extended_knowledge
     
     def chat(self):
@@ -248,6 +306,7 @@ KIẾN THỨC MỞ RỘNG:
                 question = input("\n❓ Câu hỏi của bạn: ").strip()
                 
                 if question.lower() in ['quit', 'exit', 'q']:
+                    self.answer_cache.save()
                     print("👋 Tạm biệt!")
                     break
                 
@@ -284,6 +343,7 @@ KIẾN THỨC MỞ RỘNG:
                 print(extended)
                 
             except KeyboardInterrupt:
+                self.answer_cache.save()
                 print("\n👋 Tạm biệt!")
                 break
             except Exception as e:
@@ -328,12 +388,9 @@ def main():
         return
     
     # Xử lý PDF
-    if rag_system.convert_pdf_to_text(pdf_path):
-        if rag_system.create_embeddings():
-            print("🎉 Hệ thống đã sẵn sàng!")
-            rag_system.chat()
-        else:
-            print("❌ Lỗi tạo embeddings")
+    if rag_system.ingest_pdf(pdf_path):
+        print("🎉 Hệ thống đã sẵn sàng!")
+        rag_system.chat()
     else:
         print("❌ Lỗi xử lý PDF")
 
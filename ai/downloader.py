@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+📥 Async Streaming Downloader
+Download file (S3/web) không block event loop:
+- Chạy trên 1 event loop nền với connection pool httpx dùng chung
+- Ghi disk theo chunk lớn qua thread (không giữ loop khi flush)
+- Giới hạn dung lượng, tự resume bằng HTTP Range khi kết nối bị ngắt
+- Tính SHA-256 trong lúc stream
+- Validate bản đã tải bằng conditional GET 1 byte (presigned S3 URL chỉ ký cho GET, HEAD bị 403)
+"""
+
+import os
+import asyncio
+import hashlib
+import logging
+import threading
+
+from dotenv import load_dotenv
+
+try:
+    import httpx
+    HAS_HTTPX = True
+except ImportError:
+    import requests
+    HAS_HTTPX = False
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+MAX_DOWNLOAD_BYTES = int(os.getenv('MAX_DOWNLOAD_MB', '50')) * 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = int(os.getenv('DOWNLOAD_CHUNK_KB', '1024')) * 1024
+DOWNLOAD_MAX_CONNECTIONS = int(os.getenv('DOWNLOAD_MAX_CONNECTIONS', '16'))
+DOWNLOAD_MAX_RETRIES = int(os.getenv('DOWNLOAD_MAX_RETRIES', '3'))
+DOWNLOAD_TIMEOUT = float(os.getenv('DOWNLOAD_TIMEOUT', '300'))
+VALIDATE_TIMEOUT = float(os.getenv('DOWNLOAD_VALIDATE_TIMEOUT', '15'))
+
+# Kết quả validate: còn nguyên / đã đổi (hoặc mất) / không validate được (vd: 403, 405, lỗi mạng)
+VALIDATION_FRESH = "fresh"
+VALIDATION_STALE = "stale"
+VALIDATION_UNKNOWN = "unknown"
+GONE_STATUS = {404, 410}
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+
+
+class DownloadError(Exception):
+    """Lỗi download (HTTP error, quá dung lượng, hết retry)"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class AsyncDownloader:
+    """Downloader dùng chung cho cả process
+
+    Coroutine `download()` dùng được từ bất kỳ event loop nào (vd: uvicorn),
+    `download_sync()` dùng từ worker thread. Cả hai chạy trên cùng 1 loop nền
+    nên chia sẻ 1 connection pool keep-alive.
+    """
+
+    def __init__(self, max_bytes=MAX_DOWNLOAD_BYTES, chunk_size=DOWNLOAD_CHUNK_SIZE,
+                 max_connections=DOWNLOAD_MAX_CONNECTIONS, max_retries=DOWNLOAD_MAX_RETRIES,
+                 timeout=DOWNLOAD_TIMEOUT):
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._loop = None
+        self._client = None
+
+    # ----- background loop -----
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="downloader-loop", daemon=True)
+                thread.start()
+                self._loop = loop
+            return self._loop
+
+    def _get_client(self):
+        # Chỉ gọi trong loop nền
+        if self._client is None:
+            limits = httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections
+            )
+            self._client = httpx.AsyncClient(
+                limits=limits,
+                timeout=httpx.Timeout(self.timeout, connect=30.0),
+                follow_redirects=True,
+                headers=DEFAULT_HEADERS
+            )
+        return self._client
+
+    # ----- public API -----
+    async def download(self, url, dest_path, headers=None):
+        """Download `url` vào `dest_path` (await được từ mọi event loop)
+
+        Returns:
+            dict: {'path', 'size', 'digest', 'headers'}
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self._download(url, dest_path, headers), self._ensure_loop()
+        )
+        return await asyncio.wrap_future(future)
+
+    def download_sync(self, url, dest_path, headers=None):
+        """Download blocking cho code chạy trong thread (không gọi từ event loop)"""
+        future = asyncio.run_coroutine_threadsafe(
+            self._download(url, dest_path, headers), self._ensure_loop()
+        )
+        return future.result()
+
+    def validate_sync(self, url, etag=None, last_modified=None):
+        """Bản đã tải của `url` (theo ETag/Last-Modified) còn hợp lệ không, blocking cho worker thread
+
+        Returns:
+            VALIDATION_FRESH | VALIDATION_STALE | VALIDATION_UNKNOWN
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self._validate(url, etag, last_modified), self._ensure_loop()
+        )
+        return future.result()
+
+    @staticmethod
+    def _validation_headers(etag, last_modified):
+        # Range 1 byte: server bỏ qua điều kiện vẫn chỉ trả 1 byte
+        headers = {'Range': 'bytes=0-0'}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return headers
+
+    @staticmethod
+    def _validation_result(status_code, response_headers, etag, last_modified):
+        if status_code == 304:
+            return VALIDATION_FRESH
+        if status_code in GONE_STATUS:
+            return VALIDATION_STALE
+        if status_code not in (200, 206):
+            return VALIDATION_UNKNOWN
+        current_etag = response_headers.get('ETag')
+        current_last_modified = response_headers.get('Last-Modified')
+        if etag and current_etag:
+            return VALIDATION_FRESH if current_etag == etag else VALIDATION_STALE
+        if last_modified and current_last_modified:
+            return VALIDATION_FRESH if current_last_modified == last_modified else VALIDATION_STALE
+        return VALIDATION_UNKNOWN
+
+    # ----- implementation -----
+    async def _validate(self, url, etag=None, last_modified=None):
+        if not HAS_HTTPX:
+            return await asyncio.to_thread(self._validate_blocking, url, etag, last_modified)
+        try:
+            # Không đọc body: đóng stream ngay sau khi có status + headers
+            async with self._get_client().stream(
+                "GET", url, headers=self._validation_headers(etag, last_modified), timeout=VALIDATE_TIMEOUT
+            ) as response:
+                return self._validation_result(response.status_code, response.headers, etag, last_modified)
+        except httpx.HTTPError as e:
+            logger.warning(f"Không validate được {url}: {e}")
+            return VALIDATION_UNKNOWN
+
+    def _validate_blocking(self, url, etag=None, last_modified=None):
+        """Fallback khi không có httpx"""
+        headers = dict(DEFAULT_HEADERS)
+        headers.update(self._validation_headers(etag, last_modified))
+        try:
+            with requests.get(url, headers=headers, stream=True, timeout=VALIDATE_TIMEOUT) as response:
+                return self._validation_result(response.status_code, response.headers, etag, last_modified)
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Không validate được {url}: {e}")
+            return VALIDATION_UNKNOWN
+
+    def _check_size(self, size, url):
+        if size > self.max_bytes:
+            raise DownloadError(
+                f"File vượt quá giới hạn {self.max_bytes // (1024 * 1024)}MB: {url}",
+                status_code=413
+            )
+
+    async def _download(self, url, dest_path, headers=None):
+        if not HAS_HTTPX:
+            return await asyncio.to_thread(self._download_blocking, url, dest_path, headers)
+
+        client = self._get_client()
+        sha256 = hashlib.sha256()
+        received = 0
+        validator = None  # ETag/Last-Modified cho If-Range khi resume
+        response_headers = {}
+        attempt = 0
+
+        with open(dest_path, 'wb') as f:
+            while True:
+                request_headers = dict(headers or {})
+                if received > 0:
+                    request_headers['Range'] = f"bytes={received}-"
+                    if validator:
+                        request_headers['If-Range'] = validator
+
+                try:
+                    async with client.stream("GET", url, headers=request_headers) as response:
+                        if response.status_code >= 400:
+                            raise DownloadError(
+                                f"HTTP {response.status_code} khi tải {url}",
+                                status_code=response.status_code
+                            )
+
+                        if received > 0 and response.status_code != 206:
+                            # Server không hỗ trợ Range (hoặc file đã đổi) -> tải lại từ đầu
+                            logger.info(f"Server không resume được, tải lại từ đầu: {url}")
+                            await asyncio.to_thread(f.seek, 0)
+                            await asyncio.to_thread(f.truncate)
+                            sha256 = hashlib.sha256()
+                            received = 0
+
+                        if received == 0:
+                            response_headers = dict(response.headers)
+                            validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+                            content_length = response.headers.get('Content-Length')
+                            if content_length and content_length.isdigit():
+                                self._check_size(int(content_length), url)
+
+                        async for chunk in response.aiter_bytes(self.chunk_size):
+                            if not chunk:
+                                continue
+                            received += len(chunk)
+                            self._check_size(received, url)
+                            sha256.update(chunk)
+                            await asyncio.to_thread(f.write, chunk)
+                    break
+
+                except DownloadError:
+                    raise
+                except httpx.HTTPError as e:
+                    attempt += 1
+                    if attempt > self.max_retries:
+                        raise DownloadError(f"Không thể tải {url}: {str(e)}")
+                    logger.warning(f"Download bị ngắt tại {received:,} bytes ({e}), resume lần {attempt}...")
+                    await asyncio.sleep(min(2 ** attempt, 10))
+
+        logger.info(f"Đã tải thành công: {received:,} bytes")
+        return {
+            'path': dest_path,
+            'size': received,
+            'digest': sha256.hexdigest(),
+            'headers': response_headers
+        }
+
+    def _download_blocking(self, url, dest_path, headers=None):
+        """Fallback khi không có httpx: requests streaming (chạy trong thread)"""
+        sha256 = hashlib.sha256()
+        received = 0
+        request_headers = dict(DEFAULT_HEADERS)
+        request_headers.update(headers or {})
+        try:
+            with requests.get(url, stream=True, timeout=self.timeout, headers=request_headers) as response:
+                if response.status_code >= 400:
+                    raise DownloadError(f"HTTP {response.status_code} khi tải {url}", status_code=response.status_code)
+                content_length = response.headers.get('Content-Length')
+                if content_length and content_length.isdigit():
+                    self._check_size(int(content_length), url)
+                with open(dest_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        if chunk:
+                            received += len(chunk)
+                            self._check_size(received, url)
+                            sha256.update(chunk)
+                            f.write(chunk)
+                response_headers = dict(response.headers)
+        except requests.exceptions.RequestException as e:
+            raise DownloadError(f"Không thể tải {url}: {str(e)}")
+
+        return {
+            'path': dest_path,
+            'size': received,
+            'digest': sha256.hexdigest(),
+            'headers': response_headers
+        }
+
+
+# Process-wide downloader
+_downloader = None
+_downloader_lock = threading.Lock()
+
+
+def get_downloader():
+    """Lấy AsyncDownloader dùng chung (lazy init)"""
+    global _downloader
+    with _downloader_lock:
+        if _downloader is None:
+            _downloader = AsyncDownloader()
+        return _downloader
@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+"""
+💾 Embedding Store
+Lưu embeddings dạng nhị phân thay cho pickle:
+- Ma trận float32 `.npy`, mở bằng np.load(mmap_mode='r') -> cache hit không copy
+- Chunks: 1 file UTF-8 nối liền + sidecar offsets int64, decode lazy từng chunk
+- Tùy chọn lượng tử hóa float16 / int8 (scale theo từng vector), score trực tiếp
+  trên ma trận đã lượng tử hóa
+- Cache embedding theo hash text chunk, dùng chung giữa các tài liệu
+"""
+
+import os
+import re
+import json
+import mmap
+import hashlib
+import threading
+from collections.abc import Sequence
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    # Windows: chỉ khóa giữa các thread trong process
+    fcntl = None
+    HAS_FCNTL = False
+
+from model_registry import EMBEDDING_MODEL_NAME
+from text_chunker import Chunk
+
+# float32 (mặc định) | float16 | int8
+EMBEDDING_QUANTIZATION = os.getenv('EMBEDDING_QUANTIZATION', 'float32').lower()
+QUANTIZATION_MODES = ("float32", "float16", "int8")
+# Số dòng upcast lên float32 mỗi lần khi score (giới hạn bộ nhớ tạm)
+SCORE_BLOCK_ROWS = int(os.getenv('EMBEDDING_SCORE_BLOCK_ROWS', '8192'))
+# Thư mục cache embedding theo chunk (dùng chung cho server và chat bot)
+CHUNK_EMBEDDING_CACHE_DIR = os.getenv('CHUNK_EMBEDDING_CACHE_DIR', 'cache/chunk_embeddings')
+
+
+class ChunkTexts(Sequence):
+    """Danh sách chunks chỉ-đọc, decode từ buffer UTF-8 theo offsets khi truy cập
+
+    Có `pages` (n, 2) thì trả về Chunk kèm khoảng trang (0 = không rõ trang).
+    """
+
+    def __init__(self, data, offsets, pages=None):
+        self._data = data
+        self._offsets = offsets
+        self._pages = pages
+
+    def __len__(self):
+        return max(len(self._offsets) - 1, 0)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("chunk index out of range")
+        start, end = int(self._offsets[index]), int(self._offsets[index + 1])
+        text = bytes(self._data[start:end]).decode('utf-8')
+        if self._pages is None or not self._pages[index][0]:
+            return text
+        return Chunk(text, int(self._pages[index][0]), int(self._pages[index][1]))
+
+    def __reduce__(self):
+        # Pickle (vd: gửi sang process khác) như list thường
+        return (list, (list(self),))
+
+
+class QuantizedMatrix:
+    """Ma trận int8 + scale float32 theo từng vector (vector ≈ values[i] * scales[i])"""
+
+    def __init__(self, values, scales):
+        self.values = values
+        self.scales = scales
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.scales.nbytes
+
+    def __len__(self):
+        return len(self.values)
+
+    def to_float32(self):
+        return self.values.astype(np.float32) * self.scales[:, None]
+
+
+def normalize_rows(matrix):
+    """Chuẩn hóa L2 từng dòng (float32)"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def quantize_embeddings(embeddings, mode=None):
+    """Lượng tử hóa embeddings (đã chuẩn hóa L2) theo mode
+
+    Returns:
+        np.ndarray (float32/float16) hoặc QuantizedMatrix (int8)
+    """
+    mode = (mode or EMBEDDING_QUANTIZATION).lower()
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Quantization không hợp lệ: {mode} (hỗ trợ: {', '.join(QUANTIZATION_MODES)})")
+
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if matrix.ndim != 2:
+        matrix = matrix.reshape(len(matrix), -1)
+    if mode == "float32":
+        return matrix
+
+    matrix = normalize_rows(matrix) if len(matrix) else matrix
+    if mode == "float16":
+        return matrix.astype(np.float16)
+
+    scales = np.abs(matrix).max(axis=1) / 127.0 if len(matrix) else np.zeros(0, dtype=np.float32)
+    scales = np.maximum(scales, 1e-12).astype(np.float32)
+    values = np.round(matrix / scales[:, None]).astype(np.int8)
+    return QuantizedMatrix(values, scales)
+
+
+def similarity_scores(embeddings, queries, block_rows=None):
+    """Cosine similarity giữa queries và embeddings (float32/float16/int8)
+
+    Ma trận được upcast lên float32 theo từng block, không giải nén toàn bộ.
+
+    Returns:
+        np.ndarray float32 (n_queries, n_embeddings)
+    """
+    queries = normalize_rows(queries)
+    block_rows = block_rows or SCORE_BLOCK_ROWS
+
+    if isinstance(embeddings, QuantizedMatrix):
+        values, scales = embeddings.values, embeddings.scales
+    else:
+        values, scales = embeddings, None
+
+    num_rows = len(values)
+    scores = np.empty((len(queries), num_rows), dtype=np.float32)
+    for start in range(0, num_rows, block_rows):
+        end = min(start + block_rows, num_rows)
+        block = np.asarray(values[start:end], dtype=np.float32)
+        block_scores = queries @ block.T
+        if scales is not None:
+            # values * scale là vector đã chuẩn hóa
+            block_scores *= scales[start:end]
+        else:
+            block_scores /= np.maximum(np.linalg.norm(block, axis=1), 1e-12)
+        scores[:, start:end] = block_scores
+    return scores
+
+
+class EmbeddingStore:
+    """Embeddings + chunks của 1 tài liệu trên disk
+
+    Files (cùng prefix `base_path`):
+    - `<base>.npy`           ma trận embeddings (n, dim)
+    - `<base>_chunks.txt`    text các chunks nối liền (UTF-8)
+    - `<base>_offsets.npy`   int64 (n + 1) vị trí byte bắt đầu/kết thúc từng chunk
+    - `<base>_scales.npy`    float32 (n) scale từng vector, chỉ có ở mode int8
+    - `<base>_pages.npy`     int32 (n, 2) trang đầu/cuối từng chunk, chỉ có khi chunks mang số trang
+    """
+
+    def __init__(self, base_path):
+        base_path = str(base_path)
+        self.embeddings_path = Path(base_path + ".npy")
+        self.chunks_path = Path(base_path + "_chunks.txt")
+        self.offsets_path = Path(base_path + "_offsets.npy")
+        self.scales_path = Path(base_path + "_scales.npy")
+        self.pages_path = Path(base_path + "_pages.npy")
+
+    @property
+    def paths(self):
+        return [self.embeddings_path, self.chunks_path, self.offsets_path, self.scales_path, self.pages_path]
+
+    def exists(self):
+        return all(path.exists() for path in self.paths[:3])
+
+    def size_bytes(self):
+        return sum(path.stat().st_size for path in self.paths if path.exists())
+
+    @staticmethod
+    def _replace_npy(path, array):
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_path, path)
+
+    def save(self, embeddings, chunks, quantization=None):
+        """Ghi embeddings + chunks, mỗi file được ghi atomic
+
+        Args:
+            quantization: "float32" | "float16" | "int8" (mặc định: EMBEDDING_QUANTIZATION)
+        """
+        encoded = [chunk.encode('utf-8') for chunk in chunks]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        if encoded:
+            np.cumsum([len(item) for item in encoded], out=offsets[1:])
+
+        if isinstance(embeddings, QuantizedMatrix):
+            embeddings = embeddings.to_float32()
+        matrix = quantize_embeddings(embeddings, quantization)
+
+        tmp_chunks = self.chunks_path.with_name(self.chunks_path.name + ".tmp")
+        with open(tmp_chunks, 'wb') as f:
+            f.write(b"".join(encoded))
+        os.replace(tmp_chunks, self.chunks_path)
+
+        self._replace_npy(self.offsets_path, offsets)
+        if any(getattr(chunk, 'page_start', None) for chunk in chunks):
+            pages = np.array([
+                (getattr(chunk, 'page_start', None) or 0, getattr(chunk, 'page_end', None) or 0)
+                for chunk in chunks
+            ], dtype=np.int32)
+            self._replace_npy(self.pages_path, pages)
+        elif self.pages_path.exists():
+            self.pages_path.unlink()
+        if isinstance(matrix, QuantizedMatrix):
+            self._replace_npy(self.scales_path, matrix.scales)
+            matrix = matrix.values
+        elif self.scales_path.exists():
+            self.scales_path.unlink()
+        # Ghi ma trận cuối cùng: có file .npy hợp lệ nghĩa là chunks/offsets đã sẵn sàng
+        self._replace_npy(self.embeddings_path, np.ascontiguousarray(matrix))
+
+    def load(self, mmap_mode='r'):
+        """Mở embeddings (memory-mapped) và chunks
+
+        Returns:
+            (embeddings, chunks): np.ndarray float32/float16 (n, dim) hoặc QuantizedMatrix, và ChunkTexts
+
+        Raises:
+            ValueError: khi số dòng embeddings không khớp với số chunks
+        """
+        offsets = np.load(self.offsets_path)
+        num_chunks = max(len(offsets) - 1, 0)
+
+        embeddings = np.load(self.embeddings_path, mmap_mode=mmap_mode)
+        if embeddings.dtype == np.int8:
+            embeddings = QuantizedMatrix(embeddings, np.load(self.scales_path))
+
+        # 0 dòng = tài liệu được lưu khi không có embedding model
+        if len(embeddings) not in (0, num_chunks):
+            raise ValueError(
+                f"Embedding store hỏng: {len(embeddings)} embeddings / {num_chunks} chunks"
+            )
+
+        if num_chunks and self.chunks_path.stat().st_size:
+            with open(self.chunks_path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            data = b""
+
+        pages = np.load(self.pages_path) if self.pages_path.exists() else None
+        if pages is not None and len(pages) != num_chunks:
+            pages = None
+        return embeddings, ChunkTexts(data, offsets, pages)
+
+    def delete(self):
+        for path in self.paths:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+# ===== CHUNK-LEVEL EMBEDDING CACHE =====
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def chunk_text_key(text):
+    """Hash của chunk sau khi chuẩn hóa (gộp khoảng trắng, bỏ hoa/thường)"""
+    normalized = WHITESPACE_PATTERN.sub(' ', text).strip().casefold()
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class ChunkEmbeddingCache:
+    """Embedding đã tính theo hash text chunk, append-only trên disk
+
+    Files trong `cache_dir`:
+    - `vectors.f32`  ma trận float32 (rows, dim) ghi nối tiếp
+    - `keys.txt`     hash của từng dòng, dòng thứ i <-> vector thứ i
+    - `meta.json`    {dim, model}
+    - `.lock`        file lock (fcntl) giữa các process dùng chung thư mục (server và chat bot)
+
+    Mọi lần đọc/ghi files đều giữ file lock và đọc thêm các dòng process khác vừa ghi,
+    nên dòng ghi nối tiếp của 2 process không xen nhau.
+    """
+
+    def __init__(self, cache_dir, model_name=None):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.cache_dir / "vectors.f32"
+        self.keys_path = self.cache_dir / "keys.txt"
+        self.meta_path = self.cache_dir / "meta.json"
+        self.lock_path = self.cache_dir / ".lock"
+        self.model_name = model_name
+
+        self.lock = threading.Lock()
+        self.index = {}
+        self.dim = None
+        self.rows = 0
+        # Số bytes của keys.txt đã đọc vào index
+        self.keys_offset = 0
+        self._vectors = None
+        self.hits = 0
+        self.misses = 0
+        with self._locked():
+            self._sync()
+
+    @contextmanager
+    def _locked(self):
+        """Khóa giữa các thread (threading.Lock) và giữa các process (fcntl.flock)"""
+        with self.lock:
+            with open(self.lock_path, 'a') as lock_file:
+                if HAS_FCNTL:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if HAS_FCNTL:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _reset(self):
+        self.index = {}
+        self.dim = None
+        self.rows = 0
+        self.keys_offset = 0
+        self._vectors = None
+
+    def _sync(self):
+        """Đọc thêm các dòng đã được ghi từ lần đọc trước (gọi khi đang giữ _locked)
+
+        Đang giữ file lock thì không ai ghi dở, nên vectors và keys lệch nhau
+        chỉ có thể do lần ghi trước bị ngắt -> cắt về phần khớp.
+        """
+        if self.dim is None and self.meta_path.exists():
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                self.dim = json.load(f)['dim']
+        if not self.dim:
+            return
+
+        keys_size = self.keys_path.stat().st_size if self.keys_path.exists() else 0
+        vectors_size = self.vectors_path.stat().st_size if self.vectors_path.exists() else 0
+        if keys_size < self.keys_offset or vectors_size < self.rows * self.dim * 4 or not self.meta_path.exists():
+            # Process khác đã xóa cache -> đọc lại từ đầu
+            self._reset()
+            return self._sync()
+
+        tail = b""
+        if keys_size:
+            with open(self.keys_path, 'rb') as f:
+                f.seek(self.keys_offset)
+                tail = f.read()
+        lines = tail.splitlines(keepends=True)
+        if lines and not lines[-1].endswith(b"\n"):
+            lines.pop()
+        vector_rows = vectors_size // (self.dim * 4)
+        lines = lines[:max(vector_rows - self.rows, 0)]
+
+        new_offset = self.keys_offset + sum(len(line) for line in lines)
+        if new_offset != keys_size:
+            with open(self.keys_path, 'r+b') as f:
+                f.truncate(new_offset)
+        if vector_rows != self.rows + len(lines) or vectors_size % (self.dim * 4):
+            with open(self.vectors_path, 'r+b') as f:
+                f.truncate((self.rows + len(lines)) * self.dim * 4)
+
+        for line in lines:
+            self.index.setdefault(line.decode('utf-8').strip(), self.rows)
+            self.rows += 1
+        self.keys_offset = new_offset
+
+    def _vector_view(self):
+        """Memmap các vector hiện có (mở lại khi file lớn lên)"""
+        if self._vectors is None or len(self._vectors) != self.rows:
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(self.rows, self.dim))
+        return self._vectors
+
+    def _append(self, keys, vectors):
+        """Ghi nối tiếp (gọi khi đang giữ _locked, sau _sync)"""
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+            with open(self.meta_path, 'w', encoding='utf-8') as f:
+                json.dump({'dim': self.dim, 'model': self.model_name}, f)
+
+        # Vectors trước, keys sau: keys là nguồn sự thật khi load lại
+        with open(self.vectors_path, 'ab') as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        data = "".join(key + "\n" for key in keys).encode('utf-8')
+        with open(self.keys_path, 'ab') as f:
+            f.write(data)
+
+        for key in keys:
+            self.index[key] = self.rows
+            self.rows += 1
+        self.keys_offset += len(data)
+
+    def _lookup(self, keys, misses):
+        self.misses += misses
+        self.hits += len(keys) - misses
+        if not keys:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        vectors = self._vector_view()
+        return np.array(vectors[[self.index[key] for key in keys]], dtype=np.float32)
+
+    def encode(self, texts, encode_fn):
+        """Embedding cho `texts`, chỉ gọi `encode_fn` với các chunk chưa có trong cache
+
+        Args:
+            texts: danh sách chunk text
+            encode_fn: hàm list[str] -> np.ndarray (n, dim), vd: model_registry.encode_texts
+
+        Returns:
+            np.ndarray float32 (len(texts), dim)
+        """
+        keys = [chunk_text_key(text) for text in texts]
+
+        with self._locked():
+            self._sync()
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in self.index and key not in missing:
+                    missing[key] = text
+            if not missing:
+                return self._lookup(keys, 0)
+
+        # Encode ngoài lock
+        missing_keys = list(missing)
+        new_vectors = np.asarray(encode_fn(list(missing.values())), dtype=np.float32)
+        with self._locked():
+            # Thread / process khác có thể đã thêm cùng chunk trong lúc encode
+            self._sync()
+            fresh = [i for i, key in enumerate(missing_keys) if key not in self.index]
+            if fresh:
+                self._append([missing_keys[i] for i in fresh], new_vectors[fresh])
+            return self._lookup(keys, len(missing))
+
+    def clear(self):
+        """Xóa toàn bộ vector đã cache"""
+        with self._locked():
+            self._vectors = None
+            for path in (self.meta_path, self.vectors_path, self.keys_path):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+            self._reset()
+
+    def stats(self):
+        """Hit/miss từ lúc process start và số vector đã cache"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': self.rows,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'size_mb': round(self.rows * (self.dim or 0) * 4 / (1024 * 1024), 2)
+            }
+
+
+_chunk_caches = {}
+_chunk_caches_lock = threading.Lock()
+
+
+def get_chunk_embedding_cache(model_name=None, cache_dir=None):
+    """ChunkEmbeddingCache dùng chung cho process, tách thư mục theo model"""
+    model_name = model_name or EMBEDDING_MODEL_NAME
+    cache_dir = Path(cache_dir or CHUNK_EMBEDDING_CACHE_DIR) / model_name.replace('/', '_')
+    with _chunk_caches_lock:
+        key = str(cache_dir)
+        if key not in _chunk_caches:
+            _chunk_caches[key] = ChunkEmbeddingCache(cache_dir, model_name)
+        return _chunk_caches[key]
@@ -6,15 +6,89 @@ Sửa lỗi API 400 bằng cách tối ưu prompt và giới hạn độ dài
 
 import os
 import json
-import requests
 from pathlib import Path
 from dotenv import load_dotenv
 import hashlib
+import threading
+import time
+from collections import deque, Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+import numpy as np
+
+from llm_client import get_llm_client, LLMError
+from llm_cache import prompt_digest, LLM_SEED, QUESTION_LLM_SEED
+from embedding_store import similarity_scores, get_chunk_embedding_cache
+from vector_index import top_k_rows, take_rows
+from batch_planner import plan_batch_contents
+from question_dedupe import dedupe_questions
+from model_registry import encode_texts, embedding_dim, EMBEDDING_BATCH_SIZE, HAS_SENTENCE_TRANSFORMERS
+from text_chunker import (count_tokens, chunk_text, clean_page_text, fit_to_token_budget, pack_texts,
+                          pack_count, chunk_page_numbers, prefix_page_numbers, iter_chunks, split_pages)
+
 # Load environment variables
 load_dotenv()
 
+# Giới hạn concurrency / budget cho các batch gọi LLM
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '6'))
+# Số lời gọi LLM (chưa có trong cache) đang chạy cùng lúc trong cả process, mọi file/batch dùng chung
+LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', '4'))
+LLM_RPM_LIMIT = int(os.getenv('LLM_RPM_LIMIT', '500'))
+LLM_TPM_LIMIT = int(os.getenv('LLM_TPM_LIMIT', '200000'))
+
+# Token budget: tổng prompt gửi LLM và phần nội dung tài liệu trong mỗi prompt
+LLM_PROMPT_TOKEN_BUDGET = int(os.getenv('LLM_PROMPT_TOKEN_BUDGET', '3000'))
+PROMPT_CONTENT_TOKENS = int(os.getenv('PROMPT_CONTENT_TOKENS', '600'))
+# Số câu hỏi mỗi lần gọi LLM trong batch processing
+QUESTION_BATCH_SIZE = 5
+
+def tag_source_pages(questions, pages):
+    """Gắn các trang nguồn vào câu hỏi sinh từ LLM (câu fallback không có trang nguồn)"""
+    for question in questions:
+        if isinstance(question, dict) and not question.get("is_fallback"):
+            question["source_pages"] = list(pages)
+    return questions
+
+class RateLimiter:
+    """Sliding-window limiter theo requests/phút và tokens/phút (dùng chung cả process)"""
+    
+    def __init__(self, rpm_limit, tpm_limit, window=60.0):
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self.window = window
+        self.events = deque()  # (timestamp, tokens)
+        self.tokens_in_window = 0
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def estimate_tokens(prompt, max_tokens):
+        """Tokens của 1 request (prompt + output tối đa)"""
+        return count_tokens(prompt) + max_tokens
+    
+    def acquire(self, tokens):
+        """Block cho đến khi request mới nằm trong budget RPM/TPM"""
+        # Request lớn hơn cả budget thì chỉ cần chờ window trống
+        tokens = min(tokens, self.tpm_limit)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                while self.events and now - self.events[0][0] >= self.window:
+                    _, old_tokens = self.events.popleft()
+                    self.tokens_in_window -= old_tokens
+                
+                if (len(self.events) < self.rpm_limit and
+                        self.tokens_in_window + tokens <= self.tpm_limit):
+                    self.events.append((now, tokens))
+                    self.tokens_in_window += tokens
+                    return
+                
+                wait_time = self.window - (now - self.events[0][0]) if self.events else 0.1
+            time.sleep(max(wait_time, 0.05))
+
+rate_limiter = RateLimiter(LLM_RPM_LIMIT, LLM_TPM_LIMIT)
+llm_semaphore = threading.BoundedSemaphore(max(1, LLM_CONCURRENCY))
+
 class SimpleQuestionGenerator:
     def __init__(self):
         """Khởi tạo hệ thống tạo câu hỏi đơn giản"""
@@ -28,63 +102,21 @@ class SimpleQuestionGenerator:
         self.embeddings = []  # Add missing attribute
         self.chunks = []      # Add missing attribute
         self.document_summary = ""  # Add missing attribute
+        self.corpus = None  # ProjectCorpus: retrieval trên toàn bộ file của project
+        # Lần gửi lại cùng prompt (retry, batch thay thế, top-up bank) phải nhận response mới
+        self.sample_offset = 0  # vd: số câu đã có trong bank
+        self._prompt_uses = Counter()
+        self._prompt_lock = threading.Lock()
         
         print("✅ Hệ thống đơn giản đã sẵn sàng!")
     
     def convert_pdf_to_text(self, pdf_path):
         """Chuyển PDF sang text với nhiều phương pháp"""
         try:
-            print(f"🔄 Đang chuyển đổi PDF: {pdf_path}")
-            
-            # Method 1: Sử dụng pdfToText.py (nếu có)
-            try:
-                from pdfToText import pdf_to_text
-                text_content = pdf_to_text(pdf_path)
-                if text_content and isinstance(text_content, str) and text_content.strip():
-                    self.pdf_content = text_content
-                    print(f"✅ Method 1 thành công: {len(text_content)} chars")
-                    return True
-                else:
-                    print("⚠️ Method 1 trả về nội dung rỗng")
-            except Exception as e:
-                print(f"⚠️ Method 1 failed: {e}")
-            
-            # Method 2: Sử dụng PyPDF2
-            try:
-                import PyPDF2
-                text_content = ""
-                with open(pdf_path, 'rb') as file:
-                    pdf_reader = PyPDF2.PdfReader(file)
-                    for page in pdf_reader.pages:
-                        text_content += page.extract_text() + "\n"
-                
-                if text_content and text_content.strip():
-                    self.pdf_content = text_content
-                    print(f"✅ Method 2 thành công: {len(text_content)} chars")
-                    return True
-                else:
-                    print("⚠️ Method 2 trả về nội dung rỗng")
-            except Exception as e:
-                print(f"⚠️ Method 2 failed: {e}")
-            
-            # Method 3: Sử dụng pdfplumber
-            try:
-                import pdfplumber
-                text_content = ""
-                with pdfplumber.open(pdf_path) as pdf:
-                    for page in pdf.pages:
-                        page_text = page.extract_text()
-                        if page_text:
-                            text_content += page_text + "\n"
-                
-                if text_content and text_content.strip():
-                    self.pdf_content = text_content
-                    print(f"✅ Method 3 thành công: {len(text_content)} chars")
-                    return True
-                else:
-                    print("⚠️ Method 3 trả về nội dung rỗng")
-            except Exception as e:
-                print(f"⚠️ Method 3 failed: {e}")
+            text_content = extract_pdf_text(pdf_path)
+            if text_content:
+                self.pdf_content = text_content
+                return True
             
             # Fallback: Tạo nội dung mẫu để test
             print("⚠️ Tất cả methods failed, sử dụng nội dung mẫu")
@@ -101,47 +133,49 @@ class SimpleQuestionGenerator:
             self.pdf_content = ""
             return False
     
+    def next_sample(self, prompt):
+        """(seed, số lần đã gửi prompt này) cho lần gọi tiếp theo
+
+        Seed gốc LLM_SEED (nếu đặt) hoặc QUESTION_LLM_SEED: mỗi lần gửi lại dùng seed khác
+        -> response mới nhưng vẫn replay được từ cache.
+        """
+        digest = prompt_digest(prompt)
+        with self._prompt_lock:
+            uses = self._prompt_uses[digest]
+            self._prompt_uses[digest] += 1
+        base_seed = LLM_SEED if LLM_SEED is not None else QUESTION_LLM_SEED
+        seed = None if base_seed is None else base_seed + self.sample_offset + uses
+        return seed, uses
+    
     def call_openai_api_safe(self, prompt, max_tokens=2000):
         """Gọi OpenAI API với error handling an toàn"""
         try:
-            # Giới hạn prompt length để tránh lỗi 400
-            if len(prompt) > 8000:
-                print(f"⚠️ Prompt quá dài ({len(prompt)} chars), cắt ngắn...")
-                prompt = prompt[:8000] + "..."
-            
-            url = "https://api.openai.com/v1/chat/completions"
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.openai_api_key}"
-            }
+            # Giới hạn prompt theo token budget (cắt ở ranh giới câu) để tránh lỗi 400
+            prompt_tokens = count_tokens(prompt)
+            if prompt_tokens > LLM_PROMPT_TOKEN_BUDGET:
+                print(f"⚠️ Prompt quá dài ({prompt_tokens} tokens), cắt theo câu...")
+                prompt = fit_to_token_budget(prompt, LLM_PROMPT_TOKEN_BUDGET)
             
-            data = {
-                "model": "gpt-3.5-turbo",
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                "max_tokens": min(max_tokens, 1500),
-                "temperature": 0.7
-            }
-            
-            print(f"🔄 Gọi API... (prompt: {len(prompt)} chars)")
-            response = requests.post(url, headers=headers, json=data, timeout=60)
+            max_tokens = min(max_tokens, 1500)
+            seed, uses = self.next_sample(prompt)
+            # Không seed: chỉ lần gửi đầu được lấy từ cache (gửi lại là để có response khác)
+            use_cache = seed is not None or (uses == 0 and self.sample_offset == 0)
+            client = get_llm_client()
             
-            if response.status_code != 200:
-                print(f"❌ API Error {response.status_code}: {response.text}")
-                return None
-                
-            result = response.json()
+            # Cache hit không tính vào rate limit
+            cached = client.get_cached(prompt, max_tokens=max_tokens, temperature=0.7, seed=seed) if use_cache else None
+            if cached is not None:
+                print(f"🗄️ Dùng response đã cache (prompt: {len(prompt)} chars)")
+                return cached
+            rate_limiter.acquire(RateLimiter.estimate_tokens(prompt, max_tokens))
             
-            if 'choices' in result and len(result['choices']) > 0:
-                return result['choices'][0]['message']['content']
-            else:
-                print(f"❌ Lỗi API response: {result}")
-                return None
+            print(f"🔄 Gọi API... (prompt: {len(prompt)} chars)")
+            with llm_semaphore:
+                return client.chat(prompt, max_tokens=max_tokens, temperature=0.7, seed=seed, use_cache=use_cache)
                 
+        except LLMError as e:
+            print(f"❌ {str(e)}")
+            return None
         except Exception as e:
             print(f"❌ Exception: {str(e)}")
             return None
@@ -160,8 +194,8 @@ class SimpleQuestionGenerator:
                 print(f"🔄 Số lượng lớn ({num_questions}), chuyển sang batch processing...")
                 return self.generate_questions_in_batches(num_questions)
             
-            # Lấy nội dung ngắn gọn (max 2000 chars)
-            content_sample = self.pdf_content[:2000]
+            # Lấy nội dung đầu tài liệu vừa token budget (trọn câu)
+            content_sample = fit_to_token_budget(clean_page_text(self.pdf_content), PROMPT_CONTENT_TOKENS)
             print(f"📄 Sử dụng {len(content_sample)} chars từ PDF content")
             
             prompt = f"""Bạn là expert tạo câu hỏi trắc nghiệm. Từ nội dung sau, tạo CHÍNH XÁC {num_questions} câu hỏi:
@@ -214,6 +248,9 @@ Trả về JSON:"""
                         actual_count = len(questions_data.get("questions", []))
                         print(f"✅ Parse thành công: {actual_count} câu hỏi")
                         
+                        # Các trang nguồn của nội dung đã gửi (để invalidate khi trang đổi)
+                        tag_source_pages(questions_data["questions"], prefix_page_numbers(self.pdf_content, PROMPT_CONTENT_TOKENS))
+                        
                         # Ensure đúng số lượng
                         if actual_count >= num_questions:
                             # Đủ hoặc thừa, chỉ lấy đúng số lượng
@@ -500,73 +537,80 @@ Trả về JSON:"""
             print(f"⚠️ Error cleaning JSON: {e}")
             return None
     
-    def generate_questions_in_batches(self, total_questions):
-        """Tạo câu hỏi theo batch với full guarantee đủ số lượng"""
+    def generate_questions_in_batches(self, total_questions, max_concurrency=None, existing=None, rows=None):
+        """Tạo câu hỏi theo batch (song song) với full guarantee đủ số lượng
+
+        existing: câu hỏi đã có (vd: bank của tài liệu), câu mới trùng/gần trùng với chúng bị tạo lại
+        rows: chỉ lấy nội dung từ các chunk này (None = toàn bộ tài liệu)
+        """
         print(f"🔄 Tạo {total_questions} câu hỏi theo batch...")
         
-        # Chia thành batch 8 câu mỗi batch (tăng từ 5 để test performance)
-        batch_size = 5
-        all_questions = []
+        # Chia thành batch 5 câu mỗi batch
+        batch_size = QUESTION_BATCH_SIZE
         max_retries = 3
         
         # Tính số batch cần thiết
         num_batches = (total_questions + batch_size - 1) // batch_size
         print(f"📦 Chia thành {num_batches} batch ({batch_size} câu/batch)")
         
-        # Chia content thành các phần khác nhau
-        content_parts = self.split_content_for_batches(num_batches)
+        # Mỗi batch 1 phần nội dung khác nhau (theo cụm chủ đề nếu có embeddings)
+        content_parts, content_pages = self.plan_content_for_batches(num_batches, rows)
         
-        for batch_num in range(num_batches):
-            remaining = total_questions - len(all_questions)
-            current_batch_size = min(batch_size, remaining)
-            
-            if current_batch_size <= 0:
-                break
+        # Kích thước từng batch (batch cuối có thể nhỏ hơn)
+        batch_sizes = [
+            min(batch_size, total_questions - batch_num * batch_size)
+            for batch_num in range(num_batches)
+        ]
+        
+        # Gửi các batch song song, giới hạn bởi concurrency + RPM/TPM budget
+        max_workers = max(1, min(num_batches, max_concurrency or BATCH_CONCURRENCY))
+        print(f"⚡ Chạy {num_batches} batch với {max_workers} luồng song song")
+        
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="question-batch") as executor:
+            futures = [
+                executor.submit(
+                    self.generate_batch_with_retries,
+                    current_batch_size,
+                    content_parts[batch_num % len(content_parts)],
+                    batch_num + 1,
+                    max_retries
+                )
+                for batch_num, current_batch_size in enumerate(batch_sizes)
+            ]
             
-            print(f"⚡ Batch {batch_num + 1}/{num_batches}: {current_batch_size} câu...")
+            # Ghép kết quả theo đúng thứ tự batch
+            all_questions = []
+            question_batches = []
+            for batch_num, future in enumerate(futures):
+                batch_questions = future.result()
+                tag_source_pages(batch_questions, content_pages[batch_num % len(content_pages)])
+                all_questions.extend(batch_questions)
+                question_batches.extend([batch_num] * len(batch_questions))
             
-            # Lấy content cho batch này
-            content_for_batch = content_parts[batch_num % len(content_parts)]
+            def replace_removed(removed, round_index):
+                """Tạo lại đúng số câu bị loại, từ nội dung của batch chứa câu đó"""
+                removed_per_batch = Counter(question_batches[i] for i in removed)
+                replacement_futures = [
+                    (batch_num, executor.submit(
+                        self.generate_batch_with_retries,
+                        count,
+                        content_parts[batch_num % len(content_parts)],
+                        f"{batch_num + 1}.{round_index + 1}",
+                        max_retries
+                    ))
+                    for batch_num, count in removed_per_batch.items()
+                ]
+                generated = {}
+                for batch_num, future in replacement_futures:
+                    generated[batch_num] = iter(tag_source_pages(future.result(), content_pages[batch_num % len(content_pages)]))
+                # Câu thay thế thứ j lấp slot removed[j] (None nếu batch tạo thiếu)
+                return [next(generated[question_batches[i]], None) for i in removed]
             
-            # Thử tạo câu hỏi cho batch với retry
-            batch_success = False
-            for retry in range(max_retries):
-                try:
-                    batch_result = self.generate_single_batch(current_batch_size, content_for_batch, batch_num + 1)
-                    
-                    if batch_result and batch_result.get("questions"):
-                        questions_from_batch = batch_result["questions"]
-                        if len(questions_from_batch) > 0:
-                            # Lấy đúng số lượng cần thiết
-                            questions_to_add = questions_from_batch[:current_batch_size]
-                            all_questions.extend(questions_to_add)
-                            print(f"✅ Batch {batch_num + 1}: +{len(questions_to_add)} câu")
-                            batch_success = True
-                            break
-                        else:
-                            print(f"⚠️ Batch {batch_num + 1} retry {retry + 1}: 0 câu hỏi")
-                    else:
-                        print(f"⚠️ Batch {batch_num + 1} retry {retry + 1}: không có kết quả")
-                        
-                except Exception as e:
-                    print(f"⚠️ Batch {batch_num + 1} retry {retry + 1} failed: {e}")
-                
-                if retry < max_retries - 1:
-                    print(f"🔄 Thử lại batch {batch_num + 1}...")
-            
-            # Nếu batch thất bại hoàn toàn, dùng fallback
-            if not batch_success:
-                print(f"❌ Batch {batch_num + 1} thất bại hoàn toàn, tạo fallback...")
-                fallback = self.create_fallback_questions(current_batch_size)
-                if fallback and fallback.get("questions"):
-                    fallback_questions = fallback["questions"][:current_batch_size]
-                    all_questions.extend(fallback_questions)
-                    print(f"🛡️ Batch {batch_num + 1}: +{len(fallback_questions)} câu fallback")
-            
-            # Check nếu đã đủ câu hỏi
-            if len(all_questions) >= total_questions:
-                print(f"🎯 Đã đủ {len(all_questions)} câu hỏi")
-                break
+            # Loại câu trùng/gần trùng giữa các batch, chỉ tạo thay thế cho các slot bị loại
+            all_questions, deduper = dedupe_questions(all_questions, replace_removed, existing=existing)
+            dedupe_stats = deduper.stats()
+            if dedupe_stats['exact_removed'] or dedupe_stats['near_removed']:
+                print(f"🧹 Dedupe: loại {dedupe_stats['exact_removed']} câu trùng, {dedupe_stats['near_removed']} câu gần trùng")
         
         # Final guarantee: đảm bảo có đúng số lượng
         if len(all_questions) < total_questions:
@@ -582,33 +626,85 @@ Trả về JSON:"""
         print(f"🎯 Hoàn thành batch processing: {len(final_questions)}/{total_questions} câu hỏi")
         return {"questions": final_questions}
     
+    def generate_batch_with_retries(self, current_batch_size, content_for_batch, batch_number, max_retries=3):
+        """Tạo 1 batch với retry, fallback nếu thất bại hoàn toàn"""
+        print(f"⚡ Batch {batch_number}: {current_batch_size} câu...")
+        
+        for retry in range(max_retries):
+            try:
+                batch_result = self.generate_single_batch(current_batch_size, content_for_batch, batch_number)
+                
+                if batch_result and batch_result.get("questions"):
+                    questions_from_batch = batch_result["questions"]
+                    if len(questions_from_batch) > 0:
+                        # Lấy đúng số lượng cần thiết
+                        questions_to_add = questions_from_batch[:current_batch_size]
+                        print(f"✅ Batch {batch_number}: +{len(questions_to_add)} câu")
+                        return questions_to_add
+                    else:
+                        print(f"⚠️ Batch {batch_number} retry {retry + 1}: 0 câu hỏi")
+                else:
+                    print(f"⚠️ Batch {batch_number} retry {retry + 1}: không có kết quả")
+                    
+            except Exception as e:
+                print(f"⚠️ Batch {batch_number} retry {retry + 1} failed: {e}")
+            
+            if retry < max_retries - 1:
+                print(f"🔄 Thử lại batch {batch_number}...")
+        
+        # Nếu batch thất bại hoàn toàn, dùng fallback
+        print(f"❌ Batch {batch_number} thất bại hoàn toàn, tạo fallback...")
+        fallback = self.create_fallback_questions(current_batch_size)
+        if fallback and fallback.get("questions"):
+            fallback_questions = fallback["questions"][:current_batch_size]
+            print(f"🛡️ Batch {batch_number}: +{len(fallback_questions)} câu fallback")
+            return fallback_questions
+        return []
+    
+    def plan_content_for_batches(self, num_batches, rows=None):
+        """Nội dung cho từng batch: gom chunks theo chủ đề (embeddings), mỗi batch 1 nhóm chunks riêng
+
+        Không có embeddings khớp với chunks -> chia theo vị trí (split_content_for_batches).
+        rows: chỉ dùng các chunk này (vd: chunk chưa có câu hỏi trong bank)
+
+        Returns:
+            (content_parts, content_pages): nội dung và các trang nguồn của từng phần
+        """
+        chunks, embeddings = self.chunks, self.embeddings
+        has_embeddings = len(embeddings) and len(embeddings) == len(chunks)
+        if rows is not None:
+            chunks = [self.chunks[row] for row in rows]
+            embeddings = take_rows(self.embeddings, np.asarray(rows, dtype=np.int64)) if has_embeddings else []
+        if has_embeddings:
+            try:
+                plan = plan_batch_contents(chunks, embeddings, num_batches, PROMPT_CONTENT_TOKENS)
+                if plan is not None:
+                    content_parts, clusters, content_pages = plan
+                    print(f"🗺️ Lên kế hoạch {len(content_parts)} batch trên {len(set(clusters))} cụm chủ đề")
+                    return content_parts, content_pages
+            except Exception as e:
+                print(f"⚠️ Lỗi lên kế hoạch theo chủ đề: {e}")
+        if rows is not None and chunks:
+            # Chia các chunk được chọn xen kẽ cho các batch
+            groups = [chunks[i::num_batches] for i in range(min(num_batches, len(chunks)))]
+            return ([pack_texts(group, PROMPT_CONTENT_TOKENS) for group in groups],
+                    [chunk_page_numbers(group[:pack_count(group, PROMPT_CONTENT_TOKENS)]) for group in groups])
+        content_parts = self.split_content_for_batches(num_batches)
+        return content_parts, [chunk_page_numbers([part]) for part in content_parts]
+    
     def split_content_for_batches(self, num_batches):
-        """Chia content thành các phần khác nhau cho mỗi batch"""
+        """Chia content thành các phần khác nhau cho mỗi batch (mỗi phần vừa token budget, trọn câu)"""
         if not self.pdf_content:
             return ["Nội dung mẫu"] * num_batches
         
-        content_length = len(self.pdf_content)
-        chunk_size = min(2000, content_length // max(num_batches, 1))
-        
-        content_parts = []
-        for i in range(num_batches):
-            start = i * chunk_size
-            end = min(start + chunk_size, content_length)
-            
-            if start < content_length:
-                part = self.pdf_content[start:end]
-                # Đảm bảo không cắt giữa từ
-                if end < content_length and not part.endswith(' '):
-                    last_space = part.rfind(' ')
-                    if last_space > start + chunk_size * 0.8:  # Ít nhất 80% chunk
-                        part = part[:last_space]
-                
-                content_parts.append(part)
-            else:
-                # Reuse content từ đầu nếu hết
-                content_parts.append(self.pdf_content[:chunk_size])
+        content_parts = chunk_text(self.pdf_content, max_tokens=PROMPT_CONTENT_TOKENS, overlap_tokens=0)
+        if not content_parts:
+            return [fit_to_token_budget(self.pdf_content, PROMPT_CONTENT_TOKENS)]
         
-        return content_parts if content_parts else [self.pdf_content[:2000]]
+        # Nhiều phần hơn số batch: lấy rải đều cả tài liệu
+        if len(content_parts) > num_batches:
+            content_parts = [content_parts[i * len(content_parts) // num_batches] for i in range(num_batches)]
+        return content_parts
     
     def generate_single_batch(self, batch_size, content, batch_number):
         """Tạo một batch câu hỏi với logging chi tiết"""
@@ -616,7 +712,7 @@ Trả về JSON:"""
         
         prompt = f"""Bạn là expert tạo câu hỏi trắc nghiệm. Batch {batch_number}: Từ nội dung sau, tạo CHÍNH XÁC {batch_size} câu hỏi:
 
-{content[:1800]}
+{fit_to_token_budget(content, PROMPT_CONTENT_TOKENS)}
 
 YÊU CẦU BẮT BUỘC:
 - Tạo đúng {batch_size} câu hỏi
@@ -764,36 +860,43 @@ JSON:"""
                 "type": "multiple_choice",
                 "difficulty": template["difficulty"],
                 "explanation": template["explanation"] + f" (Question {i+1})",
-                "choices": choices
+                "choices": choices,
+                "is_fallback": True
             }
             questions.append(question)
         
         print(f"✅ Tạo thành công {len(questions)} câu hỏi fallback với content thật")
         return {"questions": questions}
     
-    def create_embeddings(self):
-        """Tạo embeddings (simplified version)"""
+    def create_embeddings(self, chunks=None, embeddings=None):
+        """Tạo embeddings float32 cho các chunks bằng SentenceTransformer (batch, CPU)
+        
+        Args:
+            chunks: chunks đã tạo sẵn (vd: từ extract_and_embed), None = tự chia từ pdf_content
+            embeddings: embeddings đã tính cùng thứ tự chunks (vd: từ extract_and_embed), None = encode ở đây
+        """
         try:
             if not self.pdf_content:
                 print("❌ Không có PDF content để tạo embeddings")
                 return False
             
-            # Simplified: tạo chunks từ content
             text = self.pdf_content.strip()
             if len(text) < 100:
                 print("⚠️ Nội dung quá ngắn")
                 return False
                 
             # Chia text thành chunks đơn giản
-            chunk_size = 1000
-            self.chunks = []
-            for i in range(0, len(text), chunk_size):
-                chunk = text[i:i + chunk_size]
-                if len(chunk.strip()) > 50:  # Chỉ lấy chunks đủ dài
-                    self.chunks.append(chunk.strip())
+            self.chunks = list(chunks) if chunks is not None else chunk_text(text)
             
-            # Tạo dummy embeddings (simplified)
-            self.embeddings = [[0.1] * 384 for _ in self.chunks]  # Fake embeddings
+            if embeddings is not None and len(embeddings) == len(self.chunks):
+                self.embeddings = embeddings
+            elif HAS_SENTENCE_TRANSFORMERS:
+                # Chỉ encode chunks chưa từng gặp (cache theo hash text, dùng chung giữa tài liệu)
+                self.embeddings = get_chunk_embedding_cache().encode(self.chunks, encode_texts)
+            else:
+                # Không có model: vẫn tạo câu hỏi được, chỉ không có retrieval
+                print("⚠️ Chưa cài sentence-transformers, bỏ qua embeddings")
+                self.embeddings = np.zeros((0, embedding_dim()), dtype=np.float32)
             
             print(f"✅ Tạo {len(self.chunks)} chunks và {len(self.embeddings)} embeddings")
             return True
@@ -815,6 +918,30 @@ JSON:"""
         """Alias cho generate_questions_simple để tương thích"""
         return self.generate_questions_simple(num_questions)
     
+    def least_used_chunk_rows(self, existing, min_rows):
+        """Các chunk ít được câu hỏi đã có dùng nhất (theo source_pages), ít nhất min_rows chunk nếu đủ"""
+        page_uses = Counter(
+            page for question in existing if isinstance(question, dict)
+            for page in question.get("source_pages") or []
+        )
+        uses = [max((page_uses[page] for page in chunk_page_numbers([chunk])), default=0) for chunk in self.chunks]
+        for level in sorted(set(uses)):
+            rows = [row for row, count in enumerate(uses) if count <= level]
+            if len(rows) >= min_rows:
+                return rows
+        return list(range(len(self.chunks)))
+    
+    def generate_more_questions(self, num_questions, existing):
+        """Top-up bank: luôn qua batch planner (không dùng phần đầu tài liệu như generate_questions_simple),
+        nội dung lấy từ các chunk chưa/ít có câu hỏi, câu mới không trùng/gần trùng với existing"""
+        num_batches = (num_questions + QUESTION_BATCH_SIZE - 1) // QUESTION_BATCH_SIZE
+        rows = self.least_used_chunk_rows(existing, min_rows=2 * num_batches) if self.chunks else None
+        if rows is not None and len(rows) == len(self.chunks):
+            rows = None
+        print(f"➕ Tạo thêm {num_questions} câu hỏi (bank đã có {len(existing)} câu, "
+              f"nội dung từ {len(rows) if rows is not None else len(self.chunks)}/{len(self.chunks)} chunks)")
+        return self.generate_questions_in_batches(num_questions, existing=existing, rows=rows)
+    
     def save_embeddings_cache(self, file_name):
         """Save embeddings cache (dummy implementation)"""
         try:
@@ -834,13 +961,178 @@ JSON:"""
             print(f"❌ Lỗi load embeddings cache: {e}")
             return False
     
-    def get_relevant_content_for_topic(self, topic, num_chunks=3):
-        """Get relevant content (simplified)"""
+    def get_relevant_content_for_topics(self, topics, num_chunks=3):
+        """Context cho nhiều topic cùng lúc: 1 lần encode + 1 phép nhân ma trận cho cả batch
+        
+        Có project corpus thì tìm trên tất cả file của project thay vì chỉ file hiện tại.
+        Topic không retrieve được thì fallback 1000 ký tự đầu.
+        
+        Returns:
+            list[str] cùng thứ tự với topics
+        """
+        topics = list(topics)
+        if not topics:
+            return []
+        
+        if self.corpus is not None and HAS_SENTENCE_TRANSFORMERS:
+            try:
+                contents = self.corpus.relevant_contents(topics, num_chunks)
+                if all(contents):
+                    return contents
+            except Exception as e:
+                print(f"⚠️ Không retrieve được từ project corpus: {e}")
+        
+        if len(self.embeddings) and len(self.embeddings) == len(self.chunks):
+            try:
+                scores = similarity_scores(self.embeddings, encode_texts(topics))
+                top_ids, _ = top_k_rows(scores, num_chunks)
+                return [pack_texts([self.chunks[i] for i in ids], PROMPT_CONTENT_TOKENS) for ids in top_ids]
+            except Exception as e:
+                print(f"⚠️ Không retrieve được theo topic: {e}")
+        
         # Return part of PDF content
         if self.pdf_content:
             # Return first 1000 chars as "relevant"
-            return self.pdf_content[:1000]
-        return "Nội dung liên quan đến chủ đề."
+            return [self.pdf_content[:1000]] * len(topics)
+        return ["Nội dung liên quan đến chủ đề."] * len(topics)
+    
+    def get_relevant_content_for_topic(self, topic, num_chunks=3):
+        """Lấy các chunks gần nhất với topic (cosine trên embeddings), fallback 1000 ký tự đầu"""
+        return self.get_relevant_content_for_topics([topic], num_chunks)[0]
+
+# ===== EXTRACTION HELPERS (module-level để chạy được trong process pool) =====
+def extract_pdf_text(pdf_path, page_workers=None):
+    """Trích xuất text từ PDF bằng pdfToText / PyPDF2 / pdfplumber, trả về "" nếu tất cả thất bại
+
+    page_workers: số process theo trang của pdfToText (None = PDF_PAGE_WORKERS)
+    """
+    print(f"🔄 Đang chuyển đổi PDF: {pdf_path}")
+    
+    # Method 1: Sử dụng pdfToText.py (nếu có)
+    try:
+        from pdfToText import pdf_to_text
+        text_content = pdf_to_text(pdf_path, workers=page_workers)
+        if text_content and isinstance(text_content, str) and text_content.strip():
+            print(f"✅ Method 1 thành công: {len(text_content)} chars")
+            return text_content
+        else:
+            print("⚠️ Method 1 trả về nội dung rỗng")
+    except Exception as e:
+        print(f"⚠️ Method 1 failed: {e}")
+    
+    # Method 2: Sử dụng PyPDF2
+    try:
+        import PyPDF2
+        page_texts = []
+        with open(pdf_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            for page in pdf_reader.pages:
+                page_texts.append(page.extract_text() + "\n")
+        text_content = "".join(page_texts)
+        
+        if text_content and text_content.strip():
+            print(f"✅ Method 2 thành công: {len(text_content)} chars")
+            return text_content
+        else:
+            print("⚠️ Method 2 trả về nội dung rỗng")
+    except Exception as e:
+        print(f"⚠️ Method 2 failed: {e}")
+    
+    # Method 3: Sử dụng pdfplumber
+    try:
+        import pdfplumber
+        page_texts = []
+        with pdfplumber.open(pdf_path) as pdf:
+            for page in pdf.pages:
+                page_text = page.extract_text()
+                if page_text:
+                    page_texts.append(page_text + "\n")
+        text_content = "".join(page_texts)
+        
+        if text_content and text_content.strip():
+            print(f"✅ Method 3 thành công: {len(text_content)} chars")
+            return text_content
+        else:
+            print("⚠️ Method 3 trả về nội dung rỗng")
+    except Exception as e:
+        print(f"⚠️ Method 3 failed: {e}")
+    
+    return ""
+
+def split_text_into_chunks(text, max_tokens=None):
+    """Chia text thành chunks theo token (trọn câu, kèm số trang), bỏ chunks quá ngắn"""
+    return chunk_text(text, max_tokens=max_tokens)
+
+def _append_embeddings(embedding_batches, encode_fn, batch):
+    """Embed 1 batch chunks, None nếu encode_fn không có model (dừng embed)"""
+    vectors = encode_fn(batch)
+    if vectors is None:
+        return None
+    embedding_batches.append(np.asarray(vectors, dtype=np.float32))
+    return embedding_batches
+
+def embed_chunk_stream(chunk_stream, encode_fn=None, batch_size=None):
+    """Tiêu thụ stream chunks, embed từng batch ngay khi đủ batch_size chunks
+
+    Args:
+        encode_fn: list[str] -> np.ndarray (n, dim), trả về None nếu không có model; None = không embed
+
+    Returns:
+        (chunks, embeddings): embeddings None nếu không embed
+    """
+    batch_size = batch_size or EMBEDDING_BATCH_SIZE
+    chunks = []
+    embedding_batches = [] if encode_fn is not None else None
+    embedded = 0
+    for chunk in chunk_stream:
+        chunks.append(chunk)
+        if embedding_batches is not None and len(chunks) - embedded >= batch_size:
+            embedding_batches = _append_embeddings(embedding_batches, encode_fn, chunks[embedded:])
+            embedded = len(chunks)
+    if embedding_batches is not None and len(chunks) > embedded:
+        embedding_batches = _append_embeddings(embedding_batches, encode_fn, chunks[embedded:])
+
+    if embedding_batches is None:
+        return chunks, None
+    if not embedding_batches:
+        return chunks, np.zeros((0, embedding_dim()), dtype=np.float32)
+    return chunks, np.vstack(embedding_batches)
+
+def extract_and_embed(pdf_path, encode_fn=None, executor=None, page_workers=1, batch_size=None):
+    """PDF -> (content, chunks, embeddings) theo stream: trang -> làm sạch -> chunks -> embeddings theo batch
+    
+    Chunks của các trang đầu được embed trong lúc các trang sau còn đang trích xuất (trong executor
+    hoặc page_workers process). Segment các trang ghi ra file tạm (PageSpool), content chỉ được đọc
+    lại 1 lần ở cuối. Nếu pdfToText không dùng được thì fallback về extract_pdf_text.
+    
+    Args:
+        encode_fn: list[str] -> np.ndarray (n, dim) hoặc None (không có model); None = chỉ chunk
+        executor: process pool chạy các task trích xuất theo trang (vd: extraction pool của server)
+        page_workers: số process trích xuất theo trang (số worker của executor nếu có)
+    
+    Returns:
+        (content, chunks, embeddings): embeddings None nếu không embed
+    """
+    try:
+        from pdfToText import iter_pdf_pages, iter_clean_pages, PageSpool
+        with PageSpool() as spool:
+            pages = iter_clean_pages(spool.track(iter_pdf_pages(pdf_path, page_workers, executor)))
+            chunks, embeddings = embed_chunk_stream(iter_chunks(pages), encode_fn, batch_size)
+            content = spool.content()
+        if content.strip():
+            if len(content.strip()) < 100:
+                return content, [], None
+            return content, chunks, embeddings
+        print("⚠️ Streaming extraction trả về nội dung rỗng")
+    except Exception as e:
+        print(f"⚠️ Streaming extraction failed: {e}")
+    
+    content = extract_pdf_text(pdf_path, page_workers=1)
+    if len(content.strip()) < 100:
+        return content, [], None
+    pages = ((page_num, clean_page_text(page_text)) for page_num, page_text in split_pages(content.strip()))
+    chunks, embeddings = embed_chunk_stream(iter_chunks(pages), encode_fn, batch_size)
+    return content, chunks, embeddings
 
 # Test function
 def test_simple_generator():
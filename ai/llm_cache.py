@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+🗄️ LLM Response Cache
+Cache response của LLM trên đĩa (SQLite), key = (model, digest prompt, temperature, max_tokens, seed):
+- Retry / request lặp lại / test chạy lại với cùng prompt không tốn thêm API call
+- Bỏ entry dùng ít gần đây nhất khi vượt số entries hoặc dung lượng
+- Mặc định chỉ cache lời gọi có kết quả lặp lại được (temperature 0 hoặc có seed):
+  response sampling không seed mà bị replay thì retry / top-up bank chỉ nhận lại đúng response cũ.
+- Tạo câu hỏi (genQ, temperature 0.7) mặc định có seed QUESTION_LLM_SEED (mỗi lần gửi lại cùng
+  prompt dùng seed kế tiếp) nên được cache; QUESTION_LLM_SEED=off để gửi không seed (không cache).
+- Chat bot (temperature 0.7, không seed) không qua cache này mà dùng answer cache, trừ khi đặt
+  LLM_SEED (seed cho mọi lời gọi, vd: load test replay không tốn phí) hoặc LLM_CACHE=all.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# deterministic: chỉ temperature 0 hoặc có seed | all: mọi lời gọi | off
+LLM_CACHE_MODE = os.getenv('LLM_CACHE', 'deterministic').lower()
+LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', 'cache/llm_responses.sqlite3')
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '20000'))
+LLM_CACHE_MAX_MB = float(os.getenv('LLM_CACHE_MAX_MB', '200'))
+
+
+def seed_from_env(name, default=None):
+    """Seed từ biến môi trường, None nếu rỗng / off"""
+    value = os.getenv(name, default or '').strip().lower()
+    return None if value in ('', 'off', 'none') else int(value)
+
+
+# Seed mặc định gửi kèm mọi lời gọi (None = không gửi)
+LLM_SEED = seed_from_env('LLM_SEED')
+# Seed gốc của lời gọi tạo câu hỏi khi không đặt LLM_SEED
+QUESTION_LLM_SEED = seed_from_env('QUESTION_LLM_SEED', '0')
+
+CACHE_MODES = ("deterministic", "all", "off")
+
+
+def prompt_digest(prompt):
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+
+def response_key(model, prompt, temperature, max_tokens, seed=None):
+    """Key cache của 1 lời gọi chat completions"""
+    parts = [model, prompt_digest(prompt), round(float(temperature), 4), int(max_tokens), seed]
+    return hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()
+
+
+def is_cacheable(temperature, seed=None, mode=None):
+    """Lời gọi có được cache theo mode không"""
+    mode = mode or LLM_CACHE_MODE
+    if mode == "all":
+        return True
+    if mode == "deterministic":
+        return temperature == 0 or seed is not None
+    return False
+
+
+class LLMResponseCache:
+    """Bảng SQLite key -> response, LRU theo last_used, giới hạn số entries và tổng bytes"""
+
+    def __init__(self, path=None, max_entries=None, max_bytes=None):
+        self.path = path or LLM_CACHE_PATH
+        self.max_entries = max_entries or LLM_CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes or int(LLM_CACHE_MAX_MB * 1024 * 1024)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, prompt_digest TEXT, temperature REAL, "
+                "max_tokens INTEGER, seed INTEGER, response TEXT, size INTEGER, "
+                "created REAL, last_used REAL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+            self.conn.commit()
+            self._refresh_totals()
+
+    def _refresh_totals(self):
+        self.count, self.total_bytes = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+
+    def get(self, key, count_miss=True):
+        """Response đã cache (đánh dấu vừa dùng), None nếu chưa có"""
+        with self.lock:
+            row = self.conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                if count_miss:
+                    self.misses += 1
+                return None
+            self.conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, response, model=None, prompt=None, temperature=None, max_tokens=None, seed=None):
+        size = len(response.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self.lock:
+            previous = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, model, prompt_digest(prompt) if prompt is not None else None,
+                 temperature, max_tokens, seed, response, size, now, now)
+            )
+            self.conn.commit()
+            if previous is None:
+                self.count += 1
+                self.total_bytes += size
+            else:
+                self.total_bytes += size - previous[0]
+            if self.count > self.max_entries or self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Xóa entries dùng ít gần đây nhất tới khi dưới cả 2 giới hạn"""
+        # Process khác có thể đã ghi cùng file: tính lại tổng từ DB
+        self._refresh_totals()
+        removed = []
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY last_used ASC"):
+            if self.count <= self.max_entries and self.total_bytes <= self.max_bytes:
+                break
+            removed.append((key,))
+            self.count -= 1
+            self.total_bytes -= size
+        if removed:
+            self.conn.executemany("DELETE FROM responses WHERE key = ?", removed)
+            self.conn.commit()
+            self.evictions += len(removed)
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM responses")
+            self.conn.commit()
+            self.count, self.total_bytes = 0, 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'mode': LLM_CACHE_MODE,
+            'path': self.path,
+            'entries': self.count,
+            'size_mb': round(self.total_bytes / (1024 * 1024), 3),
+            'max_entries': self.max_entries,
+            'max_mb': round(self.max_bytes / (1024 * 1024), 3),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions,
+            'seed': LLM_SEED,
+            'question_seed': LLM_SEED if LLM_SEED is not None else QUESTION_LLM_SEED
+        }
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_llm_response_cache():
+    """LLMResponseCache dùng chung cho cả process, None nếu LLM_CACHE=off"""
+    global _response_cache
+    if LLM_CACHE_MODE not in CACHE_MODES or LLM_CACHE_MODE == "off":
+        return None
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = LLMResponseCache()
+        return _response_cache
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+🔌 Shared LLM Client
+Client OpenAI dùng chung cho generator, server và chat bot:
+- Connection pool keep-alive (HTTP/2 nếu cài httpx[http2])
+- Giới hạn số request in-flight
+- Retry exponential backoff, tôn trọng header Retry-After
+- Cache response trên đĩa (llm_cache) cho các lời gọi lặp lại được
+"""
+
+import os
+import time
+import random
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+from dotenv import load_dotenv
+
+from llm_cache import get_llm_response_cache, response_key, is_cacheable, LLM_SEED
+
+try:
+    import httpx
+    HAS_HTTPX = True
+except ImportError:
+    import requests
+    from requests.adapters import HTTPAdapter
+    HAS_HTTPX = False
+
+try:
+    import h2  # noqa: F401 - chỉ cần để bật HTTP/2 trong httpx
+    HAS_HTTP2 = HAS_HTTPX
+except ImportError:
+    HAS_HTTP2 = False
+
+# Load environment variables
+load_dotenv()
+
+OPENAI_CHAT_URL = os.getenv('OPENAI_CHAT_URL', "https://api.openai.com/v1/chat/completions")
+DEFAULT_MODEL = os.getenv('OPENAI_MODEL', "gpt-3.5-turbo")
+LLM_MAX_IN_FLIGHT = int(os.getenv('LLM_MAX_IN_FLIGHT', '8'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '4'))
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '60'))
+LLM_BACKOFF_BASE = 1.0
+LLM_BACKOFF_MAX = 30.0
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """Lỗi gọi LLM (sau khi đã hết retry hoặc lỗi không retry được)"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def parse_retry_after(value):
+    """Parse header Retry-After (số giây hoặc HTTP date) -> số giây, None nếu không hợp lệ"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Thời gian chờ trước lần retry thứ `attempt` (0-based)"""
+    if retry_after is not None:
+        return min(retry_after, LLM_BACKOFF_MAX)
+    delay = LLM_BACKOFF_BASE * (2 ** attempt)
+    return min(delay, LLM_BACKOFF_MAX) * (0.5 + random.random() / 2)  # jitter
+
+
+class LLMClient:
+    """Client chat completions với connection pool dùng chung"""
+
+    def __init__(self, api_key=None, url=OPENAI_CHAT_URL, timeout=LLM_TIMEOUT,
+                 max_in_flight=LLM_MAX_IN_FLIGHT, max_retries=LLM_MAX_RETRIES, response_cache=None):
+        self.api_key = api_key or os.getenv('OPENAI_API_KEY')
+        self.url = url
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.response_cache = response_cache if response_cache is not None else get_llm_response_cache()
+
+        self._lock = threading.Lock()
+        self._sync_client = None
+        self._sync_semaphore = threading.BoundedSemaphore(max_in_flight)
+
+    # ----- helpers -----
+    def _headers(self):
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+
+    @staticmethod
+    def build_payload(prompt, max_tokens, temperature, model=None, seed=None):
+        """Tạo body request chat completions"""
+        payload = {
+            "model": model or DEFAULT_MODEL,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }
+        if seed is not None:
+            payload["seed"] = seed
+        return payload
+
+    def _cache_key(self, prompt, max_tokens, temperature, model, seed):
+        """Key cache của lời gọi, None nếu không dùng cache cho lời gọi này"""
+        if self.response_cache is None or not is_cacheable(temperature, seed):
+            return None
+        return response_key(model or DEFAULT_MODEL, prompt, temperature, max_tokens, seed)
+
+    def _store(self, key, content, payload):
+        if key is None:
+            return
+        try:
+            self.response_cache.put(key, content, payload["model"], payload["messages"][0]["content"],
+                                    payload["temperature"], payload["max_tokens"], payload.get("seed"))
+        except Exception as e:
+            print(f"⚠️ Không lưu được LLM response cache: {e}")
+
+    def get_cached(self, prompt, max_tokens=1000, temperature=0.7, model=None, seed=None):
+        """Response đã cache của lời gọi (không gọi API), None nếu chưa có"""
+        seed = LLM_SEED if seed is None else seed
+        key = self._cache_key(prompt, max_tokens, temperature, model, seed)
+        return self.response_cache.get(key, count_miss=False) if key else None
+
+    @staticmethod
+    def extract_content(result):
+        """Lấy nội dung message từ JSON response"""
+        if 'choices' in result and len(result['choices']) > 0:
+            return result['choices'][0]['message']['content']
+        raise LLMError(f"Response không có choices: {str(result)[:200]}")
+
+    def _get_sync_client(self):
+        with self._lock:
+            if self._sync_client is None:
+                if HAS_HTTPX:
+                    limits = httpx.Limits(
+                        max_connections=self.max_in_flight,
+                        max_keepalive_connections=self.max_in_flight
+                    )
+                    self._sync_client = httpx.Client(http2=HAS_HTTP2, limits=limits, timeout=self.timeout)
+                else:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_in_flight)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._sync_client = session
+            return self._sync_client
+
+    # ----- sync API -----
+    def chat(self, prompt, max_tokens=1000, temperature=0.7, model=None, seed=None, use_cache=True):
+        """Gọi chat completions (blocking), trả về nội dung text hoặc raise LLMError
+
+        seed: gửi kèm request và là 1 phần của cache key (None = LLM_SEED)
+        """
+        seed = LLM_SEED if seed is None else seed
+        key = self._cache_key(prompt, max_tokens, temperature, model, seed) if use_cache else None
+        if key:
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                return cached
+        if not self.api_key:
+            raise LLMError("Không tìm thấy OPENAI_API_KEY")
+
+        payload = self.build_payload(prompt, max_tokens, temperature, model, seed)
+        client = self._get_sync_client()
+
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                with self._sync_semaphore:
+                    if HAS_HTTPX:
+                        response = client.post(self.url, headers=self._headers(), json=payload)
+                    else:
+                        response = client.post(self.url, headers=self._headers(), json=payload, timeout=self.timeout)
+
+                if response.status_code == 200:
+                    content = self.extract_content(response.json())
+                    self._store(key, content, payload)
+                    return content
+
+                if response.status_code not in RETRYABLE_STATUS or attempt == self.max_retries:
+                    raise LLMError(f"API Error {response.status_code}: {response.text[:500]}", response.status_code)
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                print(f"⚠️ LLM API {response.status_code}, retry {attempt + 1}/{self.max_retries}...")
+
+            except LLMError:
+                raise
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise LLMError(f"Lỗi kết nối LLM: {str(e)}")
+                print(f"⚠️ LLM connection error ({e}), retry {attempt + 1}/{self.max_retries}...")
+
+            time.sleep(backoff_delay(attempt, retry_after))
+
+        raise LLMError("Hết số lần retry")
+
+    def close(self):
+        """Đóng connection pool"""
+        with self._lock:
+            if self._sync_client is not None:
+                self._sync_client.close()
+                self._sync_client = None
+
+
+# Process-wide client
+_llm_client = None
+_llm_client_lock = threading.Lock()
+
+
+def get_llm_client():
+    """Lấy LLMClient dùng chung cho cả process (lazy init)"""
+    global _llm_client
+    with _llm_client_lock:
+        if _llm_client is None:
+            _llm_client = LLMClient()
+        return _llm_client
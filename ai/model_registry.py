@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+🧠 Model Registry
+Embedding model dùng chung cho cả process (server, generator, chat bot):
+- Mỗi model chỉ load 1 lần (lazy, thread-safe)
+- Warm-up encode lúc startup để request đầu không chịu cold-start
+- Ghi lại thời gian load và RSS để theo dõi bộ nhớ
+"""
+
+import os
+import sys
+import time
+import threading
+
+import numpy as np
+from dotenv import load_dotenv
+
+try:
+    from sentence_transformers import SentenceTransformer
+    HAS_SENTENCE_TRANSFORMERS = True
+except ImportError:
+    HAS_SENTENCE_TRANSFORMERS = False
+
+try:
+    import psutil
+    HAS_PSUTIL = True
+except ImportError:
+    HAS_PSUTIL = False
+
+# Load environment variables
+load_dotenv()
+
+EMBEDDING_MODEL_NAME = os.getenv('EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+# Embedding trên CPU theo batch
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '64'))
+# Số chiều của all-MiniLM-L6-v2, chỉ dùng khi chưa cài sentence-transformers
+DEFAULT_EMBEDDING_DIM = 384
+
+_models = {}
+_model_dims = {}
+_model_stats = {}
+_registry_lock = threading.Lock()
+_model_locks = {}
+
+
+def current_rss_mb():
+    """RSS hiện tại của process (MB), None nếu không đo được"""
+    if HAS_PSUTIL:
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux trả về KB, macOS trả về bytes (đây là peak, không phải RSS hiện tại)
+        return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+    except ImportError:
+        return None
+
+
+def get_model(name=None):
+    """Lấy SentenceTransformer theo tên (load 1 lần/process), None nếu chưa cài sentence-transformers"""
+    name = name or EMBEDDING_MODEL_NAME
+    if not HAS_SENTENCE_TRANSFORMERS:
+        return None
+
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    # Lock riêng từng model: load model này không chặn người dùng model khác
+    with _registry_lock:
+        model_lock = _model_locks.setdefault(name, threading.Lock())
+
+    with model_lock:
+        if name not in _models:
+            print(f"🔄 Đang tải mô hình embedding {name}...")
+            rss_before = current_rss_mb()
+            start = time.perf_counter()
+            _models[name] = SentenceTransformer(name)
+            load_seconds = time.perf_counter() - start
+            rss_after = current_rss_mb()
+
+            _model_stats[name] = {
+                'load_seconds': round(load_seconds, 3),
+                'rss_mb_after_load': round(rss_after, 1) if rss_after is not None else None,
+                'rss_mb_delta': round(rss_after - rss_before, 1) if None not in (rss_before, rss_after) else None,
+                'warmed_up': False,
+                'warmup_seconds': None
+            }
+            print(f"✅ Đã tải {name} trong {load_seconds:.2f}s")
+        return _models[name]
+
+
+def embedding_dim(name=None):
+    """Số chiều embedding của model (đọc từ model đã load), DEFAULT_EMBEDDING_DIM nếu không có model"""
+    name = name or EMBEDDING_MODEL_NAME
+    if name in _model_dims:
+        return _model_dims[name]
+    try:
+        model = get_model(name)
+    except Exception as e:
+        print(f"⚠️ Không tải được model {name} ({e}), dùng số chiều mặc định {DEFAULT_EMBEDDING_DIM}")
+        return DEFAULT_EMBEDDING_DIM
+    if model is None:
+        return DEFAULT_EMBEDDING_DIM
+    dim = model.get_sentence_embedding_dimension() if hasattr(model, 'get_sentence_embedding_dimension') else None
+    if not dim:
+        dim = np.asarray(model.encode(["dim"], show_progress_bar=False)).shape[1]
+    _model_dims[name] = int(dim)
+    return _model_dims[name]
+
+
+def encode_texts(texts, batch_size=None, name=None):
+    """Embed danh sách text theo batch -> ma trận float32 (n, dim) đã chuẩn hóa L2
+
+    Raises:
+        RuntimeError: nếu chưa cài sentence-transformers
+    """
+    model = get_model(name)
+    if model is None:
+        raise RuntimeError("Chưa cài sentence-transformers (pip install sentence-transformers)")
+    if not len(texts):
+        return np.zeros((0, embedding_dim(name)), dtype=np.float32)
+
+    embeddings = model.encode(
+        list(texts),
+        batch_size=batch_size or EMBEDDING_BATCH_SIZE,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=False
+    )
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def warm_up(names=None):
+    """Load các model và chạy 1 lần encode để khởi tạo kernel/threads
+
+    Returns:
+        dict: stats của registry sau warm-up
+    """
+    for name in names or [EMBEDDING_MODEL_NAME]:
+        model = get_model(name)
+        if model is None:
+            print("⚠️ Chưa cài sentence-transformers, bỏ qua warm-up")
+            break
+        start = time.perf_counter()
+        model.encode(["warm up"], show_progress_bar=False)
+        _model_stats[name]['warmed_up'] = True
+        _model_stats[name]['warmup_seconds'] = round(time.perf_counter() - start, 3)
+    return get_registry_stats()
+
+
+def get_registry_stats():
+    """Thông tin các model đã load (thời gian load, RSS) cho health check"""
+    rss = current_rss_mb()
+    return {
+        'available': HAS_SENTENCE_TRANSFORMERS,
+        'default_model': EMBEDDING_MODEL_NAME,
+        'loaded_models': {name: dict(stats) for name, stats in _model_stats.items()},
+        'process_rss_mb': round(rss, 1) if rss is not None else None
+    }
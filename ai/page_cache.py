@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+📑 Page Cache
+Xử lý lại theo trang khi cùng tài liệu được upload lại (vd: sửa 1 trang của handout):
+- Mỗi trang có fingerprint bytes (content stream) và hash text đã làm sạch
+- Trang có bytes không đổi -> dùng lại text cũ, không trích xuất lại
+- Trang có text không đổi -> dùng lại chunks + dòng embeddings cũ, không chunk/encode lại
+- Chunks không vắt qua 2 trang nên mỗi trang sở hữu 1 khoảng dòng [chunk_start, chunk_end)
+- Câu hỏi gắn source_pages: chỉ câu hỏi từ các trang đã đổi bị loại bỏ
+
+Manifest mỗi phiên bản: list record theo trang
+{page, bytes_hash, text_hash, status, start, end, chunk_start, chunk_end}
+(start/end: vị trí segment của trang trong content).
+"""
+
+import hashlib
+
+import numpy as np
+
+from pdfToText import (open_pdf_reader, page_header, page_fingerprint, extract_page_segment,
+                       iter_pdf_pages, PDFExtractionError)
+from text_chunker import Chunk, clean_page_text, iter_chunks
+from vector_index import as_float32, take_rows
+from embedding_store import get_chunk_embedding_cache
+from model_registry import encode_texts, embedding_dim, HAS_SENTENCE_TRANSFORMERS
+
+
+def text_digest(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def encode_chunks(texts):
+    """Embeddings cho chunks mới qua cache theo hash text, None nếu không có model"""
+    if not HAS_SENTENCE_TRANSFORMERS:
+        return None
+    return get_chunk_embedding_cache().encode(texts, encode_texts)
+
+
+def _previous_bodies(previous_pages, previous_content):
+    """bytes_hash -> (phần text sau header, status) của các trang trích xuất được ở phiên bản trước"""
+    bodies = {}
+    for record in previous_pages or []:
+        if record.get('bytes_hash') and record['status'] != "failed":
+            segment = previous_content[record['start']:record['end']]
+            header = page_header(record['page'] - 1)
+            if segment.startswith(header):
+                bodies[record['bytes_hash']] = (segment[len(header):], record['status'])
+    return bodies
+
+
+def ingest_pdf_pages(pdf_path, previous_pages=None, previous_content="", page_workers=1):
+    """Worker cho extraction process pool: PDF -> content + manifest trang + chunks của các trang mới
+
+    Args:
+        previous_pages: manifest trang của phiên bản trước (None = xử lý toàn bộ)
+        previous_content: content đã cache của phiên bản trước (để lấy lại text các trang không đổi)
+        page_workers: process theo trang (mặc định 1: đang chạy trong extraction pool)
+
+    Returns:
+        dict {content, pages, chunks: {page: [Chunk]}, reextracted, rechunked}
+        hoặc None nếu PyPDF2 không đọc được file (caller dùng extraction thường)
+    """
+    try:
+        with open(pdf_path, 'rb') as file:
+            fingerprints = [page_fingerprint(page) for page in open_pdf_reader(file).pages]
+    except Exception as e:
+        print(f"⚠️ Không đọc được trang PDF ({e}), bỏ qua xử lý theo trang")
+        return None
+
+    bodies = _previous_bodies(previous_pages, previous_content)
+    to_extract = [page_num for page_num, fingerprint in enumerate(fingerprints) if fingerprint not in bodies]
+
+    segments = {}
+    try:
+        if len(to_extract) == len(fingerprints):
+            # Không có gì dùng lại: trích xuất toàn bộ (song song theo trang với PDF lớn)
+            segments = {page_num: (segment, status) for page_num, segment, status in iter_pdf_pages(pdf_path, page_workers)}
+        elif to_extract:
+            with open(pdf_path, 'rb') as file:
+                pdf_reader = open_pdf_reader(file)
+                segments = {page_num: extract_page_segment(pdf_reader, page_num) for page_num in to_extract}
+    except PDFExtractionError as e:
+        print(f"⚠️ {e}")
+        return None
+
+    known_texts = {record['text_hash'] for record in previous_pages or [] if record.get('text_hash')}
+    parts, records, new_pages = [], [], []
+    offset = 0
+    for page_num, fingerprint in enumerate(fingerprints):
+        if page_num in segments:
+            segment, status = segments[page_num]
+        else:
+            body, status = bodies[fingerprint]
+            segment = page_header(page_num) + body
+
+        text = clean_page_text(segment) if status == "ok" else ""
+        text_hash = text_digest(text) if text else None
+        if text_hash and text_hash not in known_texts:
+            new_pages.append((page_num + 1, text))
+
+        parts.append(segment)
+        records.append({
+            'page': page_num + 1,
+            'bytes_hash': fingerprint,
+            'text_hash': text_hash,
+            'status': status,
+            'start': offset,
+            'end': offset + len(segment)
+        })
+        offset += len(segment)
+
+    chunks = {page: [] for page, _ in new_pages}
+    for chunk in iter_chunks(new_pages, page_aligned=True):
+        chunks[chunk.page_start].append(chunk)
+
+    return {
+        'content': "".join(parts),
+        'pages': records,
+        'chunks': chunks,
+        'reextracted': len(to_extract),
+        'rechunked': len(new_pages)
+    }
+
+
+def assemble_chunks(ingest, previous_pages=None, previous_chunks=None, previous_embeddings=None,
+                    encode_fn=encode_chunks):
+    """Ghép chunks + embeddings của phiên bản mới: trang có text không đổi lấy lại khoảng dòng cũ
+
+    Args:
+        ingest: kết quả ingest_pdf_pages (record trang được bổ sung chunk_start/chunk_end)
+        encode_fn: list[str] -> np.ndarray (n, dim) cho chunks mới, None nếu không có model
+
+    Returns:
+        (chunks, embeddings, changed_pages): embeddings rỗng (0, dim) nếu không có model;
+        changed_pages là các trang (số trang mới) phải chunk/encode lại
+    """
+    previous_ranges = {}
+    if previous_chunks is not None:
+        for record in previous_pages or []:
+            if record.get('text_hash') and 'chunk_start' in record:
+                previous_ranges.setdefault(record['text_hash'], (record['chunk_start'], record['chunk_end']))
+    can_reuse_rows = previous_embeddings is not None and len(previous_embeddings) == len(previous_chunks or [])
+
+    chunks, reused_rows, new_rows = [], [], []
+    changed_pages = []
+    for record in ingest['pages']:
+        record['chunk_start'] = len(chunks)
+        page = record['page']
+        if record['text_hash'] is None:
+            page_chunks = []
+        elif page not in ingest['chunks'] and record['text_hash'] in previous_ranges:
+            start, end = previous_ranges[record['text_hash']]
+            # Trang có thể đổi số trang (chèn/xóa trang phía trước)
+            page_chunks = [Chunk(str(previous_chunks[row]), page) for row in range(start, end)]
+            reused_rows.extend(zip(range(len(chunks), len(chunks) + len(page_chunks)), range(start, end)))
+        else:
+            page_chunks = ingest['chunks'].get(page)
+            if page_chunks is None:
+                # Text đã biết nhưng chunks cũ không đọc được: chunk lại trang này
+                text = clean_page_text(ingest['content'][record['start']:record['end']])
+                page_chunks = list(iter_chunks([(page, text)], page_aligned=True))
+            changed_pages.append(page)
+            new_rows.extend(range(len(chunks), len(chunks) + len(page_chunks)))
+        chunks.extend(page_chunks)
+        record['chunk_end'] = len(chunks)
+
+    if not chunks:
+        return chunks, np.zeros((0, embedding_dim()), dtype=np.float32), changed_pages
+
+    if not can_reuse_rows:
+        # Embeddings cũ không dùng được (chưa có model lúc đó): encode lại toàn bộ
+        new_rows = list(range(len(chunks)))
+        reused_rows = []
+
+    new_vectors = encode_fn([chunks[row] for row in new_rows]) if new_rows else None
+    if new_rows and new_vectors is None:
+        # Không có model: vẫn tạo câu hỏi được, chỉ không có retrieval
+        return chunks, np.zeros((0, embedding_dim()), dtype=np.float32), changed_pages
+
+    dim = new_vectors.shape[1] if new_vectors is not None else previous_embeddings.shape[1]
+    embeddings = np.zeros((len(chunks), dim), dtype=np.float32)
+    if new_rows:
+        embeddings[new_rows] = new_vectors
+    if reused_rows:
+        targets, sources = zip(*reused_rows)
+        embeddings[list(targets)] = as_float32(take_rows(previous_embeddings, np.asarray(sources)))
+    return chunks, embeddings, changed_pages
+
+
+def page_remap(previous_pages, pages):
+    """Số trang cũ -> số trang mới của các trang có text không đổi"""
+    new_page_of = {}
+    for record in pages:
+        if record.get('text_hash'):
+            new_page_of.setdefault(record['text_hash'], record['page'])
+    return {
+        record['page']: new_page_of[record['text_hash']]
+        for record in previous_pages or []
+        if record.get('text_hash') in new_page_of
+    }
+
+
+def carry_over_questions(questions, previous_pages, pages):
+    """Câu hỏi của phiên bản trước mà mọi trang nguồn đều không đổi (source_pages theo số trang mới)"""
+    remap = page_remap(previous_pages, pages)
+    kept = []
+    for question in questions or []:
+        source_pages = question.get('source_pages')
+        if not source_pages or any(page not in remap for page in source_pages):
+            continue
+        kept.append({**question, 'source_pages': sorted({remap[page] for page in source_pages})})
+    return kept
+
+
+def select_pages(content, chunks, embeddings, pages, page_numbers):
+    """(content, chunks, embeddings) chỉ gồm các trang page_numbers (để tạo câu hỏi cho trang đã đổi)"""
+    wanted = set(page_numbers)
+    records = [record for record in pages if record['page'] in wanted]
+    rows = [row for record in records for row in range(record['chunk_start'], record['chunk_end'])]
+    selected_content = "".join(content[record['start']:record['end']] for record in records)
+    selected_embeddings = as_float32(take_rows(embeddings, np.asarray(rows, dtype=np.int64))) if len(embeddings) == len(chunks) else embeddings
+    return selected_content, [chunks[row] for row in rows], selected_embeddings
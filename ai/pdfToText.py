@@ -1,144 +1,332 @@
 import PyPDF2
 import os
+import hashlib
 import sys
+import tempfile
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-def pdf_to_text(pdf_path, output_path="pdfToText.txt"):
+# Làm sạch + chunking dùng chung engine text_chunker (token-aware, theo câu/trang)
+from text_chunker import clean_page_text, iter_chunks
+
+# Số process cho page-parallel extraction (mặc định = số CPU)
+PDF_PAGE_WORKERS = int(os.getenv('PDF_PAGE_WORKERS', str(os.cpu_count() or 1)))
+# Chỉ chia process khi PDF đủ lớn (chi phí spawn + parse lại PDF ở mỗi worker)
+PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', '32'))
+# Số trang mỗi task khi chạy song song (task nhỏ -> trang đầu tiên được stream ra sớm hơn)
+PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', '16'))
+# Số task chạy trước mỗi worker: giới hạn số trang đã trích xuất nhưng chưa được tiêu thụ
+TASKS_AHEAD_PER_WORKER = int(os.getenv('PDF_TASKS_AHEAD_PER_WORKER', '2'))
+
+PAGE_SEPARATOR = '=' * 50
+
+def open_pdf_reader(file):
+    """Mở PdfReader, thử lại với strict=False nếu lỗi"""
+    try:
+        return PyPDF2.PdfReader(file)
+    except Exception as e:
+        print(f"❌ Lỗi đọc PDF: {str(e)}")
+        print("💡 Thử với strict=False...")
+        return PyPDF2.PdfReader(file, strict=False)
+
+def page_header(page_num, failed=False):
+    """Header của trang (page_num 0-based) trong nội dung text"""
+    suffix = " - LỖI" if failed else ""
+    return f"\n{PAGE_SEPARATOR}\nTRANG {page_num + 1}{suffix}\n{PAGE_SEPARATOR}\n"
+
+def page_fingerprint(page):
+    """SHA-256 của content stream (đã giải nén) của 1 trang, không cần trích xuất text
+
+    Không hash resources: số hiệu object thay đổi mỗi lần PDF được ghi lại. None nếu không đọc được.
+    """
+    try:
+        contents = page.get_contents()
+        return hashlib.sha256(contents.get_data() if contents is not None else b'').hexdigest()
+    except Exception:
+        return None
+
+def pdf_page_fingerprints(pdf_path):
+    """Fingerprint bytes của từng trang theo thứ tự trang"""
+    with open(pdf_path, 'rb') as file:
+        pdf_reader = open_pdf_reader(file)
+        return [page_fingerprint(page) for page in pdf_reader.pages]
+
+def extract_page_segment(pdf_reader, page_num):
+    """Trích xuất 1 trang kèm header
+
+    Returns:
+        (segment, status) với status: "ok", "empty" hoặc "failed"
+    """
+    try:
+        page = pdf_reader.pages[page_num]
+        
+        # Thử nhiều cách extract text
+        page_text = ""
+        try:
+            page_text = page.extract_text()
+        except Exception as e1:
+            try:
+                # Thử cách khác
+                page_text = page.extractText()  # Phương thức cũ
+            except Exception as e2:
+                page_text = f"[TRANG {page_num + 1}: KHÔNG THỂ TRÍCH XUẤT TEXT]"
+        
+        # Thêm header cho mỗi trang
+        header = page_header(page_num)
+        
+        if page_text.strip():
+            return header + page_text + "\n", "ok"
+        return header + "[TRANG TRỐNG HOẶC KHÔNG CÓ TEXT]\n", "empty"
+        
+    except Exception as e:
+        # Thêm thông báo lỗi vào nội dung
+        return page_header(page_num, failed=True) + f"[LỖI TRÍCH XUẤT: {str(e)}]\n", "failed"
+
+def extract_page_range(pdf_path, start_page, end_page):
+    """Worker: trích xuất các trang [start_page, end_page) trong process riêng"""
+    try:
+        with open(pdf_path, 'rb') as file:
+            pdf_reader = open_pdf_reader(file)
+            return [extract_page_segment(pdf_reader, page_num) for page_num in range(start_page, end_page)]
+    except Exception as e:
+        return [
+            (page_header(page_num, failed=True) + f"[LỖI TRÍCH XUẤT: {str(e)}]\n", "failed")
+            for page_num in range(start_page, end_page)
+        ]
+
+def split_page_ranges(num_pages, num_parts):
+    """Chia [0, num_pages) thành num_parts đoạn liên tiếp gần bằng nhau"""
+    num_parts = max(1, min(num_parts, num_pages))
+    base, remainder = divmod(num_pages, num_parts)
+    ranges = []
+    start = 0
+    for i in range(num_parts):
+        end = start + base + (1 if i < remainder else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+class PDFExtractionError(Exception):
+    """Lỗi không mở được PDF hoặc không xác định được số trang"""
+
+def iter_pdf_pages(pdf_path, workers=None, executor=None):
     """
-    Chuyển đổi file PDF sang text và lưu vào file với xử lý lỗi robust
+    Generator trích xuất PDF theo từng trang (giữ đúng thứ tự trang)
     
     Args:
         pdf_path (str): Đường dẫn đến file PDF
-        output_path (str): Đường dẫn file output (mặc định: pdfToText.txt)
+        workers (int): Số process trích xuất song song theo trang (mặc định: PDF_PAGE_WORKERS)
+        executor: process pool có sẵn để chạy các task trích xuất (vd: extraction pool của server),
+            None = tự tạo pool khi PDF đủ lớn
+    
+    Yields:
+        (page_num, segment, status): page_num 0-based, segment = header + text của trang,
+        status là "ok", "empty" hoặc "failed"
+    """
+    # Mở file PDF với nhiều cách xử lý lỗi
+    print(f"📄 Đang mở PDF: {pdf_path}")
+    
+    with open(pdf_path, 'rb') as file:
+        try:
+            pdf_reader = open_pdf_reader(file)
+        except Exception as e2:
+            raise PDFExtractionError(f"Vẫn lỗi: {str(e2)}")
+        
+        # Kiểm tra số trang
+        try:
+            num_pages = len(pdf_reader.pages)
+            print(f"📑 PDF có {num_pages} trang")
+        except Exception as e:
+            raise PDFExtractionError(f"Không thể xác định số trang: {str(e)}")
+        
+        workers = PDF_PAGE_WORKERS if workers is None else workers
+        if executor is None and (workers <= 1 or num_pages < PARALLEL_MIN_PAGES):
+            print(f"🔄 Đang xử lý {num_pages} trang...")
+            for page_num in range(num_pages):
+                segment, status = extract_page_segment(pdf_reader, page_num)
+                yield page_num, segment, status
+            return
+    
+    # Page-parallel: mỗi task trích xuất 1 đoạn trang liên tiếp, kết quả trả về theo thứ tự
+    workers = max(1, workers)
+    num_tasks = max(workers if executor is None else 1, -(-num_pages // max(1, PAGES_PER_TASK)))
+    page_ranges = split_page_ranges(num_pages, min(num_tasks, max(1, num_pages)))
+    print(f"⚡ Trích xuất song song {num_pages} trang với {workers} processes ({len(page_ranges)} tasks)")
+    if executor is not None:
+        yield from _iter_page_tasks(executor, pdf_path, page_ranges, workers)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from _iter_page_tasks(pool, pdf_path, page_ranges, workers)
+
+def _iter_page_tasks(executor, pdf_path, page_ranges, workers):
+    """Submit các task trích xuất theo cửa sổ (tối đa TASKS_AHEAD_PER_WORKER task/worker chưa được tiêu thụ)"""
+    pending = deque()
+    next_range = 0
+    max_pending = max(1, workers * TASKS_AHEAD_PER_WORKER)
+    try:
+        while pending or next_range < len(page_ranges):
+            while next_range < len(page_ranges) and len(pending) < max_pending:
+                start, end = page_ranges[next_range]
+                pending.append((start, executor.submit(extract_page_range, pdf_path, start, end)))
+                next_range += 1
+            start, future = pending.popleft()
+            for offset, (segment, status) in enumerate(future.result()):
+                yield start + offset, segment, status
+    finally:
+        # Consumer dừng giữa chừng: hủy các task chưa chạy
+        for _, future in pending:
+            future.cancel()
+
+# ===== STREAMING PIPELINE: trang -> làm sạch -> chunks -> batches =====
+def iter_clean_pages(pages):
+    """Nhận stream (page_num, segment, status), yield (số trang 1-based, text đã làm sạch) của các trang có nội dung"""
+    for page_num, segment, status in pages:
+        if status != "ok":
+            continue
+        text = clean_page_text(segment)
+        if text:
+            yield page_num + 1, text
+
+class PageSpool:
+    """Ghi segment từng trang ra file tạm ngay khi trích xuất, thay cho list segments trong RAM
+
+    manifest: list {page, status, start, end} (vị trí ký tự của segment trong content),
+    content chỉ được đọc lại 1 lần sau khi đã chunk/embed xong.
+    """
+
+    def __init__(self):
+        self.file = tempfile.TemporaryFile(mode='w+', encoding='utf-8', newline='')
+        self.manifest = []
+        self.length = 0
+
+    def track(self, pages):
+        """Nhận stream (page_num, segment, status), ghi segment ra file rồi chuyển tiếp nguyên trang"""
+        for page_num, segment, status in pages:
+            self.file.write(segment)
+            self.manifest.append({
+                'page': page_num + 1,
+                'status': status,
+                'start': self.length,
+                'end': self.length + len(segment)
+            })
+            self.length += len(segment)
+            yield page_num, segment, status
+
+    def status_counts(self):
+        return Counter(record['status'] for record in self.manifest)
+
+    def content(self):
+        """Toàn bộ content (các segment nối liền theo manifest)"""
+        self.file.flush()
+        self.file.seek(0)
+        content = self.file.read()
+        self.file.seek(0, os.SEEK_END)
+        return content
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def iter_batches(items, batch_size):
+    """Gom stream thành các list tối đa batch_size phần tử"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def pdf_to_text(pdf_path, output_path=None, workers=None):
+    """
+    Chuyển đổi file PDF sang text với xử lý lỗi robust
+    
+    Args:
+        pdf_path (str): Đường dẫn đến file PDF
+        output_path (str): Nếu có, lưu thêm text vào file này (mặc định: không ghi file)
+        workers (int): Số process trích xuất song song theo trang (mặc định: PDF_PAGE_WORKERS)
+    
+    Returns:
+        str: Text của toàn bộ PDF (kèm header từng trang), None nếu thất bại
     """
     try:
         # Kiểm tra file PDF có tồn tại không
         if not os.path.exists(pdf_path):
             print(f"❌ Lỗi: Không tìm thấy file PDF: {pdf_path}")
-            return False
+            return None
         
-        # Mở file PDF với nhiều cách xử lý lỗi
-        print(f"📄 Đang mở PDF: {pdf_path}")
+        # Trích xuất text từ tất cả các trang với xử lý lỗi từng trang (segment ghi ra file tạm)
+        with PageSpool() as spool:
+            for _ in spool.track(iter_pdf_pages(pdf_path, workers)):
+                pass
+            text_content = spool.content()
+            manifest = spool.manifest
         
-        with open(pdf_path, 'rb') as file:
-            try:
-                pdf_reader = PyPDF2.PdfReader(file)
-            except Exception as e:
-                print(f"❌ Lỗi đọc PDF: {str(e)}")
-                print("💡 Thử với strict=False...")
-                try:
-                    pdf_reader = PyPDF2.PdfReader(file, strict=False)
-                except Exception as e2:
-                    print(f"❌ Vẫn lỗi: {str(e2)}")
-                    return False
-            
-            # Kiểm tra số trang
-            try:
-                num_pages = len(pdf_reader.pages)
-                print(f"� PDF có {num_pages} trang")
-            except Exception as e:
-                print(f"❌ Không thể xác định số trang: {str(e)}")
-                return False
-            
-            # Trích xuất text từ tất cả các trang với xử lý lỗi từng trang
-            text_content = ""
-            successful_pages = 0
-            failed_pages = []
-            
-            for page_num in range(num_pages):
-                try:
-                    print(f"🔄 Đang xử lý trang {page_num + 1}/{num_pages}...", end="")
-                    
-                    page = pdf_reader.pages[page_num]
-                    
-                    # Thử nhiều cách extract text
-                    page_text = ""
-                    try:
-                        page_text = page.extract_text()
-                    except Exception as e1:
-                        print(f" [Lỗi method 1: {str(e1)[:50]}]", end="")
-                        try:
-                            # Thử cách khác
-                            page_text = page.extractText()  # Phương thức cũ
-                        except Exception as e2:
-                            print(f" [Lỗi method 2: {str(e2)[:50]}]", end="")
-                            page_text = f"[TRANG {page_num + 1}: KHÔNG THỂ TRÍCH XUẤT TEXT]"
-                    
-                    # Thêm header cho mỗi trang
-                    text_content += f"\n{'='*50}\n"
-                    text_content += f"TRANG {page_num + 1}\n"
-                    text_content += f"{'='*50}\n"
-                    
-                    if page_text.strip():
-                        text_content += page_text + "\n"
-                        successful_pages += 1
-                        print(" ✅")
-                    else:
-                        text_content += f"[TRANG TRỐNG HOẶC KHÔNG CÓ TEXT]\n"
-                        print(" ⚠️ (trống)")
-                    
-                except Exception as e:
-                    failed_pages.append(page_num + 1)
-                    print(f" ❌ Lỗi: {str(e)[:50]}")
-                    
-                    # Thêm thông báo lỗi vào nội dung
-                    text_content += f"\n{'='*50}\n"
-                    text_content += f"TRANG {page_num + 1} - LỖI\n"
-                    text_content += f"{'='*50}\n"
-                    text_content += f"[LỖI TRÍCH XUẤT: {str(e)}]\n"
-                    
-                    # Thử tiếp trang tiếp theo thay vì dừng
-                    continue
-            
-            # Lưu text vào file
+        num_pages = len(manifest)
+        successful_pages = sum(1 for record in manifest if record['status'] == "ok")
+        failed_pages = [record['page'] for record in manifest if record['status'] == "failed"]
+        
+        # Lưu text vào file (tùy chọn)
+        if output_path:
             try:
                 with open(output_path, 'w', encoding='utf-8') as output_file:
                     output_file.write(text_content)
                 print(f"💾 Đã lưu text vào: {output_path}")
             except Exception as e:
                 print(f"❌ Lỗi lưu file: {str(e)}")
-                return False
-            
-            # Thống kê chi tiết
-            char_count = len(text_content)
-            word_count = len(text_content.split())
-            
-            print(f"\n🎉 HOÀN THÀNH!")
-            print(f"📊 Thống kê:")
-            print(f"   - Tổng số trang: {num_pages}")
-            print(f"   - Trang xử lý thành công: {successful_pages}")
-            print(f"   - Trang bị lỗi: {len(failed_pages)}")
-            if failed_pages:
-                print(f"   - Các trang lỗi: {failed_pages}")
-            print(f"   - Số ký tự: {char_count:,}")
-            print(f"   - Số từ: {word_count:,}")
+                return None
+        
+        # Thống kê chi tiết
+        char_count = len(text_content)
+        word_count = len(text_content.split())
+        
+        print(f"\n🎉 HOÀN THÀNH!")
+        print(f"📊 Thống kê:")
+        print(f"   - Tổng số trang: {num_pages}")
+        print(f"   - Trang xử lý thành công: {successful_pages}")
+        print(f"   - Trang bị lỗi: {len(failed_pages)}")
+        if failed_pages:
+            print(f"   - Các trang lỗi: {failed_pages}")
+        print(f"   - Số ký tự: {char_count:,}")
+        print(f"   - Số từ: {word_count:,}")
+        if output_path:
             print(f"   - File đầu ra: {output_path}")
             print(f"   - Kích thước: {os.path.getsize(output_path):,} bytes")
+        
+        # Cảnh báo nếu có trang lỗi
+        if failed_pages:
+            print(f"\n⚠️ CẢNH BÁO: {len(failed_pages)} trang không thể xử lý!")
+            print("💡 Gợi ý:")
+            print("   - PDF có thể bị hỏng hoặc mã hóa")
+            print("   - Thử với PDF reader khác")
+            print("   - Kiểm tra quyền truy cập file")
+        
+        return text_content
             
-            # Cảnh báo nếu có trang lỗi
-            if failed_pages:
-                print(f"\n⚠️ CẢNH BÁO: {len(failed_pages)} trang không thể xử lý!")
-                print("💡 Gợi ý:")
-                print("   - PDF có thể bị hỏng hoặc mã hóa")
-                print("   - Thử với PDF reader khác")
-                print("   - Kiểm tra quyền truy cập file")
-            
-            return True
-            
+    except PDFExtractionError as e:
+        print(f"❌ {str(e)}")
+        return None
     except MemoryError:
         print("❌ Lỗi: Không đủ bộ nhớ để xử lý PDF")
         print("💡 Gợi ý: Thử với file PDF nhỏ hơn hoặc tăng RAM")
-        return False
+        return None
     except FileNotFoundError:
         print(f"❌ Lỗi: Không tìm thấy file: {pdf_path}")
-        return False
+        return None
     except PermissionError:
         print(f"❌ Lỗi: Không có quyền truy cập file: {pdf_path}")
-        return False
+        return None
     except Exception as e:
         print(f"❌ Lỗi không xác định: {str(e)}")
         print(f"❌ Type: {type(e).__name__}")
-        return False
+        return None
 
 def main():
     """
@@ -180,9 +368,9 @@ def main():
     
     # Xử lý PDF
     print(f"\n🚀 Bắt đầu xử lý: {pdf_path}")
-    success = pdf_to_text(pdf_path)
+    text_content = pdf_to_text(pdf_path, output_path="pdfToText.txt")
     
-    if success:
+    if text_content is not None:
         print("\n✅ Chuyển đổi thành công!")
     else:
         print("\n❌ Chuyển đổi thất bại!")
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+📚 Project Corpus
+Gộp chunk embeddings của tất cả file trong 1 project (project_id) thành 1 index chung:
+- Thêm file = thêm 1 segment (memory-mapped từ embedding store, không copy)
+- Xóa file = dựng lại index từ các file còn lại
+- Query theo topic trả về chunks liên quan nhất trên toàn project
+
+Manifest mỗi project lưu ở `<projects_dir>/<project_id>.json`, vectors nằm trong embedding store
+của từng file nên không bị lưu lặp lại.
+"""
+
+import os
+import re
+import json
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from embedding_store import EmbeddingStore
+from model_registry import encode_texts
+from vector_index import create_index
+
+PROJECT_CORPUS_DIR = os.getenv('PROJECT_CORPUS_DIR', 'cache/projects')
+
+PROJECT_ID_PATTERN = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+class ProjectCorpus:
+    """Index chung cho các file của 1 project"""
+
+    def __init__(self, project_id, manifest_path):
+        self.project_id = project_id
+        self.manifest_path = Path(manifest_path)
+        self.lock = threading.RLock()
+        self.files = self._load_manifest()
+        # Dựng lazily ở lần query đầu tiên
+        self.index = None
+        self.segments = []  # [(file_key, chunks, start_row)]
+
+    # ----- manifest -----
+    def _load_manifest(self):
+        try:
+            if self.manifest_path.exists():
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    return json.load(f).get('files', {})
+        except Exception as e:
+            print(f"⚠️ Lỗi đọc manifest project {self.project_id}: {e}")
+        return {}
+
+    def _save_manifest(self):
+        """Ghi manifest (atomic replace)"""
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix(".json.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'project_id': self.project_id,
+                'updated': datetime.now().isoformat(),
+                'files': self.files
+            }, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    # ----- index -----
+    def _load_segment(self, file_key):
+        """(embeddings, chunks) của 1 file, None nếu store đã mất hoặc không có embeddings"""
+        store = EmbeddingStore(self.files[file_key]['store'])
+        if not store.exists():
+            return None
+        try:
+            embeddings, chunks = store.load()
+        except ValueError as e:
+            print(f"⚠️ Bỏ qua {file_key}: {e}")
+            return None
+        if not len(embeddings):
+            return None
+        return embeddings, chunks
+
+    def _append_segment(self, file_key):
+        segment = self._load_segment(file_key)
+        if segment is None:
+            return
+        embeddings, chunks = segment
+        start_row = len(self.index)
+        self.index.add(embeddings)
+        self.segments.append((file_key, chunks, start_row))
+
+    def _rebuild(self):
+        self.index = create_index()
+        self.segments = []
+        for file_key in self.files:
+            self._append_segment(file_key)
+
+    def _ensure_index(self):
+        if self.index is None:
+            self._rebuild()
+        return self.index
+
+    # ----- public API -----
+    def add_file(self, file_key, file_name, store_path):
+        """Thêm (hoặc cập nhật) 1 file vào corpus
+
+        Args:
+            file_key: cache key của file (content digest hoặc tên file ở chế độ legacy)
+            store_path: prefix EmbeddingStore chứa embeddings + chunks của file
+        """
+        with self.lock:
+            existing = self.files.get(file_key)
+            if existing and existing['store'] == str(store_path):
+                if existing['file_name'] != file_name:
+                    existing['file_name'] = file_name
+                    self._save_manifest()
+                return False
+
+            self.files[file_key] = {
+                'file_name': file_name,
+                'store': str(store_path),
+                'added': datetime.now().isoformat()
+            }
+            self._save_manifest()
+
+            if self.index is not None:
+                if existing:
+                    self._rebuild()
+                else:
+                    self._append_segment(file_key)
+            return True
+
+    def remove_file(self, file_key):
+        """Bỏ 1 file khỏi corpus, trả về False nếu file không thuộc project"""
+        with self.lock:
+            if self.files.pop(file_key, None) is None:
+                return False
+            self._save_manifest()
+            if self.index is not None:
+                self._rebuild()
+            return True
+
+    def search(self, query_embeddings, top_k=5):
+        """Top-k chunks trên toàn project cho từng query embedding
+
+        Returns:
+            list[list[dict]]: mỗi hit có text, pages, similarity, file_key, file_name, chunk_index
+        """
+        with self.lock:
+            index = self._ensure_index()
+            if not len(index):
+                return [[] for _ in range(len(query_embeddings))]
+            segments = list(self.segments)
+            results = index.search(query_embeddings, top_k)
+
+        starts = np.array([start for _, _, start in segments])
+        all_hits = []
+        for ids, scores in results:
+            hits = []
+            for row, score in zip(ids, scores):
+                file_key, chunks, start_row = segments[np.searchsorted(starts, row, side='right') - 1]
+                chunk = chunks[row - start_row]
+                hits.append({
+                    'text': str(chunk),
+                    'pages': getattr(chunk, 'pages', None),
+                    'similarity': float(score),
+                    'file_key': file_key,
+                    'file_name': self.files.get(file_key, {}).get('file_name'),
+                    'chunk_index': int(row - start_row)
+                })
+            all_hits.append(hits)
+        return all_hits
+
+    def query_many(self, topics, top_k=5):
+        """Chunks liên quan nhất cho nhiều topic: 1 lần encode + 1 lần score cho cả batch"""
+        if not len(topics):
+            return []
+        return self.search(encode_texts(topics), top_k)
+
+    def query(self, topic, top_k=5):
+        """Chunks liên quan nhất tới topic trên toàn project"""
+        return self.query_many([topic], top_k)[0]
+
+    def relevant_contents(self, topics, num_chunks=3):
+        """Text ghép từ các chunks liên quan nhất của từng topic (dùng làm context cho prompt)"""
+        return ["\n\n".join(hit['text'] for hit in hits) for hits in self.query_many(topics, num_chunks)]
+
+    def relevant_content(self, topic, num_chunks=3):
+        return self.relevant_contents([topic], num_chunks)[0]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'project_id': self.project_id,
+                'files': [
+                    {'file_key': key, **info} for key, info in self.files.items()
+                ],
+                'indexed_chunks': len(self.index) if self.index is not None else None,
+                'index_kind': self.index.kind if self.index is not None else None
+            }
+
+
+class ProjectCorpusRegistry:
+    """Quản lý corpus theo project_id (1 instance / project trong process)"""
+
+    def __init__(self, projects_dir=None):
+        self.projects_dir = Path(projects_dir or PROJECT_CORPUS_DIR)
+        self.projects_dir.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.corpora = {}
+
+    def manifest_path(self, project_id):
+        safe_id = PROJECT_ID_PATTERN.sub('_', project_id)
+        return self.projects_dir / f"{safe_id}.json"
+
+    def exists(self, project_id):
+        return project_id in self.corpora or self.manifest_path(project_id).exists()
+
+    def get(self, project_id):
+        with self.lock:
+            corpus = self.corpora.get(project_id)
+            if corpus is None:
+                corpus = ProjectCorpus(project_id, self.manifest_path(project_id))
+                self.corpora[project_id] = corpus
+            return corpus
+
+    def delete(self, project_id):
+        """Xóa corpus của project (embedding store của các file được giữ nguyên)"""
+        with self.lock:
+            self.corpora.pop(project_id, None)
+            manifest_path = self.manifest_path(project_id)
+            if manifest_path.exists():
+                manifest_path.unlink()
+                return True
+            return False
+
+    def list_projects(self):
+        """project_id gốc đọc từ manifest (tên file đã bị thay ký tự đặc biệt)"""
+        projects = []
+        for path in self.projects_dir.glob("*.json"):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    projects.append(json.load(f).get('project_id', path.stem))
+            except Exception:
+                projects.append(path.stem)
+        return sorted(projects)
+
+    def clear(self):
+        with self.lock:
+            self.corpora.clear()
+            for path in self.projects_dir.glob("*.json"):
+                path.unlink()
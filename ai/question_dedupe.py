@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+🧹 Question Dedupe
+Loại câu hỏi trùng trong kết quả (giữa các batch và giữa các file):
+- Trùng chính xác: hash của câu hỏi đã chuẩn hóa (không cần encode)
+- Gần trùng (paraphrase): cosine giữa embeddings câu hỏi >= ngưỡng, tính 1 lần cho cả tập
+- Chỉ tạo thay thế cho các slot bị loại, không chạy lại cả request
+"""
+
+import os
+import hashlib
+
+import numpy as np
+
+from answer_cache import normalize_question
+from model_registry import encode_texts, HAS_SENTENCE_TRANSFORMERS
+
+# Cosine tối thiểu để coi 2 câu hỏi trắc nghiệm là một
+QUESTION_DEDUPE_SIMILARITY = float(os.getenv('QUESTION_DEDUPE_SIMILARITY', '0.9'))
+# Số lần tạo thay thế tối đa cho các slot bị loại
+QUESTION_DEDUPE_ROUNDS = int(os.getenv('QUESTION_DEDUPE_ROUNDS', '2'))
+
+
+def question_text(question):
+    """Nội dung câu hỏi (dict của generator hoặc model Question của API)"""
+    if isinstance(question, dict):
+        return question.get("question", "")
+    return getattr(question, "question", "") or str(question)
+
+
+def question_hash(question):
+    return hashlib.sha1(normalize_question(question_text(question)).encode('utf-8')).hexdigest()
+
+
+def is_protected(question):
+    """Câu hỏi fallback (template) luôn được giữ: loại đi chỉ sinh lại đúng template đó"""
+    return isinstance(question, dict) and bool(question.get("is_fallback"))
+
+
+class QuestionDeduper:
+    """Giữ tập câu hỏi đã chấp nhận (hash + embeddings), lọc các câu mới trùng với tập này"""
+
+    def __init__(self, existing=None, threshold=None):
+        self.threshold = threshold or QUESTION_DEDUPE_SIMILARITY
+        self.use_embeddings = HAS_SENTENCE_TRANSFORMERS
+        self.hashes = set()
+        self.embeddings = None
+        self.exact_removed = 0
+        self.near_removed = 0
+        if existing:
+            self.filter(existing)
+        # Chỉ đếm câu bị loại trong kết quả mới (không tính trùng trong existing)
+        self.exact_removed = 0
+        self.near_removed = 0
+
+    def _encode(self, questions):
+        if not self.use_embeddings or not questions:
+            return None
+        try:
+            return encode_texts([question_text(q) for q in questions])
+        except Exception as e:
+            print(f"⚠️ Không encode được câu hỏi ({e}), chỉ lọc trùng chính xác")
+            self.use_embeddings = False
+            return None
+
+    def filter(self, questions):
+        """Các câu trong questions không trùng tập đã giữ và không trùng nhau (giữ câu xuất hiện trước)
+
+        Câu được giữ được thêm vào tập đã giữ.
+
+        Returns:
+            (kept, removed_indices)
+        """
+        # Trùng chính xác
+        candidates = []
+        removed = []
+        batch_hashes = set()
+        for index, question in enumerate(questions):
+            if is_protected(question):
+                continue
+            key = question_hash(question)
+            if key in self.hashes or key in batch_hashes:
+                removed.append(index)
+                self.exact_removed += 1
+            else:
+                batch_hashes.add(key)
+                candidates.append(index)
+
+        # Gần trùng: 1 phép nhân ma trận với tập đã giữ + 1 phép trong batch
+        vectors = self._encode([questions[i] for i in candidates])
+        keep = np.ones(len(candidates), dtype=bool)
+        if vectors is not None and len(candidates):
+            if self.embeddings is not None and len(self.embeddings):
+                keep &= (vectors @ self.embeddings.T).max(axis=1) < self.threshold
+            # Câu sau trùng câu trước (còn được giữ) trong cùng batch -> loại câu sau
+            within = np.triu(vectors @ vectors.T, k=1) >= self.threshold
+            for j in range(1, len(candidates)):
+                if keep[j] and np.any(within[:j, j] & keep[:j]):
+                    keep[j] = False
+            self.near_removed += int((~keep).sum())
+
+        kept_set = set()
+        for position, index in enumerate(candidates):
+            if keep[position]:
+                kept_set.add(index)
+                self.hashes.add(question_hash(questions[index]))
+            else:
+                removed.append(index)
+        if vectors is not None and keep.any():
+            kept_vectors = vectors[keep]
+            self.embeddings = kept_vectors if self.embeddings is None else np.vstack([self.embeddings, kept_vectors])
+
+        kept = [q for index, q in enumerate(questions) if is_protected(q) or index in kept_set]
+        return kept, sorted(removed)
+
+    def stats(self):
+        return {
+            'kept': len(self.hashes),
+            'exact_removed': self.exact_removed,
+            'near_removed': self.near_removed
+        }
+
+
+def dedupe_questions(questions, replace_fn=None, existing=None, threshold=None, max_rounds=None):
+    """Loại câu trùng, rồi gọi replace_fn chỉ cho số slot bị loại (các câu thay thế cũng được lọc)
+
+    Args:
+        questions: list câu hỏi (dict hoặc Question)
+        replace_fn: (removed_indices, round) -> list câu hỏi thay thế, phần tử j thay cho slot
+            removed_indices[j] (None = slot đó không tạo được); None = chỉ loại trùng
+        existing: các câu đã chấp nhận trước đó (vd: câu của file khác) mà câu mới không được trùng
+
+    Returns:
+        (kept, deduper): kept có tối đa len(questions) câu
+    """
+    max_rounds = QUESTION_DEDUPE_ROUNDS if max_rounds is None else max_rounds
+    deduper = QuestionDeduper(existing, threshold)
+    kept, removed = deduper.filter(questions)
+
+    for round_index in range(max_rounds):
+        if not removed or replace_fn is None:
+            break
+        print(f"🧹 Loại {len(removed)} câu trùng, tạo {len(removed)} câu thay thế (lượt {round_index + 1})")
+        replacements = (replace_fn(removed, round_index) or [])[:len(removed)]
+        filled = [j for j, question in enumerate(replacements) if question is not None]
+        if not filled:
+            break
+        accepted, rejected = deduper.filter([replacements[j] for j in filled])
+        kept.extend(accepted)
+        # Slot còn thiếu = slot có câu thay thế bị loại hoặc không được tạo
+        missing = set(range(len(removed))) - set(filled)
+        missing.update(filled[position] for position in rejected)
+        removed = [slot for j, slot in enumerate(removed) if j in missing]
+
+    return kept[:len(questions)], deduper
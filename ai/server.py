@@ -13,10 +13,16 @@ import asyncio
 import hashlib
 import logging
 import shutil
+import threading
 import time
+import multiprocessing
+import queue
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from urllib.parse import urlparse
 
 # FastAPI và dependencies
@@ -24,9 +30,18 @@ from fastapi import FastAPI, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, validator
+import numpy as np
 import requests
 import uvicorn
 
+from downloader import get_downloader, DownloadError, VALIDATION_FRESH, VALIDATION_STALE
+from embedding_store import EmbeddingStore, EMBEDDING_QUANTIZATION, get_chunk_embedding_cache
+from model_registry import warm_up, get_registry_stats
+from project_corpus import ProjectCorpusRegistry
+from page_cache import ingest_pdf_pages, assemble_chunks, carry_over_questions, select_pages, encode_chunks
+from question_dedupe import dedupe_questions, QuestionDeduper
+from llm_cache import get_llm_response_cache
+
 # Load environment variables
 from dotenv import load_dotenv
 load_dotenv()
@@ -41,7 +56,7 @@ logger = logging.getLogger(__name__)
 # Import module genQ fix
 import importlib.util
 try:
-    from genQ_simple_fix import SimpleQuestionGenerator
+    from genQ_simple_fix import SimpleQuestionGenerator, extract_and_embed
     GENERATOR_TYPE = "simple_fix"
     logger.info("Using SimpleQuestionGenerator (API error fix)")
 except ImportError:
@@ -81,7 +96,7 @@ class FileInput(BaseModel):
 class GenerateQuestionsRequest(BaseModel):
     """Model cho request tạo câu hỏi từ nhiều file"""
     files: List[FileInput]
-    project_id: str  # Accept nhưng chưa dùng
+    project_id: str  # Các file cùng project dùng chung 1 corpus index
     total_questions: int
     name: str  # Accept nhưng chưa dùng
     
@@ -99,6 +114,63 @@ class GenerateQuestionsRequest(BaseModel):
             raise ValueError('Số câu hỏi phải từ 1 đến 300')
         return v
 
+class IngestRequest(BaseModel):
+    """Model cho request ingest trước (tạo sẵn bank câu hỏi trong nền)"""
+    files: List[FileInput]
+    project_id: str = ""
+    bank_size: Optional[int] = None  # None = PREGENERATE_BANK_SIZE
+    
+    @validator('files')
+    def validate_files(cls, v):
+        if not v or len(v) == 0:
+            raise ValueError('Cần ít nhất 1 file')
+        if len(v) > 10:
+            raise ValueError('Tối đa 10 files cùng lúc')
+        return v
+    
+    @validator('bank_size')
+    def validate_bank_size(cls, v):
+        if v is not None and (v < 1 or v > 300):
+            raise ValueError('bank_size phải từ 1 đến 300')
+        return v
+
+class ProjectQueryRequest(BaseModel):
+    """Model cho request tìm nội dung theo topic trong project"""
+    topic: str
+    top_k: int = 5
+    
+    @validator('topic')
+    def validate_topic(cls, v):
+        if not v or not v.strip():
+            raise ValueError('Topic không được để trống')
+        return v.strip()
+    
+    @validator('top_k')
+    def validate_top_k(cls, v):
+        if v < 1 or v > 50:
+            raise ValueError('top_k phải từ 1 đến 50')
+        return v
+
+class ProjectBatchQueryRequest(BaseModel):
+    """Model cho request tìm nội dung cho nhiều topic (1 lần encode + score cho cả batch)"""
+    topics: List[str]
+    top_k: int = 5
+    
+    @validator('topics')
+    def validate_topics(cls, v):
+        topics = [topic.strip() for topic in v if topic and topic.strip()]
+        if not topics:
+            raise ValueError('Cần ít nhất 1 topic')
+        if len(topics) > 200:
+            raise ValueError('Tối đa 200 topics mỗi request')
+        return topics
+    
+    @validator('top_k')
+    def validate_top_k(cls, v):
+        if v < 1 or v > 50:
+            raise ValueError('top_k phải từ 1 đến 50')
+        return v
+
 # ===== LEGACY MODELS (keep for backward compatibility) =====
 class QuestionRequest(BaseModel):
     """Model cho request tạo câu hỏi (legacy - single file)"""
@@ -156,6 +228,7 @@ class FileProcessingResult(BaseModel):
     error_message: Optional[str] = None
     processing_time: Optional[float] = None
     from_cache: bool = False
+    cache_key: Optional[str] = None  # content digest (content-addressed) hoặc None (legacy)
 
 class QuestionMetadata(BaseModel):
     """Metadata cho response (legacy)"""
@@ -189,6 +262,78 @@ app.add_middleware(
 # Storage cho task status
 task_storage: Dict[str, TaskStatus] = {}
 
+# ===== CONCURRENCY LIMITS =====
+# Số file xử lý song song trong 1 request, và giới hạn riêng cho từng stage
+# (số lời gọi LLM đồng thời: LLM_CONCURRENCY, giới hạn theo từng lời gọi trong generator)
+MAX_FILE_WORKERS = int(os.getenv('MAX_FILE_WORKERS', '10'))
+DOWNLOAD_CONCURRENCY = int(os.getenv('DOWNLOAD_CONCURRENCY', '4'))
+EXTRACTION_CONCURRENCY = int(os.getenv('EXTRACTION_CONCURRENCY', str(os.cpu_count() or 2)))
+
+download_semaphore = threading.BoundedSemaphore(DOWNLOAD_CONCURRENCY)
+extraction_semaphore = threading.BoundedSemaphore(EXTRACTION_CONCURRENCY)
+
+# Load + warm-up embedding model lúc startup (request đầu không chịu cold-start)
+EMBEDDING_WARMUP = os.getenv('EMBEDDING_WARMUP', 'true').lower() == 'true'
+
+# ===== BACKGROUND PRE-GENERATION =====
+# Số câu hỏi tạo sẵn cho mỗi tài liệu sau khi ingest / tải lần đầu
+PREGENERATE_BANK_SIZE = int(os.getenv('PREGENERATE_BANK_SIZE', '50'))
+# Tự xếp hàng tạo bank khi 1 tài liệu được tải lần đầu trong request tạo câu hỏi
+PREGENERATE_ON_DOWNLOAD = os.getenv('PREGENERATE_ON_DOWNLOAD', 'true').lower() == 'true'
+# Chu kỳ kiểm tra (giây) khi worker nền đang nhường cho request của user
+PREGENERATE_IDLE_POLL = float(os.getenv('PREGENERATE_IDLE_POLL', '0.5'))
+# Bank được tạo theo từng bước nhỏ, giữa các bước worker nhường cho request của user
+PREGENERATE_STEP = int(os.getenv('PREGENERATE_STEP', '10'))
+
+# ===== EXTRACTION PROCESS POOL =====
+# PDF -> text + chunking là CPU-bound (giữ GIL), chạy trong process riêng
+EXTRACTION_WORKERS = int(os.getenv('EXTRACTION_WORKERS', str(os.cpu_count() or 2)))
+# Process theo trang trong mỗi extraction worker: chia phần CPU còn lại (mặc định 1, không lồng pool)
+EXTRACTION_PAGE_WORKERS = max(1, (os.cpu_count() or 1) // max(1, EXTRACTION_WORKERS))
+
+_extraction_pool: Optional[ProcessPoolExecutor] = None
+_extraction_pool_lock = threading.Lock()
+
+def get_extraction_pool() -> ProcessPoolExecutor:
+    """Lấy process pool cho extraction (lazy init, dùng spawn để an toàn với threads)"""
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is None:
+            _extraction_pool = ProcessPoolExecutor(
+                max_workers=max(1, EXTRACTION_WORKERS),
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            logger.info(f"Khởi tạo extraction pool với {EXTRACTION_WORKERS} processes")
+        return _extraction_pool
+
+def shutdown_extraction_pool():
+    """Dừng extraction pool"""
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is not None:
+            _extraction_pool.shutdown(wait=False, cancel_futures=True)
+            _extraction_pool = None
+
+def run_extraction(pdf_path: str) -> Tuple[str, List[str], Optional[np.ndarray]]:
+    """PDF -> (content, chunks, embeddings) theo stream (blocking, gọi từ worker thread)
+
+    Các task trích xuất theo trang chạy trong extraction pool; thread gọi làm sạch, chunk và
+    embed từng batch chunks trong lúc các trang sau còn đang trích xuất.
+    """
+    return extract_and_embed(pdf_path, encode_chunks, executor=get_extraction_pool(),
+                             page_workers=max(1, EXTRACTION_WORKERS))
+
+def run_page_ingestion(pdf_path: str, previous_pages: Optional[List[Dict]] = None,
+                       previous_content: str = "") -> Optional[Dict]:
+    """Extraction + chunking theo trang trong process pool, dùng lại các trang không đổi của phiên bản trước"""
+    return get_extraction_pool().submit(
+        ingest_pdf_pages, pdf_path, previous_pages, previous_content, EXTRACTION_PAGE_WORKERS
+    ).result()
+
+async def run_extraction_async(pdf_path: str) -> Tuple[str, List[str], Optional[np.ndarray]]:
+    """Await PDF extraction + chunking + embeddings từ event loop"""
+    return await asyncio.to_thread(run_extraction, pdf_path)
+
 # ===== HELPER FUNCTIONS =====
 def load_question_generator():
     """Load question generator (with API error fix)"""
@@ -208,27 +353,16 @@ def load_question_generator():
         raise HTTPException(status_code=500, detail=f"Lỗi khởi tạo hệ thống: {str(e)}")
 
 async def download_file_from_url(url: str, local_path: str) -> bool:
-    """Download file từ URL về local"""
+    """Download file từ URL về local (async streaming, không block event loop)"""
     try:
         logger.info(f"Đang tải file từ: {url}")
         
-        # Sử dụng requests để download
-        response = requests.get(url, stream=True, timeout=300)  # 5 phút timeout
-        response.raise_for_status()
-        
-        # Lưu file
-        with open(local_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-        
-        # Kiểm tra file size
-        file_size = os.path.getsize(local_path)
-        logger.info(f"Đã tải file thành công: {file_size:,} bytes")
+        result = await get_downloader().download(url, local_path)
+        logger.info(f"Đã tải file thành công: {result['size']:,} bytes")
         
         return True
         
-    except requests.exceptions.RequestException as e:
+    except DownloadError as e:
         logger.error(f"Lỗi download file: {str(e)}")
         return False
     except Exception as e:
@@ -307,30 +441,33 @@ async def process_pdf_questions_async(task_id: str, s3_url: str, total_question:
         # Load question generator
         generator = load_question_generator()
         
-        # Chuyển đổi PDF sang text
-        if not generator.convert_pdf_to_text(temp_pdf_path):
+        # Chuyển đổi PDF sang text + chunking (process pool, không block event loop)
+        pdf_content, chunks, embeddings = await run_extraction_async(temp_pdf_path)
+        if not pdf_content.strip():
             raise Exception("Không thể chuyển đổi PDF sang text")
+        generator.pdf_content = pdf_content
         
         # Cập nhật progress
         task_storage[task_id].progress = 50
         task_storage[task_id].message = "Đang tạo embeddings..."
         
-        # Tạo embeddings
-        if not generator.create_embeddings():
+        # Tạo embeddings (chạy trong thread, không block event loop)
+        if not await asyncio.to_thread(generator.create_embeddings, chunks, embeddings):
             raise Exception("Không thể tạo embeddings")
         
         # Cập nhật progress
         task_storage[task_id].progress = 70
         task_storage[task_id].message = "Đang tạo câu hỏi..."
         
-        # Tạo câu hỏi với generator đơn giản
+        # Tạo câu hỏi (blocking: gọi LLM theo batch) trong thread, không block event loop
+        document_summary = None
         if GENERATOR_TYPE == "simple_fix":
-            questions_data = generator.generate_questions_simple(total_question)
+            questions_data = await asyncio.to_thread(generator.generate_questions_simple, total_question)
         else:
             # Tạo tóm tắt
-            document_summary = generator.generate_document_summary()
+            document_summary = await asyncio.to_thread(generator.generate_document_summary)
             # Tạo câu hỏi
-            questions_data = generator.generate_questions(total_question)
+            questions_data = await asyncio.to_thread(generator.generate_questions, total_question)
         
         if not questions_data or not questions_data.get("questions"):
             raise Exception("Không thể tạo câu hỏi từ tài liệu")
@@ -374,8 +511,12 @@ async def process_pdf_questions_async(task_id: str, s3_url: str, total_question:
         except:
             pass
 
-def download_pdf_from_url(url: str) -> str:
-    """Download PDF từ URL (S3 hoặc web) hoặc copy từ local file"""
+def download_pdf_with_metadata(url: str) -> Tuple[str, str, Dict]:
+    """Download PDF và tính SHA-256 ngay trong lúc stream
+
+    Returns:
+        (temp_path, digest, response_headers)
+    """
     try:
         # Kiểm tra nếu là local file path
         if url.startswith('file://') or (len(url) > 3 and url[1] == ':'):
@@ -386,82 +527,205 @@ def download_pdf_from_url(url: str) -> str:
                 raise HTTPException(status_code=400, detail=f"File không tồn tại: {local_path}")
             
             # Copy file to temp location
-            temp_dir = tempfile.gettempdir()
-            temp_filename = f"temp_pdf_{hashlib.md5(local_path.encode()).hexdigest()[:8]}.pdf"
-            temp_path = os.path.join(temp_dir, temp_filename)
+            fd, temp_path = tempfile.mkstemp(prefix="temp_pdf_", suffix=".pdf")
+            os.close(fd)
             
-            import shutil
             shutil.copy2(local_path, temp_path)
+            digest = MultiFileCache.compute_content_digest(temp_path)
             
             logger.info(f"Đã copy local file: {local_path} -> {temp_path}")
-            return temp_path
+            return temp_path, digest, {}
         
         # URL download
         logger.info(f"Đang download PDF từ: {url}")
         
-        # Tạo temp file
-        temp_dir = tempfile.gettempdir()
-        temp_filename = f"temp_pdf_{hashlib.md5(url.encode()).hexdigest()[:8]}.pdf"
-        temp_path = os.path.join(temp_dir, temp_filename)
-        
-        # Download file
-        response = requests.get(url, stream=True, timeout=300, headers={
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
-        response.raise_for_status()
+        # Temp file riêng cho mỗi lần tải (nhiều file/request chạy song song)
+        fd, temp_path = tempfile.mkstemp(prefix="temp_pdf_", suffix=".pdf")
+        os.close(fd)
         
-        # Save file
-        with open(temp_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+        # Download file (streaming + digest, dùng connection pool chung)
+        try:
+            download = get_downloader().download_sync(url, temp_path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
         
         # Verify file
-        file_size = os.path.getsize(temp_path)
+        file_size = download['size']
         if file_size < 100:  # File quá nhỏ
+            os.remove(temp_path)
             raise HTTPException(status_code=400, detail="File PDF không hợp lệ")
             
         logger.info(f"Downloaded PDF thành công: {file_size:,} bytes")
-        return temp_path
+        return temp_path, download['digest'], download['headers']
         
-    except requests.exceptions.RequestException as e:
+    except HTTPException:
+        raise
+    except DownloadError as e:
         logger.error(f"Lỗi download: {str(e)}")
-        raise HTTPException(status_code=400, detail=f"Không thể download file: {str(e)}")
+        status_code = 413 if e.status_code == 413 else 400
+        raise HTTPException(status_code=status_code, detail=f"Không thể download file: {str(e)}")
     except Exception as e:
         logger.error(f"Lỗi xử lý file: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Lỗi server: {str(e)}")
 
+def download_pdf_from_url(url: str) -> str:
+    """Download PDF từ URL (S3 hoặc web) hoặc copy từ local file"""
+    temp_path, _, _ = download_pdf_with_metadata(url)
+    return temp_path
+
 # ===== CACHE SYSTEM =====
 class MultiFileCache:
-    """Cache system cho multi-file processing"""
-    
-    def __init__(self, cache_dir="cache"):
+    """Cache system cho multi-file processing
+
+    Có 2 chế độ cache key:
+    - content-addressed (mặc định): key = SHA-256 của bytes PDF, kèm index URL -> digest
+      được validate bằng ETag/Last-Modified
+    - legacy: key = hash của file name
+    """
+
+    def __init__(self, cache_dir="cache", content_addressed: bool = True):
         self.cache_dir = Path(cache_dir)
         self.content_dir = self.cache_dir / "content"
         self.embeddings_dir = self.cache_dir / "embeddings"
         self.questions_dir = self.cache_dir / "questions"
-        
+        self.pages_dir = self.cache_dir / "pages"
+        self.content_addressed = content_addressed
+
         # Tạo directories
-        for dir_path in [self.content_dir, self.embeddings_dir, self.questions_dir]:
+        for dir_path in [self.content_dir, self.embeddings_dir, self.questions_dir, self.pages_dir]:
             dir_path.mkdir(parents=True, exist_ok=True)
-    
+
+        # Index URL -> digest (content-addressed mode)
+        self.url_index_file = self.cache_dir / "url_index.json"
+        self.url_index_lock = threading.Lock()
+        self.url_index = self._load_url_index()
+
+        # Phiên bản mới nhất theo URL / tên file (để xử lý lại theo trang khi upload lại)
+        self.versions_file = self.pages_dir / "latest_versions.json"
+        self.versions_lock = threading.Lock()
+        self.questions_lock = threading.Lock()
+
     def get_file_hash(self, file_name: str) -> str:
         """Tạo hash từ file name để làm cache key"""
         return hashlib.md5(file_name.encode()).hexdigest()[:12]
-    
-    def has_content_cache(self, file_name: str) -> bool:
+
+    @staticmethod
+    def compute_content_digest(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+        """Tính SHA-256 của file theo kiểu streaming (không đọc cả file vào RAM)"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(chunk_size), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _content_path(self, file_name: str, cache_key: Optional[str] = None) -> Path:
+        """Đường dẫn file content cache"""
+        if cache_key:
+            return self.content_dir / f"{cache_key}_content.txt"
+        return self.content_dir / f"{self.get_file_hash(file_name)}_{file_name}_content.txt"
+
+    def _embeddings_path(self, file_name: str, cache_key: Optional[str] = None) -> Path:
+        """Prefix các file embeddings cache (.npy + chunks sidecar)"""
+        if cache_key:
+            return self.embeddings_dir / f"{cache_key}_embeddings"
+        return self.embeddings_dir / f"{self.get_file_hash(file_name)}_{file_name}_embeddings"
+
+    def _embedding_store(self, file_name: str, cache_key: Optional[str] = None) -> EmbeddingStore:
+        return EmbeddingStore(self._embeddings_path(file_name, cache_key))
+
+    def corpus_file_key(self, file_name: str, cache_key: Optional[str] = None) -> str:
+        """Key của file trong project corpus (digest nội dung, hoặc tên file ở chế độ legacy)"""
+        return cache_key or f"{self.get_file_hash(file_name)}_{file_name}"
+
+    def _legacy_embeddings_path(self, file_name: str, cache_key: Optional[str] = None) -> Path:
+        """File pickle embeddings định dạng cũ"""
+        return self._embeddings_path(file_name, cache_key).with_suffix(".pkl")
+
+    # ----- URL -> digest index -----
+    def _load_url_index(self) -> Dict[str, Dict]:
+        """Load index URL -> digest từ disk"""
+        try:
+            if self.url_index_file.exists():
+                with open(self.url_index_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        except Exception as e:
+            logger.error(f"Lỗi load URL index: {e}")
+        return {}
+
+    def _save_url_index(self):
+        """Ghi index xuống disk (atomic replace)"""
+        try:
+            tmp_file = self.url_index_file.with_suffix(".json.tmp")
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.url_index, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.url_index_file)
+        except Exception as e:
+            logger.error(f"Lỗi save URL index: {e}")
+
+    def record_url(self, url: str, digest: str, headers: Optional[Dict] = None):
+        """Ghi nhận URL -> digest cùng ETag/Last-Modified để validate lần sau"""
+        headers = headers or {}
+        with self.url_index_lock:
+            self.url_index[url] = {
+                'digest': digest,
+                'etag': headers.get('ETag') or headers.get('etag'),
+                'last_modified': headers.get('Last-Modified') or headers.get('last-modified'),
+                'timestamp': datetime.now().isoformat()
+            }
+            self._save_url_index()
+
+    def forget_url(self, url: str):
+        """Xóa entry stale khỏi index"""
+        with self.url_index_lock:
+            if self.url_index.pop(url, None) is not None:
+                self._save_url_index()
+
+    def lookup_url(self, url: str) -> Optional[str]:
+        """Trả về digest đã biết cho URL nếu validator (ETag/Last-Modified) còn hợp lệ
+
+        Gửi conditional GET 1 byte (Range + If-None-Match): 304 hoặc ETag/Last-Modified khớp -> hit,
+        404/410 hoặc validator khác -> xóa entry. Không validate được (403/405...) -> None, giữ entry
+        (caller tải lại và tra theo digest).
+        """
+        with self.url_index_lock:
+            entry = self.url_index.get(url)
+        if not entry:
+            return None
+
+        etag = entry.get('etag')
+        last_modified = entry.get('last_modified')
+        if not etag and not last_modified:
+            return None
+
+        # Conditional GET 1 byte qua downloader chung (presigned S3 URL trả 403 cho HEAD)
+        validation = get_downloader().validate_sync(url, etag, last_modified)
+        if validation == VALIDATION_FRESH:
+            return entry['digest']
+        if validation == VALIDATION_STALE:
+            logger.info(f"URL index stale cho {url}, sẽ tải lại")
+            self.forget_url(url)
+            return None
+
+        # Không validate được (403/405, lỗi mạng...): giữ entry, tải lại và so digest
+        logger.info(f"Không validate được URL cache cho {url}, tải lại để so digest")
+        return None
+
+    def list_embedding_files(self) -> List[Path]:
+        """Các file embeddings (.npy store + pickle cũ chưa migrate)"""
+        return list(self.embeddings_dir.glob("*_embeddings.npy")) + list(self.embeddings_dir.glob("*.pkl"))
+
+    def has_content_cache(self, file_name: str, cache_key: Optional[str] = None) -> bool:
         """Kiểm tra có cache content không"""
-        cache_key = self.get_file_hash(file_name)
-        cache_file = self.content_dir / f"{cache_key}_{file_name}_content.txt"
-        return cache_file.exists()
-    
-    def has_embeddings_cache(self, file_name: str) -> bool:
+        return self._content_path(file_name, cache_key).exists()
+
+    def has_embeddings_cache(self, file_name: str, cache_key: Optional[str] = None) -> bool:
         """Kiểm tra có cache embeddings không"""
-        cache_key = self.get_file_hash(file_name)
-        cache_file = self.embeddings_dir / f"{cache_key}_{file_name}_embeddings.pkl"
-        return cache_file.exists()
-    
-    def save_content_cache(self, file_name: str, content: str):
+        return (self._embedding_store(file_name, cache_key).exists() or
+                self._legacy_embeddings_path(file_name, cache_key).exists())
+
+    def save_content_cache(self, file_name: str, content: str, cache_key: Optional[str] = None):
         """Lưu content vào cache"""
         try:
             # Validate content type
@@ -473,22 +737,20 @@ class MultiFileCache:
                 logger.warning(f"Content rỗng cho {file_name}")
                 return
             
-            cache_key = self.get_file_hash(file_name)
-            cache_file = self.content_dir / f"{cache_key}_{file_name}_content.txt"
-            
+            cache_file = self._content_path(file_name, cache_key)
+
             with open(cache_file, 'w', encoding='utf-8') as f:
                 f.write(content)
-            
+
             logger.info(f"Đã cache content cho {file_name}")
         except Exception as e:
             logger.error(f"Lỗi save content cache: {e}")
-    
-    def load_content_cache(self, file_name: str) -> str:
+
+    def load_content_cache(self, file_name: str, cache_key: Optional[str] = None) -> str:
         """Load content từ cache"""
         try:
-            cache_key = self.get_file_hash(file_name)
-            cache_file = self.content_dir / f"{cache_key}_{file_name}_content.txt"
-            
+            cache_file = self._content_path(file_name, cache_key)
+
             with open(cache_file, 'r', encoding='utf-8') as f:
                 content = f.read()
             
@@ -498,44 +760,173 @@ class MultiFileCache:
             logger.error(f"Lỗi load content cache: {e}")
             return ""
     
-    def save_embeddings_cache(self, file_name: str, embeddings, chunks):
-        """Lưu embeddings vào cache"""
+    def save_embeddings_cache(self, file_name: str, embeddings, chunks, cache_key: Optional[str] = None):
+        """Lưu embeddings (float32 .npy) + chunks vào cache"""
         try:
-            import pickle
-            cache_key = self.get_file_hash(file_name)
-            cache_file = self.embeddings_dir / f"{cache_key}_{file_name}_embeddings.pkl"
-            
-            cache_data = {
-                'embeddings': embeddings,
-                'chunks': chunks,
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            with open(cache_file, 'wb') as f:
-                pickle.dump(cache_data, f)
-            
+            self._embedding_store(file_name, cache_key).save(embeddings, chunks)
             logger.info(f"Đã cache embeddings cho {file_name}")
         except Exception as e:
             logger.error(f"Lỗi save embeddings cache: {e}")
     
-    def load_embeddings_cache(self, file_name: str):
-        """Load embeddings từ cache"""
+    def load_embeddings_cache(self, file_name: str, cache_key: Optional[str] = None):
+        """Load embeddings (memory-mapped, không copy) + chunks từ cache"""
         try:
-            import pickle
-            cache_key = self.get_file_hash(file_name)
-            cache_file = self.embeddings_dir / f"{cache_key}_{file_name}_embeddings.pkl"
-            
-            with open(cache_file, 'rb') as f:
-                cache_data = pickle.load(f)
-            
+            store = self._embedding_store(file_name, cache_key)
+            if not store.exists():
+                self._migrate_legacy_embeddings(file_name, cache_key)
+
+            embeddings, chunks = store.load()
             logger.info(f"Loaded embeddings từ cache cho {file_name}")
-            return cache_data['embeddings'], cache_data['chunks']
+            return embeddings, chunks
         except Exception as e:
             logger.error(f"Lỗi load embeddings cache: {e}")
             return None, None
 
+    # ----- manifest trang + câu hỏi theo phiên bản tài liệu -----
+    def _pages_path(self, file_name: str, cache_key: Optional[str] = None) -> Path:
+        return self.pages_dir / f"{self.corpus_file_key(file_name, cache_key)}_pages.json"
+
+    def _questions_path(self, file_name: str, cache_key: Optional[str] = None) -> Path:
+        return self.questions_dir / f"{self.corpus_file_key(file_name, cache_key)}_questions.json"
+
+    @staticmethod
+    def _write_json(path: Path, data):
+        """Ghi JSON (atomic replace)"""
+        tmp_path = path.with_suffix(".json.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read_json(path: Path):
+        try:
+            if path.exists():
+                with open(path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        except Exception as e:
+            logger.error(f"Lỗi đọc {path.name}: {e}")
+        return None
+
+    def save_page_manifest(self, file_input: FileInput, pages: List[Dict], cache_key: Optional[str] = None):
+        """Lưu manifest trang và đánh dấu đây là phiên bản mới nhất của URL / tên file"""
+        try:
+            self._write_json(self._pages_path(file_input.file_name, cache_key), {
+                'file_name': file_input.file_name,
+                'url': file_input.url,
+                'updated': datetime.now().isoformat(),
+                'pages': pages
+            })
+            key = self.corpus_file_key(file_input.file_name, cache_key)
+            with self.versions_lock:
+                versions = self._read_json(self.versions_file) or {'urls': {}, 'names': {}}
+                versions['urls'][file_input.url] = key
+                versions['names'][file_input.file_name] = key
+                self._write_json(self.versions_file, versions)
+        except Exception as e:
+            logger.error(f"Lỗi save page manifest: {e}")
+
+    def load_page_manifest(self, file_name: str, cache_key: Optional[str] = None) -> Optional[List[Dict]]:
+        manifest = self._read_json(self._pages_path(file_name, cache_key))
+        return manifest['pages'] if manifest else None
+
+    def find_previous_version(self, file_input: FileInput, cache_key: Optional[str] = None) -> Optional[str]:
+        """Cache key phiên bản trước của tài liệu (cùng URL, hoặc cùng tên file), None nếu chưa có"""
+        key = self.corpus_file_key(file_input.file_name, cache_key)
+        with self.versions_lock:
+            versions = self._read_json(self.versions_file) or {'urls': {}, 'names': {}}
+        for previous in (versions['urls'].get(file_input.url), versions['names'].get(file_input.file_name)):
+            if previous and previous != key and (self.pages_dir / f"{previous}_pages.json").exists():
+                return previous
+        return None
+
+    def append_questions(self, file_name: str, questions: List[Dict], cache_key: Optional[str] = None) -> List[Dict]:
+        """Nối câu hỏi đã sinh (kèm source_pages) vào bank của phiên bản tài liệu
+
+        Append-only: không ghi đè bank cũ, bỏ câu trùng nội dung. Trả về bank sau khi thêm.
+        """
+        with self.questions_lock:
+            bank = self.load_questions(file_name, cache_key)
+            seen = {" ".join(q.get("question", "").split()).casefold() for q in bank}
+            added = []
+            for question in questions:
+                key = " ".join(question.get("question", "").split()).casefold()
+                if key not in seen:
+                    seen.add(key)
+                    added.append(question)
+            if not added:
+                return bank
+            bank = bank + added
+            try:
+                self._write_json(self._questions_path(file_name, cache_key), {
+                    'updated': datetime.now().isoformat(),
+                    'questions': bank
+                })
+            except Exception as e:
+                logger.error(f"Lỗi save questions cache: {e}")
+            return bank
+
+    def load_questions(self, file_name: str, cache_key: Optional[str] = None) -> List[Dict]:
+        data = self._read_json(self._questions_path(file_name, cache_key))
+        return data['questions'] if data else []
+
+    def _migrate_legacy_embeddings(self, file_name: str, cache_key: Optional[str] = None):
+        """Chuyển cache pickle cũ sang embedding store"""
+        import pickle
+        legacy_file = self._legacy_embeddings_path(file_name, cache_key)
+
+        with open(legacy_file, 'rb') as f:
+            cache_data = pickle.load(f)
+
+        self._embedding_store(file_name, cache_key).save(cache_data['embeddings'], cache_data['chunks'])
+        legacy_file.unlink()
+        logger.info(f"Đã chuyển embeddings cache pickle sang .npy cho {file_name}")
+
 # Global cache instance
-multi_file_cache = MultiFileCache()
+multi_file_cache = MultiFileCache(
+    content_addressed=os.getenv('CACHE_CONTENT_ADDRESSED', 'true').lower() == 'true'
+)
+
+# Corpus index theo project_id (manifest trỏ tới embedding store của từng file)
+project_corpora = ProjectCorpusRegistry(multi_file_cache.cache_dir / "projects")
+
+def add_file_to_project(project_id: Optional[str], file_input: FileInput, cache_key: Optional[str] = None):
+    """Đưa embeddings đã cache của file vào corpus của project"""
+    if not project_id or not multi_file_cache.has_embeddings_cache(file_input.file_name, cache_key):
+        return
+    try:
+        # Migrate pickle cũ (nếu có) để corpus đọc được store .npy
+        if not multi_file_cache._embedding_store(file_input.file_name, cache_key).exists():
+            multi_file_cache.load_embeddings_cache(file_input.file_name, cache_key)
+        project_corpora.get(project_id).add_file(
+            multi_file_cache.corpus_file_key(file_input.file_name, cache_key),
+            file_input.file_name,
+            multi_file_cache._embeddings_path(file_input.file_name, cache_key)
+        )
+    except Exception as e:
+        logger.error(f"Lỗi thêm {file_input.file_name} vào corpus project {project_id}: {e}")
+
+def llm_cache_stats() -> Optional[Dict]:
+    response_cache = get_llm_response_cache()
+    return response_cache.stats() if response_cache else None
+
+# ===== LIFECYCLE =====
+@app.on_event("startup")
+async def startup_event():
+    """Khởi tạo extraction pool, worker tạo bank nền và warm-up embedding model khi server start"""
+    get_extraction_pool()
+    start_pregeneration_worker()
+    if EMBEDDING_WARMUP:
+        try:
+            stats = await asyncio.to_thread(warm_up)
+            logger.info(f"Embedding model warm-up xong: {stats}")
+        except Exception as e:
+            logger.error(f"Lỗi warm-up embedding model: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Dọn dẹp process pool và worker nền khi server dừng"""
+    stop_pregeneration_worker()
+    shutdown_extraction_pool()
 
 # ===== API ENDPOINTS =====
 
@@ -556,9 +947,14 @@ async def root():
             "POST /api/generate-questions-sync": "Tạo câu hỏi từ nhiều file (sync, ≤100 câu)",
             "POST /api/generate-questions": "Tạo câu hỏi từ nhiều file (async, ≤200 câu)",
             "POST /api/generate-questions-single-sync": "Tạo câu hỏi từ 1 file (legacy)",
+            "POST /api/ingest": "Ingest trước: tạo sẵn bank câu hỏi trong nền",
             "GET /api/health": "Health check với cache info",
             "GET /api/cache/info": "Thông tin cache system",
             "DELETE /api/cache/clear": "Xóa cache",
+            "GET /api/projects/{project_id}": "Các file trong corpus của project",
+            "POST /api/projects/{project_id}/query": "Tìm nội dung theo topic trên toàn project",
+            "POST /api/projects/{project_id}/query-batch": "Tìm nội dung cho nhiều topic trong 1 lần",
+            "DELETE /api/projects/{project_id}/files/{file_key}": "Bỏ 1 file khỏi corpus project",
             "GET /api/task-status/{task_id}": "Kiểm tra trạng thái task",
             "GET /api/task-result/{task_id}": "Lấy kết quả task"
         },
@@ -589,7 +985,12 @@ async def health_check():
         # Cache statistics
         cache_stats = {
             "content_files": len(list(multi_file_cache.content_dir.glob("*.txt"))),
-            "embedding_files": len(list(multi_file_cache.embeddings_dir.glob("*.pkl"))),
+            "embedding_files": len(multi_file_cache.list_embedding_files()),
+            "embedding_quantization": EMBEDDING_QUANTIZATION,
+            "chunk_embedding_cache": get_chunk_embedding_cache().stats(),
+            "llm_response_cache": llm_cache_stats(),
+            "content_addressed": multi_file_cache.content_addressed,
+            "indexed_urls": len(multi_file_cache.url_index),
             "cache_size_mb": sum(f.stat().st_size for f in multi_file_cache.cache_dir.rglob("*") if f.is_file()) / (1024*1024)
         }
         
@@ -604,6 +1005,7 @@ async def health_check():
             "cache_statistics": cache_stats,
             "timestamp": datetime.now().isoformat(),
             "active_tasks": len([t for t in task_storage.values() if t.status == "processing"]),
+            "pregeneration": pregeneration_stats(),
             "completed_tasks": len([t for t in task_storage.values() if t.status == "completed"]),
             "features": {
                 "multi_file_support": True,
@@ -611,8 +1013,10 @@ async def health_check():
                 "async_processing": True,
                 "max_files_per_request": 10,
                 "max_questions_sync": 100,
-                "max_questions_async": 200
-            }
+                "max_questions_async": 200,
+                "extraction_workers": EXTRACTION_WORKERS
+            },
+            "embedding_models": get_registry_stats()
         }
     except Exception as e:
         return JSONResponse(
@@ -826,8 +1230,8 @@ async def generate_questions_sync(request: GenerateQuestionsRequest):
                 detail="Sync API chỉ hỗ trợ tối đa 300 câu hỏi."
             )
         
-        # Process multiple files
-        response = process_multiple_files(request)
+        # Process multiple files (chạy trong thread, không block event loop)
+        response = await asyncio.to_thread(process_multiple_files, request)
         
         return response
         
@@ -837,6 +1241,27 @@ async def generate_questions_sync(request: GenerateQuestionsRequest):
         logger.error(f"Multi-file sync generate error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Lỗi server: {str(e)}")
 
+@app.post("/api/ingest")
+async def ingest_documents(request: IngestRequest):
+    """
+    Ingest trước khi cần: extraction, embeddings và bank câu hỏi được tạo trong nền (ưu tiên thấp),
+    các request tạo câu hỏi sau đó lấy từ bank đã có
+    """
+    bank_size = request.bank_size or PREGENERATE_BANK_SIZE
+    task_id = f"ingest_{int(time.time())}_{hashlib.md5(str(request.files).encode()).hexdigest()[:8]}"
+    queued = schedule_pregeneration(request.files, request.project_id, bank_size, task_id)
+    skipped = [f.file_name for f in request.files if f not in queued]
+    
+    return {
+        "task_id": task_id if queued else None,
+        "status": "pending" if queued else "skipped",
+        "queued_files": [f.file_name for f in queued],
+        "already_queued": skipped,
+        "bank_size": bank_size,
+        "queue_position": _pregeneration_queue.qsize(),
+        "check_status_url": f"/api/task-status/{task_id}" if queued else None
+    }
+
 @app.post("/api/generate-questions-single-sync")
 async def generate_questions_single_sync(request: QuestionRequest):
     """
@@ -849,13 +1274,13 @@ async def generate_questions_single_sync(request: QuestionRequest):
                 url=request.s3_url,
                 file_name=f"document_{int(time.time())}.pdf"
             )],
-            project_id=f"single_{int(time.time())}",
+            project_id="",  # 1 file lẻ, không gắn vào corpus project nào
             total_questions=request.total_question,
             name="Single File Questions"
         )
         
-        # Process using multi-file system
-        response = process_multiple_files(multi_request)
+        # Process using multi-file system (chạy trong thread, không block event loop)
+        response = await asyncio.to_thread(process_multiple_files, multi_request)
         
         # Return in legacy format (without metadata)
         return {
@@ -869,7 +1294,162 @@ async def generate_questions_single_sync(request: QuestionRequest):
         logger.error(f"Single file sync generate error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Lỗi server: {str(e)}")
 
-def process_single_file(file_input: FileInput, questions_count: int) -> FileProcessingResult:
+def generate_from_cache(file_input: FileInput, questions_count: int, cache_key: Optional[str] = None,
+                        project_id: Optional[str] = None) -> Optional[Dict]:
+    """Tạo câu hỏi từ content/embeddings đã cache, trả về None nếu cache miss"""
+    has_content = multi_file_cache.has_content_cache(file_input.file_name, cache_key)
+    has_embeddings = multi_file_cache.has_embeddings_cache(file_input.file_name, cache_key)
+    
+    if not (has_content and has_embeddings):
+        return None
+    
+    # Bank đã đủ (vd: tạo sẵn sau khi ingest): trả luôn, không nạp content/embeddings/generator
+    stored = multi_file_cache.load_questions(file_input.file_name, cache_key)
+    if len(stored) >= questions_count:
+        logger.info(f"Dùng {questions_count}/{len(stored)} câu hỏi có sẵn trong bank cho {file_input.file_name}")
+        add_file_to_project(project_id, file_input, cache_key)
+        return {"questions": stored[:questions_count]}
+    
+    logger.info(f"Using cache cho {file_input.file_name}")
+    
+    # Load từ cache
+    content = multi_file_cache.load_content_cache(file_input.file_name, cache_key)
+    embeddings, chunks = multi_file_cache.load_embeddings_cache(file_input.file_name, cache_key)
+    
+    if not (content and embeddings is not None and chunks):
+        return None
+    
+    # Tạo generator với cached data
+    generator = load_question_generator()
+    generator.pdf_content = content
+    generator.chunks = chunks
+    generator.embeddings = embeddings
+    
+    # Retrieval theo topic lấy từ toàn bộ project
+    add_file_to_project(project_id, file_input, cache_key)
+    if project_id:
+        generator.corpus = project_corpora.get(project_id)
+    
+    return generate_with_question_cache(generator, file_input, questions_count, cache_key)
+
+def generate_with_question_cache(generator, file_input: FileInput, questions_count: int,
+                                 cache_key: Optional[str] = None, stored: Optional[List[Dict]] = None) -> Dict:
+    """Dùng bank câu hỏi của tài liệu, chỉ gọi LLM cho phần còn thiếu
+
+    stored: câu hỏi khởi tạo bank (vd: câu còn hợp lệ của phiên bản trước), None = đọc bank hiện có.
+    Câu hỏi fallback không được lưu vào bank.
+    """
+    if stored is None:
+        stored = multi_file_cache.load_questions(file_input.file_name, cache_key)
+    elif stored:
+        stored = multi_file_cache.append_questions(file_input.file_name, stored, cache_key)
+    if len(stored) >= questions_count:
+        logger.info(f"Dùng {questions_count}/{len(stored)} câu hỏi đã cache cho {file_input.file_name}")
+        return {"questions": stored[:questions_count]}
+    
+    missing = questions_count - len(stored)
+    if stored:
+        logger.info(f"Có {len(stored)} câu hỏi đã cache cho {file_input.file_name}, tạo thêm {missing}")
+    # Top-up: prompt có thể trùng lần tạo trước, offset để không replay response cũ từ LLM cache
+    generator.sample_offset = len(stored)
+    if stored and hasattr(generator, "generate_more_questions"):
+        generated = generator.generate_more_questions(missing, stored) or {}
+    else:
+        generated = generator.generate_questions(missing) or {}
+    new_questions = generated.get("questions", [])
+    if stored:
+        # Câu gần trùng với bank không được lưu (bank chỉ bỏ câu trùng chính xác)
+        new_questions, removed = QuestionDeduper(existing=stored).filter(new_questions)
+        if removed:
+            logger.info(f"Bỏ {len(removed)} câu trùng với bank của {file_input.file_name}")
+    
+    fresh = [q for q in new_questions if isinstance(q, dict) and not q.get("is_fallback")]
+    if fresh:
+        multi_file_cache.append_questions(file_input.file_name, fresh, cache_key)
+    return {"questions": (stored + new_questions)[:questions_count]}
+
+def ingest_with_page_cache(temp_file: str, file_input: FileInput, cache_key: str, generator) -> Optional[Tuple[List[Dict], List[int]]]:
+    """Extraction + chunking + embeddings theo trang, dùng lại các trang không đổi của phiên bản trước
+
+    Lưu content/embeddings/manifest trang của phiên bản mới và nạp vào generator.
+
+    Returns:
+        (câu hỏi phiên bản trước còn hợp lệ, các trang có text mới), None nếu không xử lý được theo trang
+    """
+    file_name = file_input.file_name
+    previous_key = multi_file_cache.find_previous_version(file_input, cache_key)
+    previous_pages, previous_content, previous_embeddings, previous_chunks = None, "", None, None
+    if previous_key:
+        previous_pages = multi_file_cache.load_page_manifest(file_name, previous_key)
+        previous_content = multi_file_cache.load_content_cache(file_name, previous_key)
+        if multi_file_cache.has_embeddings_cache(file_name, previous_key):
+            previous_embeddings, previous_chunks = multi_file_cache.load_embeddings_cache(file_name, previous_key)
+        if not previous_content:
+            previous_pages = None
+    
+    with extraction_semaphore:
+        ingest = run_page_ingestion(temp_file, previous_pages, previous_content)
+    if ingest is None or not ingest['content'].strip():
+        return None
+    
+    # Encode chunks mới (CPU-bound -> dùng chung giới hạn với extraction)
+    with extraction_semaphore:
+        chunks, embeddings, changed_pages = assemble_chunks(
+            ingest, previous_pages, previous_chunks, previous_embeddings
+        )
+    pages = ingest['pages']
+    logger.info(
+        f"Xử lý theo trang {file_name}: trích xuất {ingest['reextracted']}/{len(pages)} trang, "
+        f"chunk/encode {len(changed_pages)} trang, {len(chunks)} chunks"
+        + (f" (phiên bản trước: {previous_key[:12]})" if previous_pages else "")
+    )
+    
+    generator.pdf_content = ingest['content']
+    generator.chunks = chunks
+    generator.embeddings = embeddings
+    
+    multi_file_cache.save_content_cache(file_name, ingest['content'], cache_key)
+    multi_file_cache.save_embeddings_cache(file_name, embeddings, chunks, cache_key)
+    multi_file_cache.save_page_manifest(file_input, pages, cache_key)
+    
+    if not previous_pages:
+        return [], list(ingest['chunks'])
+    
+    previous_questions = multi_file_cache.load_questions(file_name, previous_key)
+    carried = carry_over_questions(previous_questions, previous_pages, pages)
+    logger.info(f"Giữ lại {len(carried)}/{len(previous_questions)} câu hỏi từ các trang không đổi")
+    return carried, list(ingest['chunks'])
+
+# ===== IN-FLIGHT DOCUMENTS =====
+# URL -> [lock, số luồng đang dùng]: cùng 1 tài liệu chỉ được download/extract/tạo câu hỏi bởi 1 luồng,
+# luồng sau (request của user hoặc worker nền) chờ rồi dùng cache luồng trước vừa ghi
+_document_locks: Dict[str, list] = {}
+_document_locks_guard = threading.Lock()
+
+@contextmanager
+def document_lock(url: str):
+    """Giữ quyền xử lý tài liệu `url`"""
+    with _document_locks_guard:
+        entry = _document_locks.setdefault(url, [threading.Lock(), 0])
+        entry[1] += 1
+    lock = entry[0]
+    if lock.locked():
+        logger.info(f"Đang có luồng khác xử lý {url}, chờ kết quả...")
+    try:
+        with lock:
+            yield
+    finally:
+        with _document_locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                _document_locks.pop(url, None)
+
+def process_single_file(file_input: FileInput, questions_count: int, project_id: Optional[str] = None) -> FileProcessingResult:
+    """Xử lý một file và tạo câu hỏi (cùng URL đang được xử lý ở luồng khác -> chờ rồi dùng cache)"""
+    with document_lock(file_input.url):
+        return _process_single_file(file_input, questions_count, project_id)
+
+def _process_single_file(file_input: FileInput, questions_count: int, project_id: Optional[str] = None) -> FileProcessingResult:
     """Xử lý một file và tạo câu hỏi"""
     start_time = time.time()
     result = FileProcessingResult(
@@ -878,56 +1458,86 @@ def process_single_file(file_input: FileInput, questions_count: int) -> FileProc
     )
     
     try:
-        # Kiểm tra cache trước
-        has_content = multi_file_cache.has_content_cache(file_input.file_name)
-        has_embeddings = multi_file_cache.has_embeddings_cache(file_input.file_name)
+        # Kiểm tra cache trước (content-addressed: digest đã biết của URL, legacy: file name)
+        cache_key = None
+        if multi_file_cache.content_addressed:
+            cache_key = multi_file_cache.lookup_url(file_input.url)
+            questions_data = generate_from_cache(file_input, questions_count, cache_key, project_id) if cache_key else None
+        else:
+            questions_data = generate_from_cache(file_input, questions_count, project_id=project_id)
         
-        if has_content and has_embeddings:
-            logger.info(f"Using cache cho {file_input.file_name}")
-            
-            # Load từ cache
-            content = multi_file_cache.load_content_cache(file_input.file_name)
-            embeddings, chunks = multi_file_cache.load_embeddings_cache(file_input.file_name)
+        if questions_data is not None:
+            result.status = "success"
+            result.questions_count = len(questions_data.get("questions", []))
+            result.from_cache = True
+            result.cache_key = cache_key
+            result.processing_time = time.time() - start_time
             
-            if content and embeddings is not None and chunks:
-                # Tạo generator với cached data
-                generator = load_question_generator()
-                generator.pdf_content = content
-                generator.chunks = chunks
-                generator.embeddings = embeddings
-                
-                # Generate questions
-                questions_data = generator.generate_questions(questions_count)
-                
-                result.status = "success"
-                result.questions_count = len(questions_data.get("questions", []))
-                result.from_cache = True
-                result.processing_time = time.time() - start_time
-                
-                return result, questions_data
+            return result, questions_data
         
-        # Không có cache, xử lý từ đầu
+        # Không có cache theo URL/tên, download để biết digest nội dung
         logger.info(f"Processing {file_input.file_name} từ đầu...")
         
         # Download file
-        temp_file = download_pdf_from_url(file_input.url)
+        with download_semaphore:
+            temp_file, digest, headers = download_pdf_with_metadata(file_input.url)
         
         try:
+            if multi_file_cache.content_addressed:
+                cache_key = digest
+                multi_file_cache.record_url(file_input.url, digest, headers)
+                
+                # Cùng nội dung đã được xử lý dưới tên/URL khác -> bỏ qua extraction
+                questions_data = generate_from_cache(file_input, questions_count, cache_key, project_id)
+                if questions_data is not None:
+                    result.status = "success"
+                    result.questions_count = len(questions_data.get("questions", []))
+                    result.from_cache = True
+                    result.cache_key = cache_key
+                    result.processing_time = time.time() - start_time
+                    
+                    return result, questions_data
+            
             # Load generator
             generator = load_question_generator()
             
-            # Convert PDF to text
+            # Content-addressed: xử lý theo trang, upload lại chỉ làm lại các trang đã đổi
+            page_ingest = None
+            if multi_file_cache.content_addressed and GENERATOR_TYPE == "simple_fix":
+                page_ingest = ingest_with_page_cache(temp_file, file_input, cache_key, generator)
+            
+            if page_ingest is not None:
+                carried, new_text_pages = page_ingest
+                add_file_to_project(project_id, file_input, cache_key)
+                if project_id:
+                    generator.corpus = project_corpora.get(project_id)
+                
+                # Câu hỏi thay thế cho các câu bị loại được tạo từ chính các trang đã đổi
+                if carried and new_text_pages and len(carried) < questions_count:
+                    generator.pdf_content, generator.chunks, generator.embeddings = select_pages(
+                        generator.pdf_content, generator.chunks, generator.embeddings,
+                        multi_file_cache.load_page_manifest(file_input.file_name, cache_key), new_text_pages
+                    )
+                questions_data = generate_with_question_cache(
+                    generator, file_input, questions_count, cache_key, stored=carried
+                )
+                
+                result.status = "success"
+                result.questions_count = len(questions_data.get("questions", []))
+                result.from_cache = False
+                result.cache_key = cache_key
+                result.processing_time = time.time() - start_time
+                
+                return result, questions_data
+            
+            # Convert PDF to text + chunking trong extraction process pool
             logger.info(f"Converting PDF: {temp_file}")
-            conversion_result = generator.convert_pdf_to_text(temp_file)
+            with extraction_semaphore:
+                pdf_content, chunks, embeddings = run_extraction(temp_file)
             
             # Debug PDF content
-            pdf_content = getattr(generator, 'pdf_content', '')
             logger.info(f"PDF content type: {type(pdf_content)}, length: {len(str(pdf_content))}")
             
-            if not conversion_result:
-                logger.error("PDF conversion failed")
-                raise Exception("Không thể đọc file PDF")
-            
             # Validate content before caching
             if not isinstance(pdf_content, str):
                 logger.warning(f"Converting pdf_content from {type(pdf_content)} to str")
@@ -938,27 +1548,35 @@ def process_single_file(file_input: FileInput, questions_count: int) -> FileProc
                 raise Exception("Nội dung PDF trống sau khi chuyển đổi")
             
             logger.info(f"PDF conversion successful: {len(pdf_content)} characters")
+            generator.pdf_content = pdf_content
             
             # Cache content
-            multi_file_cache.save_content_cache(file_input.file_name, pdf_content)
+            multi_file_cache.save_content_cache(file_input.file_name, pdf_content, cache_key)
             
-            # Create embeddings
-            if not generator.create_embeddings():
+            # Embeddings đã tính theo stream trong run_extraction (chỉ encode lại nếu thiếu)
+            with extraction_semaphore:
+                embeddings_created = generator.create_embeddings(chunks, embeddings)
+            if not embeddings_created:
                 raise Exception("Không thể tạo embeddings")
             
             # Cache embeddings
             multi_file_cache.save_embeddings_cache(
                 file_input.file_name, 
                 generator.embeddings, 
-                generator.chunks
+                generator.chunks,
+                cache_key
             )
+            add_file_to_project(project_id, file_input, cache_key)
+            if project_id:
+                generator.corpus = project_corpora.get(project_id)
             
             # Generate questions
-            questions_data = generator.generate_questions(questions_count)
+            questions_data = generate_with_question_cache(generator, file_input, questions_count, cache_key)
             
             result.status = "success"
             result.questions_count = len(questions_data.get("questions", []))
             result.from_cache = False
+            result.cache_key = cache_key
             result.processing_time = time.time() - start_time
             
             return result, questions_data
@@ -992,6 +1610,176 @@ def distribute_questions(total_questions: int, num_files: int) -> List[int]:
     
     return distribution
 
+def process_files_concurrently(files: List[FileInput], question_distribution: List[int],
+                               project_id: Optional[str] = None) -> List:
+    """Chạy process_single_file cho các file song song (bounded thread pool)
+
+    Mỗi stage (download, extraction, LLM) bị giới hạn bởi semaphore riêng, nên
+    wall-clock time ~ file chậm nhất thay vì tổng các file.
+
+    Returns:
+        List cùng thứ tự với `files`, mỗi phần tử là (result, questions_data) hoặc Exception
+    """
+    if not files:
+        return []
+    
+    max_workers = max(1, min(len(files), MAX_FILE_WORKERS))
+    logger.info(f"Xử lý {len(files)} files với {max_workers} workers")
+    
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="file-worker") as executor:
+        futures = []
+        for i, file_input in enumerate(files):
+            questions_count = question_distribution[i] if i < len(question_distribution) else 0
+            logger.info(f"Processing {file_input.file_name} - {questions_count} câu hỏi")
+            futures.append(executor.submit(process_single_file, file_input, questions_count, project_id))
+        
+        outcomes = []
+        for future in futures:
+            try:
+                outcomes.append(future.result())
+            except Exception as e:
+                outcomes.append(e)
+    
+    return outcomes
+
+# ===== BACKGROUND PRE-GENERATION =====
+# 1 worker thread: tài liệu được xử lý như request bình thường (process_single_file với bank_size câu),
+# nhưng chỉ bắt đầu file tiếp theo khi không có request nào của user đang chạy.
+_pregeneration_queue: "queue.Queue" = queue.Queue()
+_pregeneration_pending = set()  # URL đang chờ / đang xử lý
+_pregeneration_lock = threading.Lock()
+_pregeneration_worker: Optional[threading.Thread] = None
+_pregeneration_stats = {"completed": 0, "failed": 0}
+_foreground_requests = 0
+_foreground_lock = threading.Lock()
+
+@contextmanager
+def foreground_request():
+    """Đánh dấu đang có request của user: worker nền chờ tới khi hết request"""
+    global _foreground_requests
+    with _foreground_lock:
+        _foreground_requests += 1
+    try:
+        yield
+    finally:
+        with _foreground_lock:
+            _foreground_requests -= 1
+
+def wait_for_idle():
+    """Chờ tới khi không còn request của user đang chạy"""
+    while _foreground_requests > 0:
+        time.sleep(PREGENERATE_IDLE_POLL)
+
+def start_pregeneration_worker():
+    """Khởi động worker tạo bank nền (lazy, 1 thread)"""
+    global _pregeneration_worker
+    with _pregeneration_lock:
+        if _pregeneration_worker is None or not _pregeneration_worker.is_alive():
+            _pregeneration_worker = threading.Thread(
+                target=pregeneration_loop, name="pregeneration-worker", daemon=True
+            )
+            _pregeneration_worker.start()
+
+def stop_pregeneration_worker():
+    """Dừng worker sau job hiện tại (các job còn trong hàng đợi bị bỏ)"""
+    global _pregeneration_worker
+    with _pregeneration_lock:
+        if _pregeneration_worker is not None:
+            _pregeneration_queue.put(None)
+            _pregeneration_worker = None
+
+def schedule_pregeneration(files: List[FileInput], project_id: Optional[str] = None,
+                           bank_size: Optional[int] = None, task_id: Optional[str] = None) -> List[FileInput]:
+    """Xếp các file vào hàng đợi tạo bank nền (bỏ qua file đang chờ), trả về các file được xếp"""
+    bank_size = bank_size or PREGENERATE_BANK_SIZE
+    with _pregeneration_lock:
+        queued = [f for f in files if f.url not in _pregeneration_pending]
+        _pregeneration_pending.update(f.url for f in queued)
+    if not queued:
+        return []
+    
+    if task_id:
+        task_storage[task_id] = TaskStatus(
+            task_id=task_id,
+            status="pending",
+            progress=0,
+            message=f"Chờ tạo bank {bank_size} câu hỏi cho {len(queued)} files"
+        )
+    _pregeneration_queue.put((task_id, queued, project_id, bank_size))
+    start_pregeneration_worker()
+    logger.info(f"Xếp hàng tạo bank nền cho {len(queued)} files ({bank_size} câu/file)")
+    return queued
+
+def pregeneration_loop():
+    """Worker nền: download -> extraction -> embeddings -> bank câu hỏi cho từng file trong hàng đợi"""
+    while True:
+        job = _pregeneration_queue.get()
+        if job is None:
+            break
+        task_id, files, project_id, bank_size = job
+        task = task_storage.get(task_id) if task_id else None
+        if task:
+            task.status = "processing"
+        
+        results = []
+        for index, file_input in enumerate(files):
+            try:
+                result = pregenerate_file(file_input, bank_size, project_id)
+            except Exception as e:
+                result = FileProcessingResult(file_name=file_input.file_name, status="failed", error_message=str(e))
+            finally:
+                with _pregeneration_lock:
+                    _pregeneration_pending.discard(file_input.url)
+            
+            _pregeneration_stats["completed" if result.status == "success" else "failed"] += 1
+            logger.info(f"Tạo bank nền {file_input.file_name}: {result.status} ({result.questions_count} câu)")
+            results.append(result.dict())
+            if task:
+                task.progress = int((index + 1) * 100 / len(files))
+                task.message = f"Đã xử lý {index + 1}/{len(files)} files"
+        
+        if task:
+            failed = [r for r in results if r["status"] != "success"]
+            task.status = "failed" if len(failed) == len(results) else "completed"
+            task.message = f"Bank sẵn sàng cho {len(results) - len(failed)}/{len(results)} files"
+            task.result = {"files": results, "bank_size": bank_size}
+
+def pregenerate_file(file_input: FileInput, bank_size: int, project_id: Optional[str] = None) -> FileProcessingResult:
+    """Tạo bank của 1 file theo từng bước PREGENERATE_STEP câu
+
+    Mỗi bước giữ document_lock trong thời gian ngắn; giữa các bước worker chờ tới khi
+    không còn request của user, và request cho cùng file chỉ phải chờ hết bước hiện tại.
+    """
+    step = max(1, PREGENERATE_STEP)
+    target = min(step, bank_size)
+    wait_for_idle()
+    # Bước đầu: download + extraction + embeddings như request bình thường
+    result, _ = process_single_file(file_input, target, project_id)
+    
+    while result.status == "success" and target < bank_size:
+        bank = len(multi_file_cache.load_questions(file_input.file_name, result.cache_key))
+        if bank < target:
+            # Bước trước không thêm được câu mới (chỉ có fallback): dừng
+            break
+        target = min(target + step, bank_size)
+        wait_for_idle()
+        with document_lock(file_input.url):
+            questions_data = generate_from_cache(file_input, target, result.cache_key, project_id)
+        if questions_data is None:
+            break
+        result.questions_count = len(questions_data.get("questions", []))
+    return result
+
+def pregeneration_stats() -> Dict:
+    return {
+        "queued_jobs": _pregeneration_queue.qsize(),
+        "pending_files": len(_pregeneration_pending),
+        "foreground_requests": _foreground_requests,
+        "bank_size": PREGENERATE_BANK_SIZE,
+        **_pregeneration_stats
+    }
+
+@foreground_request()
 def process_multiple_files(request: GenerateQuestionsRequest) -> QuestionResponse:
     """Xử lý nhiều files và combine kết quả với format mới"""
     start_time = time.time()
@@ -1000,7 +1788,6 @@ def process_multiple_files(request: GenerateQuestionsRequest) -> QuestionRespons
     question_distribution = distribute_questions(request.total_questions, len(request.files))
     
     # Track results
-    all_questions = []
     file_results = []
     cached_files = []
     new_files = []
@@ -1008,58 +1795,56 @@ def process_multiple_files(request: GenerateQuestionsRequest) -> QuestionRespons
     questions_per_file = {}
     all_content = []  # Để tạo summary
     
-    # Process từng file
-    for i, file_input in enumerate(request.files):
-        questions_count = question_distribution[i] if i < len(question_distribution) else 0
-        
-        logger.info(f"Processing {file_input.file_name} - {questions_count} câu hỏi")
-        
+    # Process các file song song, kết quả giữ đúng thứ tự request
+    outcomes = process_files_concurrently(request.files, question_distribution, request.project_id)
+    
+    # Tài liệu tải lần đầu: tạo sẵn bank câu hỏi trong nền cho các request sau
+    if PREGENERATE_ON_DOWNLOAD:
+        fresh_files = [
+            file_input for file_input, outcome in zip(request.files, outcomes)
+            if not isinstance(outcome, Exception) and outcome[0].status == "success" and not outcome[0].from_cache
+            and outcome[0].questions_count < PREGENERATE_BANK_SIZE
+        ]
+        if fresh_files:
+            schedule_pregeneration(fresh_files, request.project_id)
+    
+    # Câu hỏi thô (dict của generator) cùng file nguồn, để dedupe giữa các file
+    raw_questions = []
+    question_sources = {}
+    served_counts = {}
+    cache_keys = {}
+    
+    for file_index, (file_input, outcome) in enumerate(zip(request.files, outcomes)):
         try:
-            result, questions_data = process_single_file(file_input, questions_count)
+            if isinstance(outcome, Exception):
+                raise outcome
+            result, questions_data = outcome
             file_results.append(result)
             
             if result.status == "success" and questions_data:
                 # Log question data structure để debug
                 logger.info(f"📊 Questions data structure: {type(questions_data)}")
-                if questions_data.get("questions"):
-                    first_q = questions_data["questions"][0] if questions_data["questions"] else {}
+                file_questions = questions_data.get("questions") or []
+                if file_questions:
+                    first_q = file_questions[0]
                     logger.info(f"📝 First question keys: {list(first_q.keys())}")
                     logger.info(f"📋 First question structure: {json.dumps(first_q, indent=2)[:200]}...")
-                
-                # Check if already in new format
-                if questions_data.get("questions") and len(questions_data["questions"]) > 0:
-                    first_question = questions_data["questions"][0]
-                    if "choices" in first_question and isinstance(first_question.get("choices"), list):
-                        # Already new format, no conversion needed
-                        logger.info("✅ Questions already in new format, no conversion needed")
-                        for q in questions_data["questions"]:
-                            if isinstance(q.get("choices"), list):
-                                new_question = Question(
-                                    question=q.get("question", ""),
-                                    type=q.get("type", "multiple_choice"),
-                                    difficulty=q.get("difficulty", "medium"),
-                                    explanation=q.get("explanation", ""),
-                                    choices=[Choice(**choice) for choice in q["choices"]]
-                                )
-                                all_questions.append(new_question)
-                    else:
-                        # Old format, need conversion
-                        logger.info("🔄 Converting from old format to new format")
-                        file_questions = questions_data.get("questions", [])
-                        converted_questions = convert_questions_to_new_format(file_questions)
-                        all_questions.extend(converted_questions)
                 else:
                     logger.warning("⚠️ No questions found in response")
                 
+                # Gom câu hỏi của mọi file để dedupe trước khi convert
+                for q in file_questions:
+                    question_sources[id(q)] = file_index
+                raw_questions.extend(file_questions)
+                served_counts[file_index] = len(file_questions)
+                cache_keys[file_index] = result.cache_key
+                
                 # Collect content for summary
                 if result.from_cache:
-                    content = multi_file_cache.load_content_cache(file_input.file_name)
+                    content = multi_file_cache.load_content_cache(file_input.file_name, result.cache_key)
                     if content:
                         all_content.append(content[:1000])  # First 1000 chars
                 
-                # Track metadata
-                questions_per_file[file_input.file_name] = len(all_questions)
-                
                 if result.from_cache:
                     cached_files.append(file_input.file_name)
                 else:
@@ -1080,6 +1865,42 @@ def process_multiple_files(request: GenerateQuestionsRequest) -> QuestionRespons
             })
             questions_per_file[file_input.file_name] = 0
     
+    # Loại câu trùng/gần trùng giữa các file và batch, chỉ tạo thay thế cho các slot bị loại
+    def replace_removed(removed, round_index):
+        slot_sources = [question_sources[id(raw_questions[i])] for i in removed]
+        needed = Counter(slot_sources)
+        with ThreadPoolExecutor(max_workers=max(1, min(len(needed), MAX_FILE_WORKERS))) as executor:
+            futures = {
+                file_index: executor.submit(
+                    generate_replacement_questions, request.files[file_index], cache_keys[file_index],
+                    served_counts[file_index], count, request.project_id
+                )
+                for file_index, count in needed.items()
+            }
+        generated = {}
+        for file_index, future in futures.items():
+            try:
+                new_questions = future.result()
+            except Exception as e:
+                logger.error(f"Lỗi tạo câu thay thế cho {request.files[file_index].file_name}: {e}")
+                continue
+            served_counts[file_index] += len(new_questions)
+            for q in new_questions:
+                question_sources[id(q)] = file_index
+            generated[file_index] = iter(new_questions)
+        # Câu thay thế thứ j lấp slot removed[j] (None nếu file lỗi hoặc bank thiếu)
+        return [next(generated.get(file_index, iter(())), None) for file_index in slot_sources]
+    
+    kept_questions, deduper = dedupe_questions(raw_questions, replace_removed)
+    logger.info(f"🧹 Dedupe {len(raw_questions)} câu hỏi: {deduper.stats()}")
+    
+    for file_index, file_input in enumerate(request.files):
+        if file_index in served_counts:
+            questions_per_file[file_input.file_name] = sum(
+                1 for q in kept_questions if question_sources.get(id(q)) == file_index
+            )
+    all_questions = questions_from_data(kept_questions)
+    
     # Tạo summary từ content
     successful_files = [f.file_name for f in file_results if f.status == "success"]
     
@@ -1104,14 +1925,46 @@ def process_multiple_files(request: GenerateQuestionsRequest) -> QuestionRespons
     # Limit to requested amount
     final_questions = all_questions[:request.total_questions]
     
-    logger.info(f"✅ Hoàn thành: {len(final_questions)} câu hỏi từ {len(successful_files)} files")
+    logger.info(f"✅ Hoàn thành: {len(final_questions)} câu hỏi từ {len(successful_files)} files "
+                f"trong {time.time() - start_time:.2f}s - phân bổ: {questions_per_file}")
     
     return QuestionResponse(
         questions=final_questions,
         summary=summary
     )
 
+def generate_replacement_questions(file_input: FileInput, cache_key: Optional[str], served: int, count: int,
+                                   project_id: Optional[str] = None) -> List[Dict]:
+    """count câu tiếp theo trong bank của file (sau `served` câu đã dùng), bank thiếu thì tạo thêm"""
+    questions_data = generate_from_cache(file_input, served + count, cache_key, project_id)
+    if not questions_data:
+        return []
+    return questions_data.get("questions", [])[served:served + count]
+
 # ===== HELPER FUNCTIONS FOR NEW FORMAT =====
+def questions_from_data(questions: List[Dict]) -> List[Question]:
+    """Câu hỏi của generator -> model Question (format mới dùng trực tiếp, format cũ thì convert)"""
+    if not questions:
+        return []
+    first_question = questions[0]
+    if "choices" in first_question and isinstance(first_question.get("choices"), list):
+        # Already new format, no conversion needed
+        logger.info("✅ Questions already in new format, no conversion needed")
+        return [
+            Question(
+                question=q.get("question", ""),
+                type=q.get("type", "multiple_choice"),
+                difficulty=q.get("difficulty", "medium"),
+                explanation=q.get("explanation", ""),
+                choices=[Choice(**choice) for choice in q["choices"]]
+            )
+            for q in questions
+            if isinstance(q.get("choices"), list)
+        ]
+    # Old format, need conversion
+    logger.info("🔄 Converting from old format to new format")
+    return convert_questions_to_new_format(questions)
+
 def convert_questions_to_new_format(old_questions: List[Dict]) -> List[Question]:
     """Convert old format questions to new format"""
     new_questions = []
@@ -1379,12 +2232,89 @@ if __name__ == "__main__":
         log_level="info"
     )
 
+@app.get("/api/projects")
+async def list_projects():
+    """Danh sách project đã có corpus"""
+    projects = project_corpora.list_projects()
+    return {
+        "total": len(projects),
+        "projects": projects,
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/projects/{project_id}")
+async def get_project_corpus(project_id: str):
+    """Các file trong corpus của project"""
+    if not project_corpora.exists(project_id):
+        raise HTTPException(status_code=404, detail="Project không tồn tại")
+    return project_corpora.get(project_id).stats()
+
+@app.post("/api/projects/{project_id}/query")
+async def query_project_corpus(project_id: str, request: ProjectQueryRequest):
+    """Tìm các chunks liên quan nhất tới topic trên toàn bộ file của project"""
+    if not project_corpora.exists(project_id):
+        raise HTTPException(status_code=404, detail="Project không tồn tại")
+    try:
+        corpus = project_corpora.get(project_id)
+        # Encode + dựng index lần đầu là CPU-bound
+        hits = await asyncio.to_thread(corpus.query, request.topic, request.top_k)
+        return {
+            "project_id": project_id,
+            "topic": request.topic,
+            "results": hits,
+            "timestamp": datetime.now().isoformat()
+        }
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"Project query error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Lỗi query project: {str(e)}")
+
+@app.post("/api/projects/{project_id}/query-batch")
+async def query_project_corpus_batch(project_id: str, request: ProjectBatchQueryRequest):
+    """Top-k chunks cho nhiều topic cùng lúc (1 forward pass + 1 phép nhân ma trận)"""
+    if not project_corpora.exists(project_id):
+        raise HTTPException(status_code=404, detail="Project không tồn tại")
+    try:
+        corpus = project_corpora.get(project_id)
+        hits = await asyncio.to_thread(corpus.query_many, request.topics, request.top_k)
+        return {
+            "project_id": project_id,
+            "results": [
+                {"topic": topic, "results": topic_hits}
+                for topic, topic_hits in zip(request.topics, hits)
+            ],
+            "timestamp": datetime.now().isoformat()
+        }
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"Project batch query error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Lỗi query project: {str(e)}")
+
+@app.delete("/api/projects/{project_id}/files/{file_key}")
+async def remove_project_file(project_id: str, file_key: str):
+    """Bỏ 1 file khỏi corpus của project (cache của file được giữ nguyên)"""
+    if not project_corpora.exists(project_id):
+        raise HTTPException(status_code=404, detail="Project không tồn tại")
+    removed = await asyncio.to_thread(project_corpora.get(project_id).remove_file, file_key)
+    if not removed:
+        raise HTTPException(status_code=404, detail="File không thuộc project")
+    return {"message": f"Đã bỏ {file_key} khỏi project {project_id}"}
+
+@app.delete("/api/projects/{project_id}")
+async def delete_project_corpus(project_id: str):
+    """Xóa corpus của project"""
+    if not project_corpora.delete(project_id):
+        raise HTTPException(status_code=404, detail="Project không tồn tại")
+    return {"message": f"Đã xóa corpus project {project_id}"}
+
 @app.get("/api/cache/info")
 async def get_cache_info():
     """Thông tin về cache system"""
     try:
         content_files = list(multi_file_cache.content_dir.glob("*.txt"))
-        embedding_files = list(multi_file_cache.embeddings_dir.glob("*.pkl"))
+        embedding_files = multi_file_cache.list_embedding_files()
         
         cache_info = {
             "cache_directory": str(multi_file_cache.cache_dir),
@@ -1396,6 +2326,8 @@ async def get_cache_info():
                 "count": len(embedding_files),
                 "files": [f.name for f in embedding_files[:10]]  # Show first 10
             },
+            "chunk_embedding_cache": get_chunk_embedding_cache().stats(),
+            "llm_response_cache": llm_cache_stats(),
             "total_size_mb": sum(f.stat().st_size for f in multi_file_cache.cache_dir.rglob("*") if f.is_file()) / (1024*1024),
             "created": datetime.now().isoformat()
         }
@@ -1412,7 +2344,7 @@ async def clear_cache():
         
         # Count files before clearing
         content_files = len(list(multi_file_cache.content_dir.glob("*.txt")))
-        embedding_files = len(list(multi_file_cache.embeddings_dir.glob("*.pkl")))
+        embedding_files = len(multi_file_cache.list_embedding_files())
         
         # Clear cache directories
         if multi_file_cache.content_dir.exists():
@@ -1421,11 +2353,30 @@ async def clear_cache():
             shutil.rmtree(multi_file_cache.embeddings_dir)
         if multi_file_cache.questions_dir.exists():
             shutil.rmtree(multi_file_cache.questions_dir)
+        if multi_file_cache.pages_dir.exists():
+            shutil.rmtree(multi_file_cache.pages_dir)
         
         # Recreate directories
         multi_file_cache.content_dir.mkdir(parents=True, exist_ok=True)
         multi_file_cache.embeddings_dir.mkdir(parents=True, exist_ok=True)
         multi_file_cache.questions_dir.mkdir(parents=True, exist_ok=True)
+        multi_file_cache.pages_dir.mkdir(parents=True, exist_ok=True)
+        
+        # Clear chunk-level embedding cache
+        get_chunk_embedding_cache().clear()
+        
+        # Corpus project trỏ tới embedding store vừa xóa
+        project_corpora.clear()
+        
+        # LLM responses
+        response_cache = get_llm_response_cache()
+        if response_cache:
+            response_cache.clear()
+        
+        # Clear URL -> digest index
+        with multi_file_cache.url_index_lock:
+            multi_file_cache.url_index.clear()
+            multi_file_cache._save_url_index()
         
         return {
             "message": "Cache đã được xóa thành công",
@@ -26,9 +26,10 @@ from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, validator
-import requests
 import uvicorn
 
+from downloader import get_downloader
+
 # Import module genQ
 import importlib.util
 import sys
@@ -155,54 +156,77 @@ class OptimizedMultiFileCache:
             except Exception as e:
                 logger.error(f"Lỗi cache content: {e}")
     
+    def _questions_path(self, file_name: str) -> Path:
+        return self.cache_dir / f"{self._get_file_hash(file_name)}_questions.json"
+    
+    def _load_question_bank(self, file_name: str) -> List:
+        """Bank câu hỏi của file (memory -> disk), gọi khi đang giữ cache_lock"""
+        if file_name in self.memory_cache and 'questions' in self.memory_cache[file_name]:
+            return self.memory_cache[file_name]['questions']
+        
+        questions = []
+        questions_path = self._questions_path(file_name)
+        if questions_path.exists():
+            try:
+                with open(questions_path, 'r', encoding='utf-8') as f:
+                    questions = json.load(f)
+            except Exception as e:
+                logger.error(f"Lỗi đọc cached questions: {e}")
+        
+        self.memory_cache.setdefault(file_name, {})['questions'] = questions
+        return questions
+    
+    def get_question_bank(self, file_name: str) -> List:
+        """Toàn bộ câu hỏi đã tạo cho file (append-only)"""
+        with self.cache_lock:
+            return list(self._load_question_bank(file_name))
+    
     def get_cached_questions(self, file_name: str, num_questions: int) -> Optional[List]:
-        """Lấy cached questions"""
+        """Tối đa num_questions câu hỏi từ bank (có thể ít hơn - phần thiếu được tạo thêm), None nếu bank rỗng"""
         with self.cache_lock:
-            # Check memory cache first
-            if (file_name in self.memory_cache and 
-                'questions' in self.memory_cache[file_name] and
-                len(self.memory_cache[file_name]['questions']) >= num_questions):
-                return self.memory_cache[file_name]['questions'][:num_questions]
-            
-            # Check disk cache
-            file_hash = self._get_file_hash(file_name)
-            questions_path = self.cache_dir / f"{file_hash}_questions.json"
-            
-            if questions_path.exists():
-                try:
-                    with open(questions_path, 'r', encoding='utf-8') as f:
-                        questions = json.load(f)
-                    
-                    if len(questions) >= num_questions:
-                        # Cache in memory
-                        if file_name not in self.memory_cache:
-                            self.memory_cache[file_name] = {}
-                        self.memory_cache[file_name]['questions'] = questions
-                        return questions[:num_questions]
-                except Exception as e:
-                    logger.error(f"Lỗi đọc cached questions: {e}")
-            
-            return None
+            questions = self._load_question_bank(file_name)
+            return questions[:num_questions] if questions else None
     
-    def cache_questions(self, file_name: str, questions: List):
-        """Cache questions"""
+    def cache_questions(self, file_name: str, questions: List) -> int:
+        """Nối câu hỏi mới vào bank của file (không ghi đè bank cũ, bỏ câu trùng nội dung)
+
+        Returns:
+            Số câu hỏi trong bank sau khi thêm
+        """
         with self.cache_lock:
             try:
-                # Cache in memory
-                if file_name not in self.memory_cache:
-                    self.memory_cache[file_name] = {}
-                self.memory_cache[file_name]['questions'] = questions
+                bank = self._load_question_bank(file_name)
+                seen = {self._question_key(q) for q in bank}
+                added = []
+                for question in questions:
+                    key = self._question_key(question)
+                    if key not in seen:
+                        seen.add(key)
+                        added.append(question)
+                if not added:
+                    return len(bank)
                 
-                # Cache on disk
-                file_hash = self._get_file_hash(file_name)
-                questions_path = self.cache_dir / f"{file_hash}_questions.json"
+                bank = bank + added
+                self.memory_cache[file_name]['questions'] = bank
                 
-                with open(questions_path, 'w', encoding='utf-8') as f:
-                    json.dump(questions, f, ensure_ascii=False, indent=2)
+                # Cache on disk (atomic replace)
+                questions_path = self._questions_path(file_name)
+                tmp_path = questions_path.with_suffix(".json.tmp")
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(bank, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, questions_path)
                 
-                logger.info(f"Đã cache {len(questions)} câu hỏi cho file: {file_name}")
+                logger.info(f"Đã thêm {len(added)} câu hỏi vào bank của {file_name} (tổng {len(bank)})")
+                return len(bank)
             except Exception as e:
                 logger.error(f"Lỗi cache questions: {e}")
+                return 0
+    
+    @staticmethod
+    def _question_key(question) -> str:
+        """Nội dung câu hỏi (để không thêm trùng vào bank)"""
+        text = question.get("question", "") if isinstance(question, dict) else str(question)
+        return " ".join(text.split()).casefold()
     
     def clear_cache(self):
         """Xóa toàn bộ cache"""
@@ -255,22 +279,12 @@ def load_question_generator():
         raise HTTPException(status_code=500, detail=f"Lỗi khởi tạo hệ thống: {str(e)}")
 
 def download_file_parallel(url: str, local_path: str) -> bool:
-    """Download file với timeout tối ưu"""
+    """Download file qua downloader dùng chung (streaming, connection pool, resume)"""
     try:
         logger.info(f"Tải file: {url}")
         
-        # Sử dụng session để tối ưu connection
-        session = requests.Session()
-        response = session.get(url, stream=True, timeout=120)  # Giảm timeout
-        response.raise_for_status()
-        
-        with open(local_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=32768):  # Tăng chunk size
-                if chunk:
-                    f.write(chunk)
-        
-        file_size = os.path.getsize(local_path)
-        logger.info(f"Đã tải: {file_size:,} bytes")
+        result = get_downloader().download_sync(url, local_path)
+        logger.info(f"Đã tải: {result['size']:,} bytes")
         
         return True
     except Exception as e:
@@ -281,63 +295,67 @@ def process_single_file_optimized(file_input: FileInput, questions_needed: int,
     """Xử lý một file với tối ưu hóa"""
     start_time = time.time()
     file_name = file_input.file_name
+    temp_path = None
     
     try:
-        # 1. Kiểm tra cache trước
-        cached_questions = cache.get_cached_questions(file_name, questions_needed)
-        if cached_questions:
-            logger.info(f"✅ Sử dụng cache cho {file_name}: {len(cached_questions)} câu")
+        # 1. Bank câu hỏi đã có: đủ thì dùng luôn, thiếu thì chỉ tạo phần còn thiếu
+        banked_count = len(cache.get_question_bank(file_name))
+        if banked_count >= questions_needed:
+            logger.info(f"✅ Sử dụng cache cho {file_name}: {questions_needed}/{banked_count} câu")
             return FileProcessingResult(
                 file_name=file_name,
                 status="cached",
-                questions_count=len(cached_questions),
+                questions_count=questions_needed,
                 processing_time=time.time() - start_time,
                 from_cache=True
             )
+        missing = questions_needed - banked_count
+        if banked_count:
+            logger.info(f"Bank của {file_name} có {banked_count} câu, tạo thêm {missing}")
         
-        # 2. Download file
-        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp_file:
-            temp_path = temp_file.name
-        
-        if not download_file_parallel(file_input.url, temp_path):
-            raise Exception("Không thể tải file")
-        
-        # 3. Kiểm tra cached content
+        # 2. Kiểm tra cached content (có content thì không cần tải lại file)
         cached_content = cache.get_cached_content(file_name)
         
         if cached_content:
             logger.info(f"Sử dụng cached content cho {file_name}")
             generator.pdf_content = cached_content
         else:
+            # 3. Download file
+            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp_file:
+                temp_path = temp_file.name
+            
+            if not download_file_parallel(file_input.url, temp_path):
+                raise Exception("Không thể tải file")
+            
             # Convert PDF to text
             generator.convert_pdf_to_text(temp_path)
             # Cache content
             cache.cache_content(file_name, generator.pdf_content)
         
-        # 4. Tạo câu hỏi với batch processing
-        questions = generator.generate_questions_batch_optimized(questions_needed)
+        # 4. Tạo phần câu hỏi còn thiếu với batch processing
+        questions = generator.generate_questions_batch_optimized(missing)
         
-        # 5. Cache questions
-        cache.cache_questions(file_name, questions)
+        # 5. Nối vào bank (append-only)
+        total_banked = cache.cache_questions(file_name, questions)
         
         # Cleanup
-        if os.path.exists(temp_path):
+        if temp_path and os.path.exists(temp_path):
             os.unlink(temp_path)
         
         processing_time = time.time() - start_time
-        logger.info(f"✅ Xử lý {file_name}: {len(questions)} câu trong {processing_time:.2f}s")
+        logger.info(f"✅ Xử lý {file_name}: +{len(questions)} câu mới (bank {total_banked}) trong {processing_time:.2f}s")
         
         return FileProcessingResult(
             file_name=file_name,
             status="success",
-            questions_count=len(questions),
+            questions_count=min(questions_needed, total_banked),
             processing_time=processing_time,
             from_cache=False
         )
         
     except Exception as e:
         # Cleanup
-        if 'temp_path' in locals() and os.path.exists(temp_path):
+        if temp_path and os.path.exists(temp_path):
             os.unlink(temp_path)
         
         logger.error(f"❌ Lỗi xử lý {file_name}: {str(e)}")
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Các module của ai/ import trực tiếp theo tên (chạy từ thư mục ai/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
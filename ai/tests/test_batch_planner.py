@@ -0,0 +1,54 @@
+"""Test lập kế hoạch nội dung batch theo cụm embeddings"""
+
+import numpy as np
+import pytest
+
+from batch_planner import allocate_batches, plan_batch_contents
+
+
+@pytest.mark.parametrize("sizes, num_batches, expected", [
+    ([10, 10, 10], 6, [2, 2, 2]),
+    ([30, 10], 6, [4, 2]),
+    ([1, 100], 3, [1, 2]),
+    ([5, 50, 20], 2, [0, 1, 1]),
+    ([], 4, []),
+    ([3, 4], 0, [0, 0]),
+])
+def test_allocate_batches(sizes, num_batches, expected):
+    allocation = allocate_batches(sizes, num_batches)
+    assert allocation.tolist() == expected
+    assert allocation.sum() == (num_batches if sizes else 0)
+
+
+def topic_chunks():
+    """2 chủ đề tách biệt, xen kẽ trong tài liệu"""
+    chunks, vectors = [], []
+    for i in range(12):
+        topic = i % 2
+        chunks.append(f"{'Sinh học' if topic == 0 else 'Lịch sử'} đoạn {i}.")
+        vector = np.zeros(4, dtype=np.float32)
+        vector[topic] = 1.0
+        vector[2 + topic] = 0.01 * i
+        vectors.append(vector / np.linalg.norm(vector))
+    return chunks, np.vstack(vectors)
+
+
+def test_plan_batch_contents_keeps_topics_apart_and_interleaves_clusters():
+    chunks, embeddings = topic_chunks()
+    contents, clusters, pages = plan_batch_contents(chunks, embeddings, num_batches=4, max_tokens=30)
+    assert len(contents) == len(clusters) == len(pages) == 4
+    # Xen kẽ: 2 batch liên tiếp không cùng cụm
+    assert clusters[0] != clusters[1] and clusters[2] != clusters[3]
+    for content in contents:
+        assert ("Sinh học" in content) != ("Lịch sử" in content)
+    # Các batch của cùng 1 cụm nhận chunks khác nhau
+    for cluster in set(clusters):
+        batches = [set(content.split("\n\n")) for content, c in zip(contents, clusters) if c == cluster]
+        assert not batches[0] & batches[1]
+
+
+def test_plan_batch_contents_needs_matching_embeddings():
+    chunks, embeddings = topic_chunks()
+    assert plan_batch_contents(chunks[:1], embeddings[:1], 2, 30) is None
+    assert plan_batch_contents(chunks, embeddings[:5], 2, 30) is None
+    assert plan_batch_contents(chunks, embeddings, 0, 30) is None
@@ -0,0 +1,130 @@
+"""Test downloader: resume bằng HTTP Range, giới hạn dung lượng, validate bản đã tải"""
+
+import asyncio
+import hashlib
+
+import httpx
+import pytest
+
+import downloader
+from downloader import (AsyncDownloader, DownloadError, VALIDATION_FRESH, VALIDATION_STALE,
+                        VALIDATION_UNKNOWN)
+
+DATA = bytes(range(256)) * 8
+ETAG = '"v1"'
+
+
+class BrokenStream(httpx.AsyncByteStream):
+    """Body bị ngắt kết nối sau `fail_after` bytes"""
+
+    def __init__(self, data, fail_after):
+        self.data = data
+        self.fail_after = fail_after
+
+    async def __aiter__(self):
+        yield self.data[:self.fail_after]
+        raise httpx.ReadError("connection reset")
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    real_sleep = asyncio.sleep
+    monkeypatch.setattr(downloader.asyncio, "sleep", lambda delay: real_sleep(0))
+
+
+def make_downloader(handler, **kwargs):
+    instance = AsyncDownloader(chunk_size=64, **kwargs)
+    instance._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return instance
+
+
+def test_resumes_with_range_after_disconnect(tmp_path):
+    requests = []
+
+    def handler(request):
+        requests.append(dict(request.headers))
+        if len(requests) == 1:
+            return httpx.Response(200, headers={'ETag': ETAG, 'Content-Length': str(len(DATA))},
+                                  stream=BrokenStream(DATA, 640))
+        start = int(request.headers['Range'].split('=')[1].rstrip('-'))
+        return httpx.Response(206, content=DATA[start:])
+
+    result = make_downloader(handler).download_sync("https://s3.test/doc.pdf", str(tmp_path / "doc.pdf"))
+    assert (tmp_path / "doc.pdf").read_bytes() == DATA
+    assert result['size'] == len(DATA) and result['digest'] == hashlib.sha256(DATA).hexdigest()
+    assert requests[1]['range'] == "bytes=640-" and requests[1]['if-range'] == ETAG
+    assert result['headers']['etag'] == ETAG
+
+
+def test_restarts_when_server_ignores_range(tmp_path):
+    calls = []
+
+    def handler(request):
+        calls.append(request.headers.get('Range'))
+        if len(calls) == 1:
+            return httpx.Response(200, headers={'ETag': ETAG}, stream=BrokenStream(DATA, 320))
+        return httpx.Response(200, headers={'ETag': ETAG}, content=DATA)
+
+    result = make_downloader(handler).download_sync("https://s3.test/doc.pdf", str(tmp_path / "doc.pdf"))
+    assert calls == [None, "bytes=320-"]
+    assert (tmp_path / "doc.pdf").read_bytes() == DATA
+    assert result['digest'] == hashlib.sha256(DATA).hexdigest()
+
+
+def test_gives_up_after_max_retries(tmp_path):
+    def handler(request):
+        return httpx.Response(200, stream=BrokenStream(DATA, 10))
+
+    with pytest.raises(DownloadError):
+        make_downloader(handler, max_retries=2).download_sync("https://s3.test/doc.pdf", str(tmp_path / "doc.pdf"))
+
+
+@pytest.mark.parametrize("response, status_code", [
+    (httpx.Response(404), 404),
+    (httpx.Response(200, headers={'Content-Length': str(len(DATA))}, content=DATA), 413),
+])
+def test_http_errors_and_size_limit(tmp_path, response, status_code):
+    instance = make_downloader(lambda request: response, max_bytes=len(DATA) - 1)
+    with pytest.raises(DownloadError) as error:
+        instance.download_sync("https://s3.test/doc.pdf", str(tmp_path / "doc.pdf"))
+    assert error.value.status_code == status_code
+
+
+# ===== Validate bản đã tải =====
+@pytest.mark.parametrize("status_code, headers, etag, last_modified, expected", [
+    (304, {}, ETAG, None, VALIDATION_FRESH),
+    (206, {'ETag': ETAG}, ETAG, None, VALIDATION_FRESH),
+    (206, {'ETag': '"v2"'}, ETAG, None, VALIDATION_STALE),
+    (200, {'Last-Modified': "Mon, 01 Jan 2024 00:00:00 GMT"}, None, "Mon, 01 Jan 2024 00:00:00 GMT", VALIDATION_FRESH),
+    (200, {'Last-Modified': "Tue, 02 Jan 2024 00:00:00 GMT"}, None, "Mon, 01 Jan 2024 00:00:00 GMT", VALIDATION_STALE),
+    (206, {}, ETAG, None, VALIDATION_UNKNOWN),
+    (404, {}, ETAG, None, VALIDATION_STALE),
+    (410, {}, ETAG, None, VALIDATION_STALE),
+    (403, {}, ETAG, None, VALIDATION_UNKNOWN),
+    (405, {}, ETAG, None, VALIDATION_UNKNOWN),
+    (500, {}, ETAG, None, VALIDATION_UNKNOWN),
+])
+def test_validation_result(status_code, headers, etag, last_modified, expected):
+    assert AsyncDownloader._validation_result(status_code, headers, etag, last_modified) == expected
+
+
+def test_validate_sends_conditional_one_byte_get():
+    seen = []
+
+    def handler(request):
+        seen.append((request.method, dict(request.headers)))
+        return httpx.Response(304)
+
+    result = make_downloader(handler).validate_sync("https://s3.test/doc.pdf?X-Amz-Signature=x", etag=ETAG,
+                                                    last_modified="Mon, 01 Jan 2024 00:00:00 GMT")
+    assert result == VALIDATION_FRESH
+    method, headers = seen[0]
+    assert method == "GET" and headers['range'] == "bytes=0-0"
+    assert headers['if-none-match'] == ETAG and headers['if-modified-since'] == "Mon, 01 Jan 2024 00:00:00 GMT"
+
+
+def test_validate_network_error_is_unknown():
+    def handler(request):
+        raise httpx.ConnectError("down")
+
+    assert make_downloader(handler).validate_sync("https://s3.test/doc.pdf", etag=ETAG) == VALIDATION_UNKNOWN
@@ -0,0 +1,148 @@
+"""Test embedding_store: cache embedding theo chunk dùng chung giữa các process, lượng tử hóa float16/int8"""
+
+import hashlib
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from embedding_store import (ChunkEmbeddingCache, chunk_text_key, EmbeddingStore, QuantizedMatrix,
+                             normalize_rows, quantize_embeddings, similarity_scores)
+from text_chunker import Chunk
+
+DIM = 8
+
+
+def fake_encode(texts):
+    """Vector xác định theo text -> kiểm tra được dòng i có đúng là vector của key i"""
+    rows = []
+    for text in texts:
+        digest = hashlib.sha256(text.encode('utf-8')).digest()
+        rows.append(np.frombuffer(digest[:DIM * 4], dtype=np.uint8)[:DIM].astype(np.float32))
+    return np.vstack(rows)
+
+
+def encode_in_process(cache_dir, worker, barrier):
+    cache = ChunkEmbeddingCache(cache_dir)
+    barrier.wait()
+    for start in range(0, 60, 3):
+        # Một nửa chunk chung giữa các process, một nửa riêng
+        texts = [f"chung {start + i}" for i in range(3)] + [f"riêng {worker} {start + i}" for i in range(3)]
+        cache.encode(texts, fake_encode)
+
+
+def test_reuses_cached_vectors(tmp_path):
+    calls = []
+
+    def encode_fn(texts):
+        calls.append(list(texts))
+        return fake_encode(texts)
+
+    cache = ChunkEmbeddingCache(tmp_path)
+    first = cache.encode(["a b", "c", "a b"], encode_fn)
+    again = cache.encode(["A  B", "d"], encode_fn)
+    assert calls == [["a b", "c"], ["d"]]
+    np.testing.assert_array_equal(first[0], again[0])
+    assert cache.stats()["entries"] == 3
+
+
+def test_other_instance_sees_new_rows(tmp_path):
+    writer = ChunkEmbeddingCache(tmp_path)
+    reader = ChunkEmbeddingCache(tmp_path)
+    writer.encode(["x", "y"], fake_encode)
+
+    def fail(texts):
+        raise AssertionError(f"không được encode lại {texts}")
+
+    np.testing.assert_array_equal(reader.encode(["y", "x"], fail), fake_encode(["y", "x"]))
+
+
+def test_concurrent_processes_keep_keys_and_vectors_aligned(tmp_path):
+    context = multiprocessing.get_context("fork")
+    barrier = context.Barrier(4)
+    workers = [context.Process(target=encode_in_process, args=(str(tmp_path), i, barrier)) for i in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(60)
+        assert worker.exitcode == 0
+
+    keys = (tmp_path / "keys.txt").read_text(encoding='utf-8').split()
+    vectors = np.fromfile(tmp_path / "vectors.f32", dtype=np.float32).reshape(-1, DIM)
+    assert len(keys) == len(vectors) == len(set(keys)) == 60 + 4 * 60
+
+    expected = {}
+    texts = [f"chung {i}" for i in range(60)] + [f"riêng {w} {i}" for w in range(4) for i in range(60)]
+    for text, vector in zip(texts, fake_encode(texts)):
+        expected[chunk_text_key(text)] = vector
+    for key, vector in zip(keys, vectors):
+        np.testing.assert_array_equal(vector, expected[key])
+
+
+def test_truncated_write_is_cut_back(tmp_path):
+    cache = ChunkEmbeddingCache(tmp_path)
+    cache.encode(["a", "b"], fake_encode)
+    # Lần ghi bị ngắt: vector đã ghi nhưng key chưa, và nửa dòng key
+    with open(tmp_path / "vectors.f32", "ab") as f:
+        f.write(fake_encode(["c"]).tobytes())
+    with open(tmp_path / "keys.txt", "a", encoding='utf-8') as f:
+        f.write("abc")
+
+    reloaded = ChunkEmbeddingCache(tmp_path)
+    assert reloaded.rows == 2
+    assert (tmp_path / "vectors.f32").stat().st_size == 2 * DIM * 4
+    np.testing.assert_array_equal(reloaded.encode(["c", "a"], fake_encode), fake_encode(["c", "a"]))
+
+
+# ===== Lượng tử hóa float16 / int8 =====
+def random_embeddings(rows=50, dim=32, seed=0):
+    return np.random.default_rng(seed).normal(size=(rows, dim)).astype(np.float32)
+
+
+def cosine(queries, embeddings):
+    return normalize_rows(queries) @ normalize_rows(embeddings).T
+
+
+@pytest.mark.parametrize("mode, dtype, max_error", [
+    ("float32", np.float32, 1e-6),
+    ("float16", np.float16, 2e-3),
+    ("int8", np.int8, 2e-2),
+])
+def test_quantized_scores_match_float32_cosine(mode, dtype, max_error):
+    embeddings = random_embeddings()
+    queries = random_embeddings(rows=3, seed=1)
+    quantized = quantize_embeddings(embeddings, mode)
+    values = quantized.values if isinstance(quantized, QuantizedMatrix) else quantized
+    assert values.dtype == dtype and quantized.shape == embeddings.shape
+
+    scores = similarity_scores(quantized, queries)
+    assert scores.dtype == np.float32
+    assert np.abs(scores - cosine(queries, embeddings)).max() < max_error
+    # Score theo block cho cùng kết quả
+    np.testing.assert_allclose(similarity_scores(quantized, queries, block_rows=7), scores, atol=1e-6)
+
+
+def test_int8_uses_a_quarter_of_the_memory():
+    embeddings = random_embeddings(rows=100, dim=64)
+    quantized = quantize_embeddings(embeddings, "int8")
+    assert quantized.nbytes == 100 * 64 + 100 * 4
+    assert np.abs(quantized.to_float32() - normalize_rows(embeddings)).max() < 1e-2
+
+
+def test_invalid_quantization_mode():
+    with pytest.raises(ValueError):
+        quantize_embeddings(random_embeddings(), "int4")
+
+
+def test_store_round_trip_int8(tmp_path):
+    embeddings = random_embeddings(rows=4, dim=8)
+    chunks = [Chunk(f"đoạn {i}", i + 1, i + 1) for i in range(4)]
+    store = EmbeddingStore(tmp_path / "doc")
+    store.save(embeddings, chunks, quantization="int8")
+
+    loaded, loaded_chunks = store.load()
+    assert isinstance(loaded, QuantizedMatrix)
+    assert list(loaded_chunks) == chunks
+    assert [chunk.page_start for chunk in loaded_chunks] == [1, 2, 3, 4]
+    scores = similarity_scores(loaded, embeddings[:1])
+    assert int(np.argmax(scores)) == 0
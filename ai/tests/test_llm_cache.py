@@ -0,0 +1,85 @@
+"""Test LLM response cache: key, điều kiện cache, LRU theo số entries / dung lượng"""
+
+import itertools
+
+import pytest
+
+import llm_cache
+from llm_cache import LLMResponseCache, response_key, is_cacheable, seed_from_env
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Thời gian tăng dần từng bước: thứ tự last_used không bị trùng"""
+    ticks = itertools.count(1)
+    monkeypatch.setattr(llm_cache.time, "time", lambda: float(next(ticks)))
+
+
+def test_response_key_covers_every_parameter():
+    base = response_key("gpt", "prompt", 0.7, 100, 1)
+    assert base == response_key("gpt", "prompt", 0.70001, 100, 1)
+    variants = [
+        response_key("gpt-2", "prompt", 0.7, 100, 1),
+        response_key("gpt", "prompt!", 0.7, 100, 1),
+        response_key("gpt", "prompt", 0.2, 100, 1),
+        response_key("gpt", "prompt", 0.7, 200, 1),
+        response_key("gpt", "prompt", 0.7, 100, 2),
+        response_key("gpt", "prompt", 0.7, 100, None),
+    ]
+    assert base not in variants and len(set(variants)) == len(variants)
+
+
+@pytest.mark.parametrize("temperature, seed, mode, expected", [
+    (0, None, "deterministic", True),
+    (0.7, None, "deterministic", False),
+    (0.7, 3, "deterministic", True),
+    (0.7, None, "all", True),
+    (0, 3, "off", False),
+])
+def test_is_cacheable(temperature, seed, mode, expected):
+    assert is_cacheable(temperature, seed, mode) is expected
+
+
+def test_seed_from_env(monkeypatch):
+    monkeypatch.setenv("TEST_SEED", "off")
+    assert seed_from_env("TEST_SEED", "0") is None
+    monkeypatch.setenv("TEST_SEED", " 42 ")
+    assert seed_from_env("TEST_SEED") == 42
+    monkeypatch.delenv("TEST_SEED")
+    assert seed_from_env("TEST_SEED", "0") == 0
+    assert seed_from_env("TEST_SEED") is None
+
+
+def test_evicts_least_recently_used_entry(tmp_path, clock):
+    cache = LLMResponseCache(str(tmp_path / "llm.sqlite3"), max_entries=2, max_bytes=10 ** 6)
+    cache.put("a", "response a")
+    cache.put("b", "response b")
+    assert cache.get("a") == "response a"  # a vừa được dùng -> b cũ nhất
+    cache.put("c", "response c")
+    assert cache.get("b") is None
+    assert cache.get("a") == "response a" and cache.get("c") == "response c"
+    assert cache.stats()["entries"] == 2 and cache.evictions == 1
+
+
+def test_evicts_by_total_size(tmp_path, clock):
+    cache = LLMResponseCache(str(tmp_path / "llm.sqlite3"), max_entries=100, max_bytes=25)
+    cache.put("a", "x" * 10)
+    cache.put("b", "y" * 10)
+    cache.put("c", "z" * 10)
+    assert cache.get("a") is None
+    assert cache.total_bytes == 20
+    # Response lớn hơn cả giới hạn: không lưu, không đẩy entry khác ra
+    cache.put("huge", "w" * 30)
+    assert cache.get("huge") is None and cache.get("b") == "y" * 10
+
+
+def test_replacing_entry_updates_size_and_persists(tmp_path, clock):
+    path = str(tmp_path / "llm.sqlite3")
+    cache = LLMResponseCache(path, max_entries=10, max_bytes=1000)
+    cache.put("a", "ngắn")
+    cache.put("a", "dài hơn nhiều")
+    assert cache.count == 1 and cache.total_bytes == len("dài hơn nhiều".encode('utf-8'))
+
+    reopened = LLMResponseCache(path, max_entries=10, max_bytes=1000)
+    assert reopened.get("a") == "dài hơn nhiều"
+    assert reopened.stats()["hits"] == 1 and reopened.stats()["entries"] == 1
@@ -0,0 +1,65 @@
+"""Test giới hạn số lời gọi LLM đồng thời: dùng chung cho mọi generator/thread, tính theo từng lời gọi"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import genQ_simple_fix
+from genQ_simple_fix import SimpleQuestionGenerator, RateLimiter
+
+
+class SlowClient:
+    """LLM giả: ghi lại số lời gọi đang chạy cùng lúc"""
+
+    def __init__(self, cached=None):
+        self.cached = cached or set()
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak = 0
+        self.calls = 0
+
+    def get_cached(self, prompt, **kwargs):
+        return "cached" if prompt in self.cached else None
+
+    def chat(self, prompt, **kwargs):
+        with self.lock:
+            self.in_flight += 1
+            self.calls += 1
+            self.peak = max(self.peak, self.in_flight)
+        time.sleep(0.05)
+        with self.lock:
+            self.in_flight -= 1
+        return "ok"
+
+
+def run_calls(monkeypatch, client, prompts, limit, threads=8):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(genQ_simple_fix, "get_llm_client", lambda: client)
+    monkeypatch.setattr(genQ_simple_fix, "llm_semaphore", threading.BoundedSemaphore(limit))
+    monkeypatch.setattr(genQ_simple_fix, "rate_limiter", RateLimiter(10_000, 10_000_000))
+    # Mỗi file 1 generator riêng, như process_files_concurrently
+    generators = [SimpleQuestionGenerator() for _ in prompts]
+    with ThreadPoolExecutor(threads) as executor:
+        return list(executor.map(lambda args: args[0].call_openai_api_safe(args[1]), zip(generators, prompts)))
+
+
+def test_llm_calls_in_flight_are_capped_across_generators(monkeypatch):
+    client = SlowClient()
+    results = run_calls(monkeypatch, client, [f"prompt {i}" for i in range(12)], limit=3)
+    assert results == ["ok"] * 12
+    assert client.calls == 12
+    assert client.peak == 3
+
+
+def test_cache_hits_do_not_take_a_slot(monkeypatch):
+    prompts = [f"prompt {i}" for i in range(5)]
+    client = SlowClient(cached=set(prompts))
+    # Semaphore đã hết slot: chỉ cache hit mới trả về được ngay
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(genQ_simple_fix, "get_llm_client", lambda: client)
+    busy = threading.BoundedSemaphore(1)
+    busy.acquire()
+    monkeypatch.setattr(genQ_simple_fix, "llm_semaphore", busy)
+    generator = SimpleQuestionGenerator()
+    assert [generator.call_openai_api_safe(prompt) for prompt in prompts] == ["cached"] * 5
+    assert client.calls == 0
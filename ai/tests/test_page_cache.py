@@ -0,0 +1,73 @@
+"""Test xử lý lại theo trang: map số trang cũ -> mới, mang câu hỏi sang phiên bản mới, dùng lại embeddings"""
+
+import numpy as np
+
+from page_cache import page_remap, carry_over_questions, assemble_chunks
+from text_chunker import Chunk
+
+
+def q(text, **extra):
+    return {"question": text, **extra}
+
+
+def page(number, text_hash):
+    return {"page": number, "text_hash": text_hash}
+
+
+def test_page_remap_follows_inserted_page():
+    previous = [page(1, "h1"), page(2, "h2"), page(3, "h3")]
+    # Chèn 1 trang mới ở đầu, trang 3 bị sửa
+    current = [page(1, "new"), page(2, "h1"), page(3, "h2"), page(4, "h3-edited")]
+    assert page_remap(previous, current) == {1: 2, 2: 3}
+
+
+def test_page_remap_ignores_pages_without_text():
+    assert page_remap([page(1, None), page(2, "h2")], [page(1, None), page(2, "h2")]) == {2: 2}
+
+
+def test_carry_over_keeps_only_questions_from_unchanged_pages():
+    previous = [page(1, "h1"), page(2, "h2"), page(3, "h3")]
+    current = [page(1, "new"), page(2, "h1"), page(3, "h2"), page(4, "h3-edited")]
+    questions = [
+        q("Trang 1", source_pages=[1]),
+        q("Trang 1-2", source_pages=[2, 1]),
+        q("Trang 2-3", source_pages=[2, 3]),
+        q("Không rõ trang"),
+    ]
+    carried = carry_over_questions(questions, previous, current)
+    assert [(item["question"], item["source_pages"]) for item in carried] == [
+        ("Trang 1", [2]),
+        ("Trang 1-2", [2, 3]),
+    ]
+    # Không sửa câu hỏi gốc
+    assert questions[0]["source_pages"] == [1]
+
+
+def test_assemble_chunks_reuses_rows_of_unchanged_pages():
+    previous_pages = [
+        {'page': 1, 'text_hash': "h1", 'chunk_start': 0, 'chunk_end': 2},
+        {'page': 2, 'text_hash': "h2", 'chunk_start': 2, 'chunk_end': 3},
+    ]
+    previous_chunks = ["trang 1 a", "trang 1 b", "trang 2 a"]
+    previous_embeddings = np.arange(6, dtype=np.float32).reshape(3, 2)
+    # Phiên bản mới: chèn 1 trang ở đầu, trang 2 cũ bị sửa
+    ingest = {
+        'content': "",
+        'pages': [page(1, "new"), page(2, "h1"), page(3, "h2-edited")],
+        'chunks': {1: [Chunk("trang mới", 1, 1)], 3: [Chunk("trang 2 đã sửa", 3, 3)]},
+    }
+    encoded = []
+
+    def encode_fn(texts):
+        encoded.append(list(texts))
+        return np.full((len(texts), 2), -1, dtype=np.float32)
+
+    chunks, embeddings, changed = assemble_chunks(ingest, previous_pages, previous_chunks,
+                                                  previous_embeddings, encode_fn=encode_fn)
+    assert [str(chunk) for chunk in chunks] == ["trang mới", "trang 1 a", "trang 1 b", "trang 2 đã sửa"]
+    assert [chunk.page_start for chunk in chunks] == [1, 2, 2, 3]
+    assert changed == [1, 3]
+    assert encoded == [["trang mới", "trang 2 đã sửa"]]
+    np.testing.assert_array_equal(embeddings[1:3], previous_embeddings[0:2])
+    assert embeddings[0].tolist() == [-1, -1] and embeddings[3].tolist() == [-1, -1]
+    assert [(record['chunk_start'], record['chunk_end']) for record in ingest['pages']] == [(0, 1), (1, 3), (3, 4)]
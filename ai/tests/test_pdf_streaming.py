@@ -0,0 +1,61 @@
+"""Test pipeline streaming: trang -> file tạm (PageSpool) -> chunks -> embeddings theo batch"""
+
+import numpy as np
+
+from pdfToText import PageSpool, iter_clean_pages, page_header
+from genQ_simple_fix import embed_chunk_stream
+
+
+def pages(count):
+    for page_num in range(count):
+        status = "empty" if page_num == 1 else "ok"
+        body = "[TRANG TRỐNG HOẶC KHÔNG CÓ TEXT]\n" if status == "empty" else f"Nội dung trang {page_num + 1}.\r\n"
+        yield page_num, page_header(page_num) + body, status
+
+
+def test_page_spool_manifest_offsets_match_content():
+    with PageSpool() as spool:
+        forwarded = list(spool.track(pages(3)))
+        content = spool.content()
+        manifest = spool.manifest
+        counts = spool.status_counts()
+
+    assert content == "".join(segment for _, segment, _ in forwarded)
+    for record, (page_num, segment, status) in zip(manifest, forwarded):
+        assert record['page'] == page_num + 1 and record['status'] == status
+        assert content[record['start']:record['end']] == segment
+    assert counts == {"ok": 2, "empty": 1}
+
+
+def test_clean_pages_skip_empty_pages():
+    with PageSpool() as spool:
+        cleaned = list(iter_clean_pages(spool.track(pages(3))))
+    assert [page for page, _ in cleaned] == [1, 3]
+
+
+def test_embed_chunk_stream_encodes_in_batches_while_consuming():
+    consumed = []
+    calls = []
+
+    def stream():
+        for i in range(7):
+            consumed.append(i)
+            yield f"chunk {i}"
+
+    def encode(batch):
+        # Batch đầu được encode trước khi stream chạy hết
+        calls.append((list(batch), len(consumed)))
+        return np.full((len(batch), 2), len(calls), dtype=np.float32)
+
+    chunks, embeddings = embed_chunk_stream(stream(), encode, batch_size=3)
+    assert chunks == [f"chunk {i}" for i in range(7)]
+    assert [(len(batch), seen) for batch, seen in calls] == [(3, 3), (3, 6), (1, 7)]
+    assert embeddings.shape == (7, 2)
+    assert embeddings[:, 0].tolist() == [1, 1, 1, 2, 2, 2, 3]
+
+
+def test_embed_chunk_stream_without_model():
+    chunks, embeddings = embed_chunk_stream(iter(["a", "b"]), lambda batch: None, batch_size=1)
+    assert chunks == ["a", "b"] and embeddings is None
+    chunks, embeddings = embed_chunk_stream(iter(["a"]), None)
+    assert chunks == ["a"] and embeddings is None
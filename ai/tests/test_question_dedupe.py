@@ -0,0 +1,149 @@
+"""Test dedupe câu hỏi (không cần LLM / model): lọc trùng + thay đúng slot bị loại"""
+
+import numpy as np
+import pytest
+
+import question_dedupe
+from question_dedupe import dedupe_questions, QuestionDeduper
+
+
+def q(text, **extra):
+    return {"question": text, **extra}
+
+
+def texts(questions):
+    return [question["question"] for question in questions]
+
+
+@pytest.fixture
+def exact_only(monkeypatch):
+    """Chỉ lọc trùng chính xác (không load model embedding)"""
+    monkeypatch.setattr(question_dedupe, "HAS_SENTENCE_TRANSFORMERS", False)
+
+
+@pytest.fixture
+def topic_vectors(monkeypatch):
+    """Encoder giả: câu cùng chủ đề (từ đầu tiên) có cùng vector -> gần trùng"""
+    topics = {}
+
+    def encode(items, name=None):
+        rows = []
+        for item in items:
+            vector = np.zeros(16, dtype=np.float32)
+            vector[topics.setdefault(item.split()[0].lower(), len(topics))] = 1.0
+            rows.append(vector)
+        return np.vstack(rows)
+
+    monkeypatch.setattr(question_dedupe, "HAS_SENTENCE_TRANSFORMERS", True)
+    monkeypatch.setattr(question_dedupe, "encode_texts", encode)
+
+
+def test_exact_duplicates_removed_keeping_first(exact_only):
+    kept, removed = QuestionDeduper().filter([q("A là gì?"), q("B là gì?"), q("  a LÀ GÌ? "), q("B là gì?")])
+    assert texts(kept) == ["A là gì?", "B là gì?"]
+    assert removed == [2, 3]
+
+
+def test_existing_questions_are_not_repeated(exact_only):
+    kept, removed = QuestionDeduper(existing=[q("A là gì?")]).filter([q("A là gì?"), q("C là gì?")])
+    assert texts(kept) == ["C là gì?"]
+    assert removed == [0]
+
+
+def test_near_duplicates_removed(topic_vectors):
+    deduper = QuestionDeduper(threshold=0.9)
+    kept, removed = deduper.filter([q("Mitochondria làm gì?"), q("Mitochondria có vai trò gì?"), q("Ribosome làm gì?")])
+    assert texts(kept) == ["Mitochondria làm gì?", "Ribosome làm gì?"]
+    assert removed == [1]
+    assert deduper.stats()["near_removed"] == 1
+
+
+def test_fallback_questions_are_protected(exact_only):
+    fallback = q("Câu mẫu", is_fallback=True)
+    kept, removed = QuestionDeduper().filter([fallback, dict(fallback)])
+    assert len(kept) == 2 and removed == []
+
+
+def test_replacements_only_fill_removed_slots(exact_only):
+    calls = []
+
+    def replace_fn(removed, round_index):
+        calls.append((list(removed), round_index))
+        return [q(f"Thay {round_index}-{i}") for i in range(len(removed))]
+
+    questions = [q("A"), q("A"), q("B"), q("B"), q("C")]
+    kept, _ = dedupe_questions(questions, replace_fn=replace_fn)
+    assert calls == [([1, 3], 0)]
+    assert texts(kept) == ["A", "B", "C", "Thay 0-0", "Thay 0-1"]
+
+
+def test_duplicate_replacements_are_refilled_next_round(exact_only):
+    rounds = {
+        # Lượt 0: 1 câu thay thế trùng câu đã giữ, 1 câu mới
+        0: [q("A"), q("D")],
+        1: [q("E")],
+    }
+    calls = []
+
+    def replace_fn(removed, round_index):
+        calls.append(list(removed))
+        return rounds[round_index]
+
+    kept, _ = dedupe_questions([q("A"), q("A"), q("A"), q("B")], replace_fn=replace_fn, max_rounds=2)
+    # Câu thay slot 1 bị loại, câu thay slot 2 được giữ -> lượt 1 chỉ xin lại slot 1
+    assert calls == [[1, 2], [1]]
+    assert texts(kept) == ["A", "B", "D", "E"]
+
+
+def test_rejected_slot_is_tracked_when_a_later_replacement_is_accepted(exact_only):
+    # Slot 1 thuộc batch "x", slot 3 thuộc batch "y": câu thay của batch x lại trùng
+    batches = ["x", "x", "y", "y", "z"]
+    rounds = {0: [q("B"), q("D")], 1: [q("E")]}
+    calls = []
+
+    def replace_fn(removed, round_index):
+        calls.append([batches[i] for i in removed])
+        return rounds[round_index]
+
+    kept, _ = dedupe_questions([q("A"), q("A"), q("B"), q("B"), q("C")], replace_fn=replace_fn)
+    assert calls == [["x", "y"], ["x"]]
+    assert texts(kept) == ["A", "B", "C", "D", "E"]
+
+
+def test_slots_without_replacement_are_requested_again(exact_only):
+    rounds = {0: [None, q("D")], 1: [q("E")]}
+    calls = []
+
+    def replace_fn(removed, round_index):
+        calls.append(list(removed))
+        return rounds[round_index]
+
+    kept, _ = dedupe_questions([q("A"), q("A"), q("B"), q("B")], replace_fn=replace_fn)
+    assert calls == [[1, 3], [1]]
+    assert texts(kept) == ["A", "B", "D", "E"]
+
+
+def test_short_replacement_list_keeps_trailing_slots(exact_only):
+    rounds = {0: [q("D")], 1: [None, None]}
+    calls = []
+
+    def replace_fn(removed, round_index):
+        calls.append(list(removed))
+        return rounds[round_index]
+
+    kept, _ = dedupe_questions([q("A"), q("A"), q("A"), q("A")], replace_fn=replace_fn)
+    # Lượt 1 không tạo được câu nào -> dừng
+    assert calls == [[1, 2, 3], [2, 3]]
+    assert texts(kept) == ["A", "D"]
+
+
+def test_rounds_are_limited_and_result_never_grows(exact_only):
+    calls = []
+
+    def replace_fn(removed, round_index):
+        calls.append(round_index)
+        return [q("A")] * (len(removed) + 3)
+
+    kept, _ = dedupe_questions([q("A"), q("A"), q("B")], replace_fn=replace_fn, max_rounds=2)
+    assert calls == [0, 1]
+    assert texts(kept) == ["A", "B"]
@@ -0,0 +1,124 @@
+"""Test chia chunks: tokenizer dự phòng, overlap theo câu, chunk theo trang"""
+
+import types
+
+import pytest
+
+import text_chunker
+from text_chunker import iter_chunks, count_tokens, split_sentences
+
+
+@pytest.fixture
+def reset_encoding(monkeypatch):
+    monkeypatch.setattr(text_chunker, "_encoding", None)
+    monkeypatch.setattr(text_chunker, "_encoding_loaded", False)
+
+
+@pytest.fixture
+def estimate_tokens(reset_encoding, monkeypatch):
+    # Đếm bằng ước lượng để số tokens không phụ thuộc tiktoken có cài hay không
+    monkeypatch.setattr(text_chunker, "HAS_TIKTOKEN", False)
+
+
+def fake_tiktoken(monkeypatch, encoding_for_model, get_encoding):
+    module = types.SimpleNamespace(encoding_for_model=encoding_for_model, get_encoding=get_encoding)
+    monkeypatch.setattr(text_chunker, "HAS_TIKTOKEN", True)
+    monkeypatch.setattr(text_chunker, "tiktoken", module, raising=False)
+
+
+def unknown_model(model):
+    raise KeyError(model)
+
+
+def test_unknown_model_falls_back_to_cl100k(reset_encoding, monkeypatch):
+    encoding = object()
+    fake_tiktoken(monkeypatch, unknown_model, lambda name: encoding if name == "cl100k_base" else None)
+    assert text_chunker.get_token_encoding() is encoding
+
+
+def test_fallback_encoding_failure_uses_estimate(reset_encoding, monkeypatch):
+    def offline(name):
+        raise ConnectionError("no network")
+
+    fake_tiktoken(monkeypatch, unknown_model, offline)
+    assert text_chunker.get_token_encoding() is None
+    assert count_tokens("Một câu ngắn.") > 0
+    # Đã đánh dấu đã tải: không thử tải lại ở mỗi lần đếm
+    assert text_chunker._encoding_loaded
+
+
+def test_model_encoding_failure_uses_estimate(reset_encoding, monkeypatch):
+    def offline(name):
+        raise ConnectionError("no network")
+
+    fake_tiktoken(monkeypatch, offline, offline)
+    assert text_chunker.get_token_encoding() is None
+
+
+def window_tokens(chunk):
+    # Budget của chunker tính theo từng câu (khoảng trắng nối câu không tính)
+    return sum(count_tokens(sentence) for sentence in split_sentences(chunk))
+
+
+def sentences(prefix, count):
+    return ' '.join(f"{prefix} sentence number {i} has a few words." for i in range(count))
+
+
+def test_chunks_respect_max_tokens_and_sentence_boundaries(estimate_tokens):
+    chunks = list(iter_chunks([(1, sentences("Alpha", 30))], max_tokens=40, overlap_tokens=0, min_chars=0))
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert window_tokens(chunk) <= 40
+        assert chunk.endswith('.')
+        assert chunk.page_start == chunk.page_end == 1
+
+
+def test_overlap_repeats_trailing_sentences(estimate_tokens):
+    chunks = list(iter_chunks([(1, sentences("Alpha", 30))], max_tokens=40, overlap_tokens=15, min_chars=0))
+    assert len(chunks) > 1
+    for previous, current in zip(chunks, chunks[1:]):
+        last_sentence = split_sentences(previous)[-1]
+        assert current.startswith(last_sentence)
+        assert window_tokens(current) <= 40
+
+
+def test_long_sentence_is_split_by_words(estimate_tokens):
+    text = ' '.join(f"word{i}" for i in range(200)) + '.'
+    chunks = list(iter_chunks([text], max_tokens=30, overlap_tokens=0, min_chars=0))
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 30 for chunk in chunks)
+    assert all(chunk.page_start is None for chunk in chunks)
+    assert ' '.join(chunks).split() == text.split()
+
+
+def test_chunks_span_pages_unless_page_aligned(estimate_tokens):
+    pages = [(1, sentences("Alpha", 3)), (2, sentences("Beta", 3)), (3, sentences("Gamma", 3))]
+
+    spanning = list(iter_chunks(pages, max_tokens=60, overlap_tokens=0, min_chars=0))
+    assert any(chunk.page_start != chunk.page_end for chunk in spanning)
+
+    aligned = list(iter_chunks(pages, max_tokens=60, overlap_tokens=20, min_chars=0, page_aligned=True))
+    assert {chunk.page_start for chunk in aligned} == {1, 2, 3}
+    for chunk in aligned:
+        assert chunk.page_start == chunk.page_end
+        # Không mang overlap sang trang sau
+        prefix = {1: "Alpha", 2: "Beta", 3: "Gamma"}[chunk.page_start]
+        assert all(sentence.startswith(prefix) for sentence in split_sentences(chunk))
+
+
+def test_page_aligned_chunks_depend_only_on_their_page(estimate_tokens):
+    page_two = (2, sentences("Beta", 8))
+    before = [chunk for chunk in iter_chunks([(1, sentences("Alpha", 5)), page_two], max_tokens=50,
+                                             page_aligned=True, min_chars=0) if chunk.page_start == 2]
+    after = [chunk for chunk in iter_chunks([(1, sentences("Edited", 9)), page_two], max_tokens=50,
+                                            page_aligned=True, min_chars=0) if chunk.page_start == 2]
+    assert before == after
+
+
+def test_error_pages_are_skipped(estimate_tokens):
+    pages = [(1, "[TRANG TRỐNG HOẶC KHÔNG CÓ TEXT]"), (2, sentences("Beta", 2))]
+    chunks = list(iter_chunks(pages, max_tokens=200, min_chars=0, page_aligned=True))
+    assert [chunk.page_start for chunk in chunks] == [2]
+
+    kept = list(iter_chunks(pages, max_tokens=200, min_chars=0, page_aligned=True, skip_errors=False))
+    assert [chunk.page_start for chunk in kept] == [1, 2]
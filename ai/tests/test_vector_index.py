@@ -0,0 +1,93 @@
+"""Test vector index: top-k, FlatIndex nhiều segment, IVFIndex và lưu/nạp index"""
+
+import numpy as np
+import pytest
+
+from embedding_store import normalize_rows
+from vector_index import (top_k_rows, FlatIndex, IVFIndex, create_index, save_index, load_index)
+
+
+def clustered_vectors(clusters=8, per_cluster=40, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = normalize_rows(rng.normal(size=(clusters, dim)))
+    vectors = np.repeat(centers, per_cluster, axis=0) + 0.05 * rng.normal(size=(clusters * per_cluster, dim))
+    return normalize_rows(vectors), centers
+
+
+def brute_force(vectors, queries, top_k):
+    scores = normalize_rows(queries) @ normalize_rows(vectors).T
+    return np.argsort(-scores, axis=1, kind='stable')[:, :top_k]
+
+
+def test_top_k_rows_sorted_per_query():
+    scores = np.array([[0.1, 0.9, 0.5, 0.7], [0.4, 0.2, 0.8, 0.6]], dtype=np.float32)
+    ids, top = top_k_rows(scores, 2)
+    assert ids.tolist() == [[1, 3], [2, 3]]
+    np.testing.assert_allclose(top, [[0.9, 0.7], [0.8, 0.6]])
+    ids, _ = top_k_rows(scores, 10)
+    assert ids.shape == (2, 4)
+
+
+def test_flat_index_across_segments_matches_brute_force():
+    vectors, centers = clustered_vectors()
+    index = FlatIndex(vectors[:100])
+    index.add(vectors[100:250])
+    index.add(vectors[250:])
+    results = index.search(centers, 5)
+    expected = brute_force(vectors, centers, 5)
+    assert [ids.tolist() for ids, _ in results] == expected.tolist()
+    np.testing.assert_allclose(index.get_rows([5, 120, 300]), vectors[[5, 120, 300]], atol=1e-6)
+
+
+def test_ivf_with_all_lists_probed_is_exact():
+    vectors, centers = clustered_vectors()
+    index = IVFIndex(vectors, nlist=8, nprobe=8, min_train=1)
+    assert index.trained
+    results = index.search(centers, 10)
+    assert [set(ids.tolist()) for ids, _ in results] == [set(row) for row in brute_force(vectors, centers, 10).tolist()]
+
+
+def test_ivf_probing_few_lists_keeps_recall_on_clustered_data():
+    vectors, centers = clustered_vectors()
+    index = IVFIndex(vectors, nlist=8, nprobe=2, min_train=1)
+    results = index.search(centers, 10)
+    expected = brute_force(vectors, centers, 10)
+    recall = np.mean([len(set(ids.tolist()) & set(row)) / 10 for (ids, _), row in zip(results, expected.tolist())])
+    assert recall >= 0.9
+
+
+def test_ivf_trains_once_enough_vectors_and_assigns_new_ones():
+    vectors, _ = clustered_vectors()
+    index = IVFIndex(nlist=4, min_train=200)
+    index.add(vectors[:150])
+    assert not index.trained
+    index.add(vectors[150:250])
+    assert index.trained and len(index.assignments) == 250
+    index.add(vectors[250:])
+    assert len(index.assignments) == len(vectors) == len(index)
+
+
+@pytest.mark.parametrize("kind", ["flat", "ivf"])
+def test_save_and_load_index(tmp_path, kind):
+    vectors, centers = clustered_vectors()
+    index = create_index(vectors, kind)
+    if kind == "ivf":
+        index.nlist = 8
+        index.train()
+    prefix = str(tmp_path / "index")
+    save_index(index, prefix)
+
+    loaded = load_index(prefix, vectors)
+    assert type(loaded) is type(index)
+    if kind == "ivf":
+        np.testing.assert_array_equal(loaded.centroids, index.centroids)
+        np.testing.assert_array_equal(loaded.assignments, index.assignments)
+    assert [ids.tolist() for ids, _ in loaded.search(centers, 5)] == [ids.tolist() for ids, _ in index.search(centers, 5)]
+    # Số vectors không khớp (tài liệu đã đổi) -> không dùng index cũ
+    assert load_index(prefix, vectors[:-1]) is None
+    assert load_index(str(tmp_path / "missing"), vectors) is None
+
+
+def test_create_index_rejects_unknown_kind():
+    with pytest.raises(ValueError):
+        create_index(kind="hnsw")
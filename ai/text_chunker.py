@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+✂️ Text Chunker
+Engine chia chunks dùng chung cho chat bot, generator và server:
+- Đếm theo token của model (tiktoken nếu có, không thì ước lượng)
+- Chỉ cắt ở ranh giới câu / trang (câu quá dài mới cắt theo từ)
+- Mỗi chunk mang số trang (page_start, page_end)
+- Regex làm sạch được compile 1 lần
+
+Cùng engine dùng để đóng gói nội dung vào prompt theo token budget thay vì cắt cứng theo ký tự.
+"""
+
+import os
+import re
+import math
+import threading
+
+try:
+    import tiktoken
+    HAS_TIKTOKEN = True
+except ImportError:
+    HAS_TIKTOKEN = False
+
+# Mặc định vừa với giới hạn 256 tokens của all-MiniLM-L6-v2 (phần dư bị model bỏ qua)
+CHUNK_MAX_TOKENS = int(os.getenv('CHUNK_MAX_TOKENS', '256'))
+CHUNK_OVERLAP_TOKENS = int(os.getenv('CHUNK_OVERLAP_TOKENS', '32'))
+CHUNK_MIN_CHARS = 50
+# Ước lượng khi không có tiktoken (cùng hệ số với RateLimiter)
+CHARS_PER_TOKEN = 4
+TOKENIZER_MODEL = os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
+
+# ===== REGEX (compile 1 lần) =====
+PAGE_HEADER_PATTERN = re.compile(r'={50}\nTRANG (\d+)(?: - LỖI)?\n={50}')
+BLANK_LINES_PATTERN = re.compile(r'\n\s*\n\s*\n')
+SPACES_PATTERN = re.compile(r' +')
+ERROR_MARKER_PATTERN = re.compile(
+    r'\[LỖI TRÍCH XUẤT:|\[TRANG TRỐNG HOẶC KHÔNG CÓ TEXT\]|\[TRANG \d+: KHÔNG THỂ TRÍCH XUẤT TEXT\]'
+)
+# Ranh giới câu: sau dấu kết câu, hoặc đoạn trống
+SENTENCE_BOUNDARY_PATTERN = re.compile(r'(?<=[.!?…])\s+|\n\s*\n')
+LINE_BREAK_PATTERN = re.compile(r'\s*\n\s*')
+TOKEN_ESTIMATE_PATTERN = re.compile(r'\w+|[^\w\s]')
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def _load_encoding():
+    """Tải encoding tiktoken (lần đầu tải BPE qua mạng), None nếu không tải được"""
+    try:
+        return tiktoken.encoding_for_model(TOKENIZER_MODEL)
+    except KeyError:
+        # Model chưa có trong bảng của tiktoken: dùng encoding chung
+        pass
+    except Exception as e:
+        print(f"⚠️ Không tải được tokenizer ({e}), dùng ước lượng")
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"⚠️ Không tải được tokenizer cl100k_base ({e}), dùng ước lượng")
+        return None
+
+
+def get_token_encoding():
+    """Encoding tiktoken của model (lazy), None nếu không có tiktoken hoặc không tải được"""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            # Chỉ đánh dấu đã tải sau khi tải xong: thread khác không dùng ước lượng trong lúc chờ
+            if not _encoding_loaded:
+                _encoding = _load_encoding() if HAS_TIKTOKEN else None
+                _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text):
+    """Số tokens của text (ước lượng theo từ/ký tự nếu không có tiktoken)"""
+    if not text:
+        return 0
+    encoding = get_token_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return max(len(TOKEN_ESTIMATE_PATTERN.findall(text)), math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+class Chunk(str):
+    """Text của chunk (dùng như str) kèm khoảng trang 1-based, None nếu không rõ"""
+
+    def __new__(cls, text, page_start=None, page_end=None):
+        chunk = super().__new__(cls, text)
+        chunk.page_start = page_start
+        chunk.page_end = page_end if page_end is not None else page_start
+        return chunk
+
+    @property
+    def pages(self):
+        if self.page_start is None:
+            return None
+        if self.page_start == self.page_end:
+            return str(self.page_start)
+        return f"{self.page_start}-{self.page_end}"
+
+    def __reduce__(self):
+        return (Chunk, (str(self), self.page_start, self.page_end))
+
+
+# ===== LÀM SẠCH =====
+def clean_page_text(segment):
+    """Làm sạch 1 trang: bỏ header trang, dòng trống liên tiếp và khoảng trắng thừa"""
+    text = PAGE_HEADER_PATTERN.sub('', segment)
+    text = BLANK_LINES_PATTERN.sub('\n\n', text)
+    text = SPACES_PATTERN.sub(' ', text)
+    return text.strip()
+
+
+def is_error_text(text):
+    """Text có chứa marker lỗi/trang trống của pdfToText"""
+    return ERROR_MARKER_PATTERN.search(text) is not None
+
+
+def split_pages(text):
+    """Tách nội dung có header "TRANG n" (output của pdfToText) thành [(page_num, text)]
+
+    Text không có header -> 1 phần với page_num None.
+    """
+    parts = PAGE_HEADER_PATTERN.split(text)
+    pages = []
+    if parts[0].strip():
+        pages.append((None, parts[0]))
+    for i in range(1, len(parts) - 1, 2):
+        pages.append((int(parts[i]), parts[i + 1]))
+    return pages
+
+
+def split_sentences(text):
+    """Các câu của 1 đoạn text (xuống dòng giữa câu được gộp thành khoảng trắng)"""
+    sentences = []
+    for sentence in SENTENCE_BOUNDARY_PATTERN.split(text):
+        sentence = LINE_BREAK_PATTERN.sub(' ', sentence).strip()
+        if sentence:
+            sentences.append(sentence)
+    return sentences
+
+
+def _split_long_sentence(sentence, max_tokens):
+    """Câu dài hơn max_tokens: cắt theo từ thành các phần <= max_tokens"""
+    pieces = []
+    words = []
+    tokens = 0
+    for word in sentence.split():
+        word_tokens = count_tokens(" " + word)
+        if words and tokens + word_tokens > max_tokens:
+            pieces.append((' '.join(words), tokens))
+            words, tokens = [], 0
+        words.append(word)
+        tokens += word_tokens
+    if words:
+        pieces.append((' '.join(words), tokens))
+    return pieces
+
+
+# ===== CHUNKING =====
+def iter_chunks(pages, max_tokens=None, overlap_tokens=None, min_chars=CHUNK_MIN_CHARS, skip_errors=True,
+                page_aligned=False):
+    """
+    Chia stream trang thành chunks <= max_tokens, chỉ cắt ở ranh giới câu/trang
+
+    Args:
+        pages: iterable (page_num, text) hoặc text (page_num = None); text đã làm sạch
+        overlap_tokens: số tokens (các câu cuối) lặp lại ở đầu chunk sau
+        skip_errors: bỏ chunks chứa marker lỗi/trang trống
+        page_aligned: không cho chunk vắt qua 2 trang (chunks của 1 trang chỉ phụ thuộc trang đó,
+            dùng cho xử lý lại theo trang)
+
+    Yields:
+        Chunk (str kèm page_start/page_end)
+    """
+    max_tokens = max_tokens or CHUNK_MAX_TOKENS
+    overlap_tokens = CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+
+    window = []  # [(sentence, tokens, page_num)]
+    window_tokens = 0
+    has_new_content = False
+
+    def make_chunk():
+        text = ' '.join(sentence for sentence, _, _ in window)
+        if len(text) <= min_chars or (skip_errors and is_error_text(text)):
+            return None
+        page_nums = [page for _, _, page in window if page is not None]
+        if not page_nums:
+            return Chunk(text)
+        return Chunk(text, min(page_nums), max(page_nums))
+
+    for page in pages:
+        page_num, text = (None, page) if isinstance(page, str) else page
+        if page_aligned and window:
+            if has_new_content:
+                chunk = make_chunk()
+                if chunk is not None:
+                    yield chunk
+            window, window_tokens, has_new_content = [], 0, False
+        for sentence in split_sentences(text):
+            sentence_tokens = count_tokens(sentence)
+            parts = ([(sentence, sentence_tokens)] if sentence_tokens <= max_tokens
+                     else _split_long_sentence(sentence, max_tokens))
+
+            for part, part_tokens in parts:
+                if window and window_tokens + part_tokens > max_tokens:
+                    chunk = make_chunk()
+                    if chunk is not None:
+                        yield chunk
+                    # Giữ lại các câu cuối làm overlap (vẫn chừa chỗ cho câu mới)
+                    budget = min(overlap_tokens, max_tokens - part_tokens)
+                    while window and window_tokens > budget:
+                        window_tokens -= window.pop(0)[1]
+                    has_new_content = False
+                window.append((part, part_tokens, page_num))
+                window_tokens += part_tokens
+                has_new_content = True
+
+    if window and has_new_content:
+        chunk = make_chunk()
+        if chunk is not None:
+            yield chunk
+
+
+def chunk_text(text, max_tokens=None, overlap_tokens=None, min_chars=CHUNK_MIN_CHARS):
+    """Chia toàn bộ nội dung (có thể chứa header "TRANG n") thành list Chunk"""
+    pages = ((page_num, clean_page_text(page_text)) for page_num, page_text in split_pages(text))
+    return list(iter_chunks(pages, max_tokens, overlap_tokens, min_chars))
+
+
+# ===== TOKEN BUDGET CHO PROMPT =====
+def fit_to_token_budget(text, max_tokens):
+    """Phần đầu của text nằm trong max_tokens, cắt ở ranh giới câu cuối cùng vừa budget
+
+    Giữ nguyên định dạng gốc (xuống dòng, JSON mẫu...) của phần được giữ lại.
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    cut = 0
+    used = 0
+    for match in SENTENCE_BOUNDARY_PATTERN.finditer(text):
+        segment_tokens = count_tokens(text[cut:match.end()])
+        if used + segment_tokens > max_tokens:
+            break
+        used += segment_tokens
+        cut = match.end()
+
+    if cut == 0:
+        # Câu đầu tiên đã vượt budget: cắt theo từ
+        return ' '.join(part for part, _ in _split_long_sentence(text, max_tokens)[:1])
+    return text[:cut].rstrip()
+
+
+def pack_count(texts, max_tokens, separator="\n\n"):
+    """Số đoạn đầu tiên của texts vừa budget khi ghép (ít nhất 1 nếu có text - đoạn đó sẽ bị cắt)"""
+    used = 0
+    separator_tokens = count_tokens(separator)
+    for count, text in enumerate(texts):
+        text_tokens = count_tokens(text) + (separator_tokens if count else 0)
+        if used + text_tokens > max_tokens:
+            return max(count, 1)
+        used += text_tokens
+    return len(texts)
+
+
+def pack_texts(texts, max_tokens, separator="\n\n"):
+    """Ghép các đoạn text theo thứ tự cho đến khi hết budget (không cắt giữa đoạn nếu còn đoạn vừa)"""
+    count = pack_count(texts, max_tokens, separator)
+    if count == 1 and texts:
+        return fit_to_token_budget(texts[0], max_tokens)
+    return separator.join(texts[:count])
+
+
+def chunk_page_numbers(chunks):
+    """Các trang (1-based, tăng dần) mà các chunks nằm trên"""
+    pages = set()
+    for chunk in chunks:
+        page_start = getattr(chunk, 'page_start', None)
+        if page_start is not None:
+            pages.update(range(page_start, chunk.page_end + 1))
+    return sorted(pages)
+
+
+def prefix_page_numbers(text, max_tokens):
+    """Các trang mà phần đầu max_tokens (sau làm sạch) của nội dung có header "TRANG n" nằm trên"""
+    pages = []
+    used = 0
+    for page_num, page_text in split_pages(text):
+        page_tokens = count_tokens(clean_page_text(page_text))
+        if page_num is not None and page_tokens:
+            pages.append(page_num)
+        used += page_tokens
+        if used >= max_tokens:
+            break
+    return pages
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+🔎 Vector Index
+Tìm top-k chunks theo cosine similarity, thay cho argsort toàn bộ ma trận:
+- FlatIndex: brute force chính xác, top-k bằng argpartition
+- IVFIndex: ANN kiểu IVF (k-means NumPy), chỉ score các cụm gần query nhất
+
+Cả hai nhận ma trận float32 / float16 / int8 (QuantizedMatrix) từ embedding_store,
+thêm vector theo từng segment (không copy ma trận cũ) và lưu được cạnh embedding cache.
+"""
+
+import os
+import json
+
+import numpy as np
+
+from embedding_store import QuantizedMatrix, normalize_rows, similarity_scores
+
+# flat | ivf
+VECTOR_INDEX_KIND = os.getenv('VECTOR_INDEX', 'flat').lower()
+IVF_NPROBE = int(os.getenv('IVF_NPROBE', '8'))
+# Dưới ngưỡng này IVF chạy như flat (chưa đáng train)
+IVF_MIN_TRAIN = int(os.getenv('IVF_MIN_TRAIN', '2048'))
+IVF_KMEANS_ITERATIONS = 10
+
+
+def top_k_indices(scores, top_k):
+    """Chỉ số top-k (giảm dần) của 1 dãy scores bằng argpartition"""
+    top_k = min(top_k, len(scores))
+    if top_k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if top_k < len(scores):
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def top_k_rows(scores, top_k):
+    """Top-k của từng dòng ma trận scores (n_queries, n) trong 1 lần argpartition
+
+    Returns:
+        (ids, scores): 2 mảng (n_queries, k), mỗi dòng giảm dần
+    """
+    scores = np.asarray(scores)
+    top_k = max(min(top_k, scores.shape[1]), 0)
+    if top_k == 0:
+        return np.zeros((len(scores), 0), dtype=np.int64), np.zeros((len(scores), 0), dtype=scores.dtype)
+    if top_k < scores.shape[1]:
+        candidates = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+    else:
+        candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+
+def spherical_kmeans(vectors, k, rng=None, iterations=IVF_KMEANS_ITERATIONS):
+    """K-means theo cosine trên vectors (float32), trả về centroids (k, dim) đã chuẩn hóa"""
+    rng = rng or np.random.default_rng(0)
+    vectors = normalize_rows(vectors)
+    k = min(k, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)]
+    for _ in range(iterations):
+        labels = np.argmax(vectors @ centroids.T, axis=1)
+        for cluster in range(k):
+            members = vectors[labels == cluster]
+            if len(members):
+                centroids[cluster] = members.mean(axis=0)
+        centroids = normalize_rows(centroids)
+    return centroids.astype(np.float32)
+
+
+def assign_clusters(vectors, centroids, block_rows=8192):
+    """Cụm gần nhất (cosine) của từng vector, tính theo block"""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), block_rows):
+        block = normalize_rows(vectors[start:start + block_rows])
+        labels[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def take_rows(matrix, rows):
+    """Lấy các dòng `rows` của ma trận (giữ nguyên dạng lượng tử hóa)"""
+    if isinstance(matrix, QuantizedMatrix):
+        return QuantizedMatrix(matrix.values[rows], matrix.scales[rows])
+    return matrix[rows]
+
+
+def as_float32(matrix):
+    if isinstance(matrix, QuantizedMatrix):
+        return matrix.to_float32()
+    return np.asarray(matrix, dtype=np.float32)
+
+
+class FlatIndex:
+    """Brute force chính xác trên các segment embeddings"""
+
+    kind = "flat"
+
+    def __init__(self, vectors=None):
+        self.segments = []
+        self.offsets = [0]
+        if vectors is not None and len(vectors):
+            self.add(vectors)
+
+    def __len__(self):
+        return self.offsets[-1]
+
+    def add(self, vectors):
+        """Thêm vectors (id nối tiếp), trả về mảng id mới"""
+        if isinstance(vectors, list):
+            vectors = np.asarray(vectors, dtype=np.float32)
+        start = len(self)
+        if len(vectors):
+            self.segments.append(vectors)
+            self.offsets.append(start + len(vectors))
+        return np.arange(start, len(self))
+
+    def score_all(self, queries):
+        """Cosine scores (n_queries, len(index)) qua toàn bộ segments"""
+        queries = normalize_rows(queries)
+        if not self.segments:
+            return np.zeros((len(queries), 0), dtype=np.float32)
+        return np.hstack([similarity_scores(segment, queries) for segment in self.segments])
+
+    def search(self, queries, top_k):
+        """Top-k cho từng query: 1 phép nhân ma trận cho cả batch queries
+
+        Returns:
+            list[(ids, scores)] theo thứ tự queries, scores giảm dần
+        """
+        ids, scores = top_k_rows(self.score_all(queries), top_k)
+        return list(zip(ids, scores))
+
+    def get_rows(self, ids):
+        """Vectors (float32) theo id toàn cục"""
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(self.segments) == 1:
+            return as_float32(take_rows(self.segments[0], ids))
+        out = np.zeros((len(ids), self.dim), dtype=np.float32)
+        segment_of = np.searchsorted(self.offsets, ids, side='right') - 1
+        for segment_index in np.unique(segment_of):
+            mask = segment_of == segment_index
+            local = ids[mask] - self.offsets[segment_index]
+            out[mask] = as_float32(take_rows(self.segments[segment_index], local))
+        return out
+
+    @property
+    def dim(self):
+        return self.segments[0].shape[1] if self.segments else 0
+
+    def state(self):
+        return {}
+
+    def load_state(self, meta, arrays):
+        pass
+
+
+class IVFIndex(FlatIndex):
+    """Inverted-file index: vectors được chia theo cụm k-means, query chỉ quét nprobe cụm gần nhất"""
+
+    kind = "ivf"
+
+    def __init__(self, vectors=None, nlist=None, nprobe=None, min_train=None):
+        self.nlist = nlist
+        self.nprobe = nprobe or IVF_NPROBE
+        self.min_train = min_train or IVF_MIN_TRAIN
+        self.centroids = None
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self._lists = None
+        super().__init__(vectors)
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def add(self, vectors):
+        ids = super().add(vectors)
+        if self.trained:
+            self.assignments = np.concatenate([self.assignments, self._assign(as_float32(vectors))])
+            self._lists = None
+        elif len(self) >= self.min_train:
+            self.train()
+        return ids
+
+    def train(self, seed=0):
+        """Spherical k-means trên (mẫu của) toàn bộ vectors rồi gán cụm cho từng vector"""
+        rng = np.random.default_rng(seed)
+        nlist = self.nlist or max(1, int(np.sqrt(len(self))))
+        nlist = min(nlist, len(self))
+
+        sample_size = min(len(self), nlist * 64)
+        sample_ids = np.sort(rng.choice(len(self), size=sample_size, replace=False))
+
+        self.nlist = nlist
+        self.centroids = spherical_kmeans(self.get_rows(sample_ids), nlist, rng)
+        self.assignments = np.concatenate([
+            self._assign(as_float32(segment)) for segment in self.segments
+        ])
+        self._lists = None
+
+    def _assign(self, vectors):
+        return assign_clusters(vectors, self.centroids)
+
+    def _inverted_lists(self):
+        if self._lists is None:
+            order = np.argsort(self.assignments, kind='stable')
+            bounds = np.searchsorted(self.assignments[order], np.arange(self.nlist + 1))
+            self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(self.nlist)]
+        return self._lists
+
+    def search(self, queries, top_k):
+        if not self.trained:
+            return super().search(queries, top_k)
+
+        queries = normalize_rows(queries)
+        lists = self._inverted_lists()
+        nprobe = min(self.nprobe, self.nlist)
+        probe_lists = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :nprobe]
+
+        results = []
+        for query, probes in zip(queries, probe_lists):
+            candidates = np.sort(np.concatenate([lists[i] for i in probes]))
+            if not len(candidates):
+                results.append((np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)))
+                continue
+            scores = normalize_rows(self.get_rows(candidates)) @ query
+            top = top_k_indices(scores, top_k)
+            results.append((candidates[top], scores[top]))
+        return results
+
+    def state(self):
+        if not self.trained:
+            return {}
+        return {'centroids': self.centroids, 'assignments': self.assignments}
+
+    def load_state(self, meta, arrays):
+        self.nprobe = meta.get('nprobe', self.nprobe)
+        if 'centroids' in arrays:
+            self.centroids = arrays['centroids']
+            self.assignments = arrays['assignments']
+            self.nlist = len(self.centroids)
+
+
+INDEX_TYPES = {FlatIndex.kind: FlatIndex, IVFIndex.kind: IVFIndex}
+
+
+def create_index(vectors=None, kind=None):
+    """Tạo index theo loại (mặc định: VECTOR_INDEX)"""
+    kind = (kind or VECTOR_INDEX_KIND).lower()
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Loại index không hợp lệ: {kind} (hỗ trợ: {', '.join(INDEX_TYPES)})")
+    return INDEX_TYPES[kind](vectors)
+
+
+def save_index(index, prefix):
+    """Lưu cấu trúc index (không lưu lại vectors - vectors nằm trong embedding store)
+
+    Files: `<prefix>.json` (meta) và `<prefix>.npz` (centroids/assignments nếu có)
+    """
+    meta = {'kind': index.kind, 'count': len(index)}
+    if isinstance(index, IVFIndex):
+        meta.update({'nlist': index.nlist, 'nprobe': index.nprobe})
+
+    arrays = index.state()
+    npz_path = prefix + ".npz"
+    if arrays:
+        tmp_path = prefix + ".tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, npz_path)
+    elif os.path.exists(npz_path):
+        os.remove(npz_path)
+
+    tmp_meta = prefix + ".json.tmp"
+    with open(tmp_meta, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(tmp_meta, prefix + ".json")
+
+
+def load_index(prefix, vectors):
+    """Dựng lại index trên `vectors` từ file đã lưu, None nếu không có/không khớp"""
+    meta_path = prefix + ".json"
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta.get('count') != len(vectors) or meta.get('kind') not in INDEX_TYPES:
+        return None
+
+    index = INDEX_TYPES[meta['kind']]()
+    FlatIndex.add(index, vectors)
+    arrays = {}
+    if os.path.exists(prefix + ".npz"):
+        with np.load(prefix + ".npz") as data:
+            arrays = {key: data[key] for key in data.files}
+    index.load_state(meta, arrays)
+    return index